@@ -0,0 +1,217 @@
+# End-to-end benchmark of the download -> extract -> cleanup path against the local stand-in server.
+# Synthetic 2013, 2018 and 2022 tiles (see standin.py) are served under a set of network scenarios
+# (a fast link, saved ZIP files instead of streaming, a slow link with latency, and dropped connections
+# while streaming and while saving, with and without Range support), and every scenario is downloaded
+# by vanlidar.Downloader in a fresh process so its peak memory is its own. For each scenario the throughput, the time to the first
+# finished tile, the peak RSS of the downloader and of its extraction processes, the disk high-water
+# mark of the output folder and the server's request counts are reported, and written to a JSON file.
+#     python benchmarks/bench_pipeline.py --tiles 9 --size 16 --output results.json
+#     python benchmarks/bench_pipeline.py --scenario drops --scenario drops-no-ranges --jobs 4
+import argparse  # Import the argparse module for the command line options
+import json  # Import the json module for the results
+import os  # Import the os module for file operations
+import platform  # Import the platform module to describe the machine in the results
+import resource  # Import the resource module for the peak memory of the processes
+import socket  # Import the socket module to find a free port
+import subprocess  # Import the subprocess module to run the server and the scenarios
+import sys  # Import the sys module for the interpreter path
+import tempfile  # Import the tempfile module for the served files and the downloads
+import threading  # Import the threading module for the disk sampler
+import time  # Import the time module for the timings
+import urllib.request  # Import urllib to read the server's statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Use the vanlidar package of this checkout
+
+from vanlidar.downloader import Downloader  # Downloader under test
+from vanlidar.scheduler import RetryPolicy  # Retry policy with a shorter backoff for the benchmark
+
+MEGABYTE = 1024 * 1024
+
+# Seconds between two measurements of the output folder's size
+DISK_SAMPLE_INTERVAL = 0.02
+
+# Network scenarios: server options (see standin.py) and Downloader options
+SCENARIOS = {
+    'stream': ({}, {}),
+    'saved': ({}, {'streaming': False}),
+    'slow-link': ({'latency': 0.05, 'bandwidth': 8}, {}),
+    'drops-stream': ({'drop_rate': 0.2}, {}),
+    'drops': ({'drop_rate': 0.2}, {'streaming': False}),
+    'drops-no-ranges': ({'drop_rate': 0.2, 'ranges': False}, {'streaming': False}),
+}
+
+
+# Sum the space allocated to the files under directory (preallocated space included)
+def disk_usage(directory):
+    total = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            try:
+                stat = os.stat(os.path.join(root, name))
+            except OSError:  # Renamed or removed while walking
+                continue
+            total += getattr(stat, 'st_blocks', 0) * 512 or stat.st_size
+    return total
+
+
+# Thread recording the largest size of a folder while a scenario runs
+class DiskSampler(threading.Thread):
+    def __init__(self, directory):
+        super().__init__(name='disk-sampler', daemon=True)
+        self.directory = directory  # Folder being measured
+        self.peak = 0  # Largest size seen, in bytes
+        self.stopped = threading.Event()  # Set to end the sampling
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.peak = max(self.peak, disk_usage(self.directory))
+            self.stopped.wait(DISK_SAMPLE_INTERVAL)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.peak = max(self.peak, disk_usage(self.directory))
+
+
+# Run one scenario in this process and return its measurements; called in a child process by main
+def run_scenario(config):
+    options = dict(config['downloader'])
+    downloader = Downloader(output_dir=config['output_dir'], data_dir=config['data_dir'], echo=None, jobs=config['jobs'],
+                            extract_jobs=config['extract_jobs'], retries=config['retries'], **options)
+    downloader.retry = RetryPolicy(config['retries'], base=config['backoff'])  # Keep the backoff from dominating the timings
+    first_tile = None  # perf_counter() of the first recorded tile
+    received = 0  # Bytes received over every attempt that finished a tile
+    lock = threading.Lock()
+    record_tile = downloader.record_tile
+
+    def timed_record(run, url, transfer, members):  # Called on whichever thread finished the tile
+        nonlocal first_tile, received
+        with lock:
+            first_tile = first_tile or time.perf_counter()
+            received += transfer['received'] or 0
+        record_tile(run, url, transfer, members)
+
+    downloader.record_tile = timed_record
+    sampler = DiskSampler(config['output_dir'])
+    try:
+        started = time.perf_counter()
+        runs = downloader.prepare(config['years'])
+        prepared = time.perf_counter()
+        sampler.start()
+        downloader.download(runs, progress=False)
+        finished = time.perf_counter()
+    finally:
+        downloader.close()  # Also reaps the extraction processes, so their peak RSS is counted below
+        if sampler.is_alive():
+            sampler.stop()
+    own, children = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    leftovers = [name for _, _, files in os.walk(config['output_dir']) for name in files if name.endswith(('.zip', '.part'))]
+    seconds = finished - prepared
+    return {
+        'tiles': sum(run.downloaded_count for run in runs),
+        'files': sum(sum(run.uncompressed_count.values()) for run in runs),
+        'failed': sum(len(run.failures) for run in runs),
+        'retried': sum(run.retried_count for run in runs),
+        'received_mb': round(received / MEGABYTE, 2),
+        'prepare_seconds': round(prepared - started, 3),
+        'seconds': round(seconds, 3),
+        'throughput_mb_s': round(received / MEGABYTE / max(seconds, 1e-9), 2),
+        'time_to_first_tile': round(first_tile - prepared, 3) if first_tile else None,
+        'cpu_seconds': round(own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime, 3),
+        'peak_rss_mb': round(own.ru_maxrss / 1024, 1),  # ru_maxrss is in kilobytes on Linux
+        'peak_child_rss_mb': round(children.ru_maxrss / 1024, 1),
+        'disk_high_water_mb': round(sampler.peak / MEGABYTE, 2),
+        'leftover_files': len(leftovers),  # ZIP and partial files the cleanup missed
+    }
+
+
+# Start standin.py on a free port with the given server options and wait until it answers
+def start_server(directory, options):
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'standin.py'), '--directory', directory, '--port', str(port), '--seed', '1']
+    for option in ('latency', 'bandwidth', 'total_bandwidth', 'drop_rate'):
+        if options.get(option):
+            command += ['--' + option.replace('_', '-'), str(options[option])]
+    if not options.get('ranges', True):
+        command.append('--no-ranges')
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            return server, port
+        except OSError:
+            time.sleep(0.05)
+    server.kill()
+    raise RuntimeError("The stand-in server did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the download, extraction and cleanup of synthetic tiles under several network scenarios.")
+    parser.add_argument('--tiles', type=int, default=9, help="synthetic tiles of every year (default: 9)")
+    parser.add_argument('--size', type=float, default=16, help="size of each synthetic LAS file in MB (default: 16)")
+    parser.add_argument('--years', type=int, nargs='+', default=[2013, 2018, 2022], help="years to serve (default: all three)")
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help="scenario to run; repeat for several (default: all)")
+    parser.add_argument('--jobs', type=int, default=8, help="download threads (default: 8)")
+    parser.add_argument('--extract-jobs', type=int, default=2, help="extraction processes (default: 2)")
+    parser.add_argument('--retries', type=int, default=10, help="retries of a failed tile (default: 10)")
+    parser.add_argument('--backoff', type=float, default=0.25, help="base of the retry backoff in seconds (default: 0.25)")
+    parser.add_argument('--output', default='bench_pipeline.json', help="JSON file the results are written to (default: bench_pipeline.json)")
+    parser.add_argument('--run-scenario', help=argparse.SUPPRESS)  # Internal: run one scenario from a JSON file and print its results
+    args = parser.parse_args()
+
+    if args.run_scenario:
+        with open(args.run_scenario, 'r', encoding='utf-8') as file:
+            print(json.dumps(run_scenario(json.load(file))))
+        return
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from standin import make_dataset, write_catalogues  # Synthetic tiles and their catalogues
+
+    results = {'machine': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+               'dataset': {'tiles_per_year': args.tiles, 'las_mb': args.size, 'years': args.years},
+               'settings': {'jobs': args.jobs, 'extract_jobs': args.extract_jobs, 'retries': args.retries, 'backoff': args.backoff},
+               'scenarios': {}}
+    with tempfile.TemporaryDirectory() as directory:
+        served = os.path.join(directory, 'served')
+        started = time.perf_counter()
+        tiles = make_dataset(served, args.tiles, int(args.size * MEGABYTE), args.years)
+        served_mb = sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(served) for name in files) / MEGABYTE
+        results['dataset']['served_mb'] = round(served_mb, 2)
+        print(f"Generated {served_mb:.1f} MB of tiles in {time.perf_counter() - started:.1f} s")
+        print(f"{'scenario':16s} {'MB/s':>8s} {'first tile':>10s} {'RSS MB':>8s} {'child RSS':>9s} {'disk MB':>8s} {'retried':>7s} {'failed':>6s}")
+        for name in args.scenario or list(SCENARIOS):
+            server_options, downloader_options = SCENARIOS[name]
+            server, port = start_server(served, server_options)
+            try:
+                data_dir = os.path.join(directory, 'catalogues')
+                write_catalogues(data_dir, tiles, f'http://127.0.0.1:{port}')
+                config = {'output_dir': os.path.join(directory, 'output', name), 'data_dir': data_dir, 'years': args.years, 'jobs': args.jobs,
+                          'extract_jobs': args.extract_jobs, 'retries': args.retries, 'backoff': args.backoff, 'downloader': downloader_options}
+                config_path = os.path.join(directory, f'{name}.json')
+                with open(config_path, 'w', encoding='utf-8') as file:
+                    json.dump(config, file)
+                child = subprocess.run([sys.executable, os.path.abspath(__file__), '--run-scenario', config_path], capture_output=True, text=True)
+                if child.returncode:
+                    raise RuntimeError(f"Scenario {name} failed:\n{child.stderr}")
+                result = json.loads(child.stdout.strip().splitlines()[-1])
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/_stats') as response:
+                    result['server'] = json.load(response)
+            finally:
+                server.kill()
+                server.wait()
+            result['server_options'] = server_options
+            result['downloader_options'] = downloader_options
+            results['scenarios'][name] = result
+            first_tile = f"{result['time_to_first_tile']:.2f} s" if result['time_to_first_tile'] is not None else '-'
+            print(f"{name:16s} {result['throughput_mb_s']:8.1f} {first_tile:>10s} {result['peak_rss_mb']:8.1f} {result['peak_child_rss_mb']:9.1f} "
+                  f"{result['disk_high_water_mb']:8.1f} {result['retried']:7d} {result['failed']:6d}")
+
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
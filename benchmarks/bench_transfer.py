@@ -0,0 +1,86 @@
+# Benchmark of the download loop against a local HTTP server.
+# Compares the old fixed 1 KB iter_content loop with the adaptive ResponseStream path used by
+# download_resumable, and reports wall-clock MB/s and MB per CPU-second of the downloading process
+# (the server runs in a separate process so it does not count towards the client's CPU time).
+#     python benchmarks/bench_transfer.py --size 256 --repeat 3
+import argparse  # Import the argparse module for the command line options
+import os  # Import the os module for file operations
+import socket  # Import the socket module to find a free port
+import subprocess  # Import the subprocess module to run the HTTP server
+import sys  # Import the sys module for the interpreter path
+import tempfile  # Import the tempfile module for the served file and the downloads
+import time  # Import the time module for the timings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Use the vanlidar package of this checkout
+
+from vanlidar.engine import DownloadEngine  # Shared download engine
+from vanlidar.transfer import download_resumable  # Tuned transfer path
+
+MEGABYTE = 1024 * 1024
+
+
+# The download loop as it was before the tuning: 1 KB blocks from iter_content
+def fixed_blocks(engine, url, path):
+    with engine.get(url) as response, open(path, 'wb') as file:
+        for data in response.iter_content(1024):
+            file.write(data)
+
+
+# The tuned path: adaptive chunks and a preallocated file
+def adaptive(engine, url, path):
+    download_resumable(engine, url, path)
+
+
+# Start python -m http.server on a free port and wait until it answers
+def start_server(directory):
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    server = subprocess.Popen([sys.executable, '-m', 'http.server', str(port), '--bind', '127.0.0.1', '--directory', directory],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            return server, port
+        except OSError:
+            time.sleep(0.05)
+    server.kill()
+    raise RuntimeError("The local HTTP server did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the download loop before and after the chunk size tuning.")
+    parser.add_argument('--size', type=int, default=256, help="size of the served file in MB (default: 256)")
+    parser.add_argument('--repeat', type=int, default=3, help="runs of each variant; the best is reported (default: 3)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        served = os.path.join(directory, 'tile.zip')
+        with open(served, 'wb') as file:
+            for _ in range(args.size):
+                file.write(os.urandom(MEGABYTE))
+        server, port = start_server(directory)
+        url = f'http://127.0.0.1:{port}/tile.zip'
+        target = os.path.join(directory, 'download.zip')
+        engine = DownloadEngine(max_workers=1)
+        try:
+            for label, function in (('before (1 KB iter_content)', fixed_blocks), ('after (adaptive chunks)', adaptive)):
+                best_wall, best_cpu = None, None
+                for _ in range(args.repeat):
+                    wall, cpu = time.perf_counter(), time.process_time()
+                    function(engine, url, target)
+                    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+                    if os.path.getsize(target) != args.size * MEGABYTE:
+                        raise RuntimeError(f"{label}: downloaded {os.path.getsize(target)} bytes")
+                    os.remove(target)
+                    best_wall = wall if best_wall is None else min(best_wall, wall)
+                    best_cpu = cpu if best_cpu is None else min(best_cpu, cpu)
+                print(f"{label:28s} {args.size / best_wall:8.1f} MB/s  {args.size / max(best_cpu, 1e-9):8.1f} MB per CPU-second")
+        finally:
+            engine.close()
+            server.kill()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
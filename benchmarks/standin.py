@@ -0,0 +1,362 @@
+# Local stand-in for the City's tile server, used by bench_pipeline.py.
+# make_dataset() writes synthetic tile ZIP files shaped like the real ones of each year (2013: a LAS
+# file per LiDAR ZIP and a GeoTIFF with its world file per GeoTIFF ZIP; 2018: a LAS file and its .prj;
+# 2022: a LAS 1.4 file and its .lasx index) and write_catalogues() the lidar-20xx.csv files pointing at
+# them. The server sends ETag, Last-Modified and Accept-Ranges like the real one, and can be slowed down
+# (latency, bandwidth caps), made to drop connections part-way through a body, or have Range support
+# switched off. GET /_stats returns what it has served as JSON. Run it on its own with
+#     python benchmarks/standin.py --generate 8 --size 16 --directory /tmp/tiles --port 8800 --latency 0.05 --drop-rate 0.1
+import argparse  # Import the argparse module for the command line options
+import json  # Import the json module for the catalogue footprints and the statistics
+import math  # Import the math module to snap the GeoTIFF origins to the pixel grid
+import os  # Import the os module for file operations
+import random  # Import the random module for the synthetic data and the dropped connections
+import re  # Import the re module for parsing Range headers
+import socket  # Import the socket module to cut connections
+import struct  # Import the struct module for the LAS and TIFF headers
+import sys  # Import the sys module for the interpreter path
+import threading  # Import the threading module for the statistics lock
+import time  # Import the time module for the latency
+import zipfile  # Import the zipfile module to write the tile ZIP files
+from email.utils import formatdate  # Import formatdate for the Last-Modified header
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # Import the standard library HTTP server
+from urllib.parse import unquote, urlsplit  # Import the URL helpers for the request paths
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Use the vanlidar package of this checkout
+
+from vanlidar.scheduler import RateLimiter  # Token bucket for the bandwidth caps
+from vanlidar.spatial import lonlat_to_utm  # Projection of the footprints, for the LAS bounds
+
+MEGABYTE = 1024 * 1024
+
+# Bytes sent to a client at a time
+SEND_BLOCK_SIZE = 64 * 1024
+
+# Point records generated at a time and repeated through a LAS file
+POINTS_PER_BLOCK = 4096
+
+# South-west corner (longitude, latitude) of the synthetic tile grid, and the size of a tile in degrees (about 1 km)
+GRID_ORIGIN = (-123.22, 49.20)
+TILE_DEGREES = (0.01375, 0.009)
+
+# Side of the synthetic 2013 GeoTIFF tiles in pixels (RGB, 8 bits per sample)
+GEOTIFF_PIXELS = 1000
+
+# Pixel size of the synthetic 2013 GeoTIFF tiles in metres. Every tile starts on a multiple of it,
+# so all the tiles share one pixel grid and fit in one mosaic.
+GEOTIFF_PIXEL_SIZE = 1.0
+
+# Projection file of the 2018 tiles
+PRJ_TEXT = ('PROJCS["NAD_1983_UTM_Zone_10N",GEOGCS["GCS_North_American_1983",DATUM["D_North_American_1983",'
+            'SPHEROID["GRS_1980",6378137.0,298.257222101]],PRIMEM["Greenwich",0.0],UNIT["Degree",0.0174532925199433]],'
+            'PROJECTION["Transverse_Mercator"],PARAMETER["False_Easting",500000.0],PARAMETER["False_Northing",0.0],'
+            'PARAMETER["Central_Meridian",-123.0],PARAMETER["Scale_Factor",0.9996],PARAMETER["Latitude_Of_Origin",0.0],UNIT["Meter",1.0]]')
+
+# Point format and LAS minor version of each year, as in the real tiles
+LAS_LAYOUT = {2013: (1, 2), 2018: (1, 2), 2022: (6, 4)}
+
+# Record layout of the point formats used: X, Y, Z, intensity, return bits, then the format's own fields
+POINT_RECORDS = {1: struct.Struct('<iiiHBBbBHd'), 6: struct.Struct('<iiiHBBBBhHd')}
+
+# Public header block of LAS 1.2, and the fields LAS 1.4 adds after it
+LAS_HEADER = struct.Struct('<4sHH16sBB32s32sHHHIIBHI5I3d3d6d')
+LAS14_FIELDS = struct.Struct('<QQIQ15Q')
+
+# A "bytes=start-end" Range header, or "bytes=-length" for the end of the file
+BYTE_RANGE = re.compile(r'bytes=(\d*)-(\d*)$')
+
+
+# Return the LAS public header block of a file with count points of the given format inside bounds (UTM metres)
+def las_header(point_format, minor, count, bounds, min_z=0.0, max_z=120.0):
+    header_size = 375 if minor >= 4 else 227
+    record_length = POINT_RECORDS[point_format].size
+    min_x, min_y, max_x, max_y = bounds
+    legacy_count = 0 if point_format >= 6 else count  # LAS 1.4 formats only use the 64-bit count
+    header = LAS_HEADER.pack(b'LASF', 0, 0x11 if minor >= 4 else 0, bytes(16), 1, minor, b'vanlidar stand-in', b'bench_pipeline', 1, 2024,
+                             header_size, header_size, 0, point_format, record_length, legacy_count, legacy_count, 0, 0, 0, 0,
+                             0.01, 0.01, 0.01, min_x, min_y, 0.0, max_x, min_x, max_y, min_y, max_z, min_z)
+    if minor >= 4:
+        header += LAS14_FIELDS.pack(0, 0, 0, count, count, *([0] * 14))
+    return header
+
+
+# Return one block of POINTS_PER_BLOCK point records scattered over bounds, with a gently varying surface
+def point_block(point_format, bounds, seed):
+    generator = random.Random(seed)
+    record = POINT_RECORDS[point_format]
+    min_x, min_y, max_x, max_y = bounds
+    block = bytearray()
+    for number in range(POINTS_PER_BLOCK):
+        x = round((generator.uniform(min_x, max_x) - min_x) * 100)  # Integers in centimetres from the header offset
+        y = round((generator.uniform(min_y, max_y) - min_y) * 100)
+        z = round((20.0 + 15.0 * (x % 100000) / 100000 + generator.gauss(0.0, 0.3)) * 100)
+        returns = generator.choice((0x09, 0x09, 0x09, 0x12, 0x0A))  # Mostly single returns
+        classification = generator.choice((1, 2, 2, 5, 6))
+        gps_time = 1e8 + number * 1e-5
+        if point_format >= 6:
+            block += record.pack(x, y, z, generator.randrange(4096), returns, 0, classification, 0, 0, 1, gps_time)
+        else:
+            block += record.pack(x, y, z, generator.randrange(4096), returns, classification, 0, 0, 1, gps_time)
+    return bytes(block)
+
+
+# Write a LAS file of about size bytes covering bounds into an open ZIP archive
+def write_las(archive, name, year, bounds, size, seed):
+    point_format, minor = LAS_LAYOUT[year]
+    record_length = POINT_RECORDS[point_format].size
+    blocks = max(1, size // (record_length * POINTS_PER_BLOCK))
+    with archive.open(name, 'w', force_zip64=True) as member:
+        member.write(las_header(point_format, minor, blocks * POINTS_PER_BLOCK, bounds))
+        block = point_block(point_format, bounds, seed)
+        for _ in range(blocks):
+            member.write(block)
+
+
+# Return an uncompressed RGB baseline TIFF of side x side pixels
+def tiff_image(side, seed):
+    generator = random.Random(seed)
+    row = bytes(generator.randrange(256) for _ in range(side * 3))
+    data_size = side * side * 3
+    entries = [(256, 4, 1, side), (257, 4, 1, side), (258, 3, 3, 8 + data_size), (259, 3, 1, 1), (262, 3, 1, 2), (273, 4, 1, 8),
+               (277, 3, 1, 3), (278, 4, 1, side), (279, 4, 1, data_size), (284, 3, 1, 1)]  # Tag, type, count, value or offset
+    ifd_offset = 8 + data_size + 6  # After the pixels and the three BitsPerSample values
+    image = bytearray(struct.pack('<2sHI', b'II', 42, ifd_offset))
+    for number in range(side):
+        image += row[number % 7:] + row[:number % 7]  # Shifted rows, so the image is not one repeated line
+    image += struct.pack('<3H', 8, 8, 8)
+    image += struct.pack('<H', len(entries))
+    for tag, kind, count, value in entries:
+        image += struct.pack('<HHI', tag, kind, count) + (struct.pack('<HH', value, 0) if kind == 3 and count == 1 else struct.pack('<I', value))
+    image += struct.pack('<I', 0)  # No further image directories
+    return bytes(image)
+
+
+# Return the footprint ring (longitude, latitude) of the tile at grid position column, row
+def tile_footprint(column, row):
+    lon = GRID_ORIGIN[0] + column * TILE_DEGREES[0]
+    lat = GRID_ORIGIN[1] + row * TILE_DEGREES[1]
+    return [(lon, lat), (lon + TILE_DEGREES[0], lat), (lon + TILE_DEGREES[0], lat + TILE_DEGREES[1]), (lon, lat + TILE_DEGREES[1]), (lon, lat)]
+
+
+# Return the UTM bounds of a footprint ring
+def utm_bounds(footprint):
+    points = [lonlat_to_utm(lon, lat) for lon, lat in footprint]
+    return (min(x for x, _ in points), min(y for _, y in points), max(x for x, _ in points), max(y for _, y in points))
+
+
+# Write count synthetic tiles of each year under directory, in the folder layout of the real server
+# (2013LiDAR, 2013GeoTIFF, 2018LiDAR, 2022LiDAR). size is the size of each LAS file in bytes.
+# Returns {year: [(name, footprint, {url column: path relative to directory})]} for write_catalogues.
+def make_dataset(directory, count, size, years=(2013, 2018, 2022)):
+    tiles = {}
+    columns = max(1, int(count ** 0.5))
+    for year in years:
+        tiles[year] = []
+        for number in range(count):
+            footprint = tile_footprint(number % columns, number // columns)
+            bounds = utm_bounds(footprint)
+            easting, northing = int(bounds[0]) // 1000 * 1000, int(bounds[1]) // 1000 * 1000
+            name = f'{easting}_{northing}' if year == 2022 else f'{easting // 100:04d}E_{northing // 100:05d}N'
+            paths = {}
+            compression = zipfile.ZIP_DEFLATED
+            if year == 2013:
+                paths['LiDAR_URL'] = os.path.join(f'{year}LiDAR', f'COV_{name}.zip')
+                paths['GeoTIFF_URL'] = os.path.join(f'{year}GeoTIFF', f'{name}.zip')
+            else:
+                paths['LiDAR_URL'] = os.path.join(f'{year}LiDAR', f'{name}.zip')
+            for path in paths.values():
+                os.makedirs(os.path.join(directory, os.path.dirname(path)), exist_ok=True)
+            with zipfile.ZipFile(os.path.join(directory, paths['LiDAR_URL']), 'w', compression) as archive:
+                write_las(archive, f'{name}.las', year, bounds, size, seed=year * 100000 + number)
+                if year == 2018:
+                    archive.writestr(f'{name}.prj', PRJ_TEXT)
+                if year == 2022:
+                    archive.writestr(f'{name}.lasx', random.Random(number).randbytes(max(1024, size // 100)))  # Spatial index, about 1% of the LAS file
+            if year == 2013:
+                with zipfile.ZipFile(os.path.join(directory, paths['GeoTIFF_URL']), 'w', compression) as archive:
+                    archive.writestr(f'{name}.tif', tiff_image(GEOTIFF_PIXELS, number))
+                    pixel = GEOTIFF_PIXEL_SIZE
+                    left = math.floor(bounds[0] / pixel) * pixel  # Top-left corner of the footprint, snapped to the pixel grid
+                    top = math.ceil(bounds[3] / pixel) * pixel
+                    archive.writestr(f'{name}.tfw', f'{pixel}\n0.0\n0.0\n{-pixel}\n{left + pixel / 2}\n{top - pixel / 2}\n')
+            tiles[year].append((name, footprint, paths))
+    return tiles
+
+
+# Write the lidar-20xx.csv catalogues of a dataset made by make_dataset into data_dir, with URLs under base_url
+def write_catalogues(data_dir, tiles, base_url):
+    os.makedirs(data_dir, exist_ok=True)
+    for year, rows in tiles.items():
+        columns = ['GeoTIFF_URL', 'LiDAR_URL'] if year == 2013 else ['LiDAR_URL']
+        csv_path = os.path.join(data_dir, f'lidar-{year}.csv')
+        with open(csv_path, 'w', encoding='utf-8-sig', newline='') as file:
+            file.write(';'.join(['NAME'] + columns + ['Geom', 'geo_point_2d']) + '\n')
+            for name, footprint, paths in rows:
+                urls = [f"{base_url}/{paths[column].replace(os.sep, '/')}" for column in columns]
+                geometry = json.dumps({'coordinates': [[list(point) for point in footprint]], 'type': 'Polygon'}).replace('"', '""')
+                lon = sum(lon for lon, _ in footprint[:-1]) / 4
+                lat = sum(lat for _, lat in footprint[:-1]) / 4
+                file.write(';'.join([name] + urls + [f'"{geometry}"', f'{lat}, {lon}']) + '\n')
+        if os.path.exists(csv_path + '.cache'):  # A cache of an earlier dataset would hide the new URLs
+            os.remove(csv_path + '.cache')
+
+
+# HTTP server answering GET and HEAD for the files under directory, with the slowdowns and failures
+# given to its constructor. Counts what it serves in stats.
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, directory, latency=0.0, bandwidth=None, total_bandwidth=None, drop_rate=0.0, ranges=True, seed=None):
+        super().__init__(address, StandInHandler)
+        self.directory = os.path.abspath(directory)  # Root of the served files
+        self.latency = latency  # Seconds before every response
+        self.bandwidth = bandwidth  # Bytes per second of each response, or None
+        self.total_limiter = RateLimiter(total_bandwidth, SEND_BLOCK_SIZE * 4) if total_bandwidth else None  # Shared cap over every response
+        self.drop_rate = drop_rate  # Share of bodies cut off part-way through
+        self.ranges = ranges  # Honour Range requests
+        self.random = random.Random(seed)  # Decides which bodies are cut off, and where
+        self.stats = {'requests': 0, 'head': 0, 'range': 0, 'not_modified': 0, 'dropped': 0, 'bytes_sent': 0}  # What has been served
+        self.lock = threading.Lock()  # Lock protecting stats and random
+
+    # Add to the statistics
+    def count(self, **amounts):
+        with self.lock:
+            for key, amount in amounts.items():
+                self.stats[key] += amount
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep connections open, as the real server does
+
+    def log_message(self, format, *args):  # Keep the output of the benchmarks clean
+        pass
+
+    def do_HEAD(self):
+        self.respond(head=True)
+
+    def do_GET(self):
+        if urlsplit(self.path).path == '/_stats':
+            with self.server.lock:
+                body = json.dumps(self.server.stats).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self.respond(head=False)
+
+    # Send a file (or the requested part of it), honouring the server's latency, caps and drop rate
+    def respond(self, head):
+        server = self.server
+        server.count(requests=1, head=int(head))
+        if server.latency:
+            time.sleep(server.latency)
+        path = os.path.normpath(os.path.join(server.directory, unquote(urlsplit(self.path).path).lstrip('/')))
+        if not path.startswith(server.directory + os.sep) or not os.path.isfile(path):
+            self.send_error(404)
+            return
+        stat = os.stat(path)
+        size = stat.st_size
+        etag = f'"{size:x}-{stat.st_mtime_ns:x}"'
+        last_modified = formatdate(stat.st_mtime, usegmt=True)
+        if self.headers.get('If-None-Match') == etag:
+            server.count(not_modified=1)
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        start, end, status = 0, size - 1, 200
+        match = BYTE_RANGE.match(self.headers.get('Range', ''))
+        if server.ranges and match and self.headers.get('If-Range', etag) in (etag, last_modified):  # A stale If-Range gets the whole file
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:  # The last bytes of the file
+                start, end = max(0, size - int(match.group(2) or 0)), size - 1
+            if start >= size or not (match.group(1) or match.group(2)):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status = 206
+            server.count(range=1)
+        length = end - start + 1
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/zip')
+        self.send_header('Content-Length', str(length))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', last_modified)
+        if server.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.end_headers()
+        if head:
+            return
+
+        with server.lock:
+            cut = server.random.randrange(length) if length and server.random.random() < server.drop_rate else None  # Where the body is cut off, if it is
+        limiter = RateLimiter(server.bandwidth, SEND_BLOCK_SIZE * 4) if server.bandwidth else None
+        sent = 0
+        with open(path, 'rb') as file:
+            file.seek(start)
+            while sent < length:
+                block = file.read(min(SEND_BLOCK_SIZE, length - sent, cut - sent if cut is not None else length))
+                for bucket in (limiter, server.total_limiter):
+                    if bucket is not None:
+                        bucket.acquire(len(block))
+                try:
+                    self.wfile.write(block)
+                except OSError:  # The client went away
+                    self.close_connection = True
+                    break
+                sent += len(block)
+                if cut is not None and sent >= cut:  # Drop the connection part-way through the body
+                    server.count(dropped=1)
+                    self.close_connection = True
+                    try:
+                        self.connection.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+                    break
+        server.count(bytes_sent=sent)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve synthetic VanLidar tiles from a local stand-in server.")
+    parser.add_argument('--directory', required=True, help="folder of the served files")
+    parser.add_argument('--port', type=int, default=8800, help="port to listen on (default: 8800)")
+    parser.add_argument('--generate', type=int, metavar='TILES', help="first write this many synthetic tiles of every year, and their catalogues")
+    parser.add_argument('--size', type=float, default=16, help="size of each synthetic LAS file in MB (default: 16)")
+    parser.add_argument('--data-dir', help="folder for the generated catalogues (default: DIRECTORY/catalogues)")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds before every response (default: 0)")
+    parser.add_argument('--bandwidth', type=float, help="cap of each response in MB/s")
+    parser.add_argument('--total-bandwidth', type=float, help="cap of all responses together in MB/s")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="share of bodies cut off part-way through (default: 0)")
+    parser.add_argument('--no-ranges', action='store_true', help="ignore Range headers and always send whole files")
+    parser.add_argument('--seed', type=int, help="seed of the dropped connections")
+    args = parser.parse_args()
+
+    if args.generate:
+        tiles = make_dataset(args.directory, args.generate, int(args.size * MEGABYTE))
+        data_dir = args.data_dir or os.path.join(args.directory, 'catalogues')
+        write_catalogues(data_dir, tiles, f'http://127.0.0.1:{args.port}')
+        print(f"Wrote {args.generate} tiles of every year to {args.directory} and their catalogues to {data_dir}", flush=True)
+    server = StandInServer(('127.0.0.1', args.port), args.directory, latency=args.latency,
+                           bandwidth=args.bandwidth * MEGABYTE if args.bandwidth else None,
+                           total_bandwidth=args.total_bandwidth * MEGABYTE if args.total_bandwidth else None,
+                           drop_rate=args.drop_rate, ranges=not args.no_ranges, seed=args.seed)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+# Shared fixtures: synthetic tiles served by the stand-in server of benchmarks/standin.py
+import os  # Import the os module for the paths
+import sys  # Import the sys module to find the benchmarks folder
+import threading  # Import the threading module to run the server in the background
+
+import pytest  # Import pytest for the fixtures
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from standin import StandInServer, make_dataset, write_catalogues  # Synthetic tiles and the local server
+
+
+# Return a function that writes count synthetic tiles of the given years (LAS files of size bytes),
+# serves them from a stand-in server started with the given options, and returns the catalogue folder.
+# The servers are kept in serve.servers and shut down when the test ends.
+@pytest.fixture
+def standin(tmp_path):
+    servers = []
+
+    def serve(years=(2022,), count=1, size=256 * 1024, **options):
+        served = tmp_path / 'served'
+        tiles = make_dataset(str(served), count, size, years)
+        server = StandInServer(('127.0.0.1', 0), str(served), seed=1, **options)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        data_dir = tmp_path / 'catalogues'
+        write_catalogues(str(data_dir), tiles, f'http://127.0.0.1:{server.server_address[1]}')
+        return str(data_dir)
+
+    serve.servers = servers
+    yield serve
+    for server in servers:
+        server.shutdown()
+        server.server_close()
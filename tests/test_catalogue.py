@@ -0,0 +1,59 @@
+import os  # Import the os module for the paths of the shipped catalogues
+
+import pytest
+
+from vanlidar.catalogue import CatalogueError, load_catalogue, parse_catalogue  # Catalogue parsing under test
+
+# Folder holding the lidar-20xx.csv catalogues shipped with the package
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Footprint of one 2013 tile, as the City's export writes it (JSON with doubled quotes)
+GEOM = ('"{""coordinates"": [[[-123.233540385675, 49.238540629924], [-123.233582808806, 49.2475357590952], '
+        '[-123.219842666468, 49.2475627222743], [-123.21980273876, 49.2385675846008], [-123.233540385675, 49.238540629924]]], '
+        '""type"": ""Polygon""}"')
+
+
+# Write a catalogue with the 2013 header (after a byte order mark, like the City's files) and the given rows, and return its path
+def write_csv(tmp_path, *rows):
+    path = tmp_path / 'lidar-2013.csv'
+    path.write_text('\ufeffNAME;GeoTIFF_URL;LiDAR_URL;Geom;geo_point_2d\n' + ''.join(row + '\n' for row in rows), encoding='utf-8')
+    return str(path)
+
+
+# Every row of the shipped catalogues is read and passes validation
+@pytest.mark.parametrize('year, rows', [(2013, 168), (2018, 181), (2022, 181)])
+def test_shipped_catalogues(year, rows):
+    catalogue = parse_catalogue(os.path.join(ROOT, f'lidar-{year}.csv'))
+    assert len(catalogue) == rows
+    assert all(len(urls) == rows for urls in catalogue.urls.values())
+    assert len(catalogue.offsets) == rows + 1
+
+
+# A row whose every value is quoted, separated by ';', reads the same as the unquoted export
+def test_quoted_row(tmp_path):
+    path = write_csv(tmp_path, ';'.join(['"4830E_54540N"', '"https://example.org/2013GeoTIFF/4830E_54540N.zip"',
+                                         '"https://example.org/2013LiDAR/COV_4830E_54540N.zip"', GEOM, '"49.2430518101, -123.22669215"']))
+    catalogue = parse_catalogue(path)
+    tile = catalogue.tile(0)
+    assert tile.name == '4830E_54540N'
+    assert tile.urls == {'GeoTIFF_URL': 'https://example.org/2013GeoTIFF/4830E_54540N.zip',
+                         'LiDAR_URL': 'https://example.org/2013LiDAR/COV_4830E_54540N.zip'}
+    assert len(catalogue.footprint(0)) == 5
+    assert catalogue.tile_bounds(0) == pytest.approx((-123.233582808806, 49.238540629924, -123.219802738760, 49.2475627222743))
+
+
+# A row with a missing column is reported with its line number
+def test_short_row(tmp_path):
+    path = write_csv(tmp_path, '4830E_54540N;https://example.org/a.zip;' + GEOM + ';"49.24, -123.22"')
+    with pytest.raises(CatalogueError, match='line 2'):
+        parse_catalogue(path)
+
+
+# The cache written on the first load gives back the same catalogue
+def test_cache_round_trip(tmp_path):
+    path = write_csv(tmp_path, ';'.join(['4830E_54540N', 'https://example.org/a.zip', 'https://example.org/b.zip', GEOM, '49.2430518101, -123.22669215']))
+    parsed = load_catalogue(path)
+    cached = load_catalogue(path)
+    assert os.path.exists(path + '.cache')
+    assert cached.names == parsed.names and cached.urls == parsed.urls
+    assert list(cached.coordinates) == list(parsed.coordinates)
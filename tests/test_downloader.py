@@ -0,0 +1,134 @@
+import os  # Import the os module for the paths
+import random  # Import the random module for the member data
+import time  # Import the time module to time the throttled downloads
+import zipfile  # Import the zipfile module to write a tile with several members
+
+from vanlidar.downloader import Downloader  # Downloader under test
+
+# Bandwidth limit of the throttled downloads, in bytes per second
+RATE = 200 * 1024
+
+
+# Download the tiles of data_dir with the given Downloader options and return (runs, seconds)
+def timed_download(tmp_path, data_dir, **options):
+    with Downloader(output_dir=str(tmp_path / 'output'), data_dir=data_dir, echo=None, extract_jobs=0, min_free=None, **options) as downloader:
+        runs = downloader.prepare([2022])
+        started = time.perf_counter()
+        downloader.download(runs, progress=False)
+        return runs, time.perf_counter() - started
+
+
+# A streamed tile is held to --max-rate like a saved one: the limiter starts with one second of
+# bytes in hand, so the rest of the body must take at least (received - RATE) / RATE seconds
+def test_streamed_download_is_throttled(tmp_path, standin):
+    data_dir = standin(size=1200 * 1024)
+    runs, seconds = timed_download(tmp_path, data_dir, bytes_per_second=RATE)
+    record = runs[0].manifest.get(runs[0].pending[0].rsplit('/', 1)[-1])
+    assert runs[0].downloaded_count == 1 and not runs[0].failures
+    assert record['received'] > 2 * RATE
+    assert seconds >= 0.8 * (record['received'] - RATE) / RATE
+
+
+# Without a limit the same tile streams in a fraction of that time
+def test_streamed_download_without_limit(tmp_path, standin):
+    data_dir = standin(size=1200 * 1024)
+    runs, seconds = timed_download(tmp_path, data_dir)
+    assert runs[0].downloaded_count == 1
+    assert seconds < 1.0
+
+
+# Stand-in for the server's random generator that cuts off the body-th body it sends (counting from 0)
+# at share of its length; serve the tiles with drop_rate=1.0 for it to take effect
+class DropBody:
+    def __init__(self, share, body=0):
+        self.share = share
+        self.body = body
+        self.sent = 0
+
+    def random(self):
+        self.sent += 1
+        return 0.0 if self.sent - 1 == self.body else 1.0
+
+    def randrange(self, length):
+        return int(length * self.share)
+
+
+# A streamed tile whose connection drops after its first member carries on with a Range request from
+# the second member, instead of fetching the whole ZIP file again
+def test_dropped_stream_resumes_after_last_member(tmp_path, standin):
+    data_dir = standin(drop_rate=1.0)
+    server = standin.servers[0]
+    folder = tmp_path / 'served' / '2022LiDAR'
+    zip_path = folder / os.listdir(folder)[0]
+    stem = zip_path.stem
+    data = {'.las': random.Random(1).randbytes(200 * 1024), '.lasx': random.Random(2).randbytes(600 * 1024)}
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED) as archive:
+        for extension, content in data.items():
+            archive.writestr(stem + extension, content)
+    server.random = DropBody(0.5)  # Inside the second member, past the first chunk read
+
+    runs, _ = timed_download(tmp_path, data_dir)
+    run = runs[0]
+    assert run.downloaded_count == 1 and not run.failures
+    assert server.stats['dropped'] == 1 and server.stats['range'] == 1
+    assert server.stats['bytes_sent'] < 1.5 * zip_path.stat().st_size
+    record = run.manifest.get(zip_path.name)
+    assert record['size'] == zip_path.stat().st_size
+    for path, content in zip(run.product.expected_paths(zip_path.name, str(tmp_path / 'output')), data.values()):
+        with open(path, 'rb') as file:
+            assert file.read() == content
+
+
+# A streamed tile that drops before its first member is saved as a ZIP file instead; the reservation
+# grows by the ZIP size for it and is given back in full once the tile is done
+def test_stream_fallback_reserves_zip_size(tmp_path, standin):
+    data_dir = standin(size=600 * 1024, drop_rate=1.0)
+    server = standin.servers[0]
+    server.random = DropBody(0.1, body=1)  # The first body is the central directory probe
+    zip_path = next((tmp_path / 'served' / '2022LiDAR').iterdir())
+    with Downloader(output_dir=str(tmp_path / 'output'), data_dir=data_dir, echo=None, extract_jobs=0, min_free=1) as downloader:
+        reserved = []
+        reserve = downloader.disk.reserve
+        downloader.disk.reserve = lambda directory, amount, *args, **kwargs: reserved.append(amount) or reserve(directory, amount, *args, **kwargs)
+        runs = downloader.prepare([2022])
+        downloader.download(runs, progress=False)
+        assert runs[0].downloaded_count == 1 and not runs[0].failures
+        assert server.stats['dropped'] == 1
+        assert len(reserved) == 2 and reserved[1] == zip_path.stat().st_size
+        assert not any(downloader.disk._reserved.values())
+
+
+# Every GET of a streamed tile asks for the raw bytes, like download_resumable and probe_zip, so the
+# offsets the stream keeps match the file on the server
+def test_streamed_requests_ask_for_identity_encoding(tmp_path, standin):
+    data_dir = standin()
+    with Downloader(output_dir=str(tmp_path / 'output'), data_dir=data_dir, echo=None, extract_jobs=0, min_free=None) as downloader:
+        sent = []
+        get = downloader.engine.get
+        downloader.engine.get = lambda url, **kwargs: sent.append(kwargs.get('headers') or {}) or get(url, **kwargs)
+        runs = downloader.prepare([2022])
+        downloader.download(runs, progress=False)
+    assert runs[0].downloaded_count == 1
+    assert sent and all(headers.get('Accept-Encoding') == 'identity' for headers in sent)
+
+
+# A member that fails its CRC check is not worth a Range request: the tile goes straight to the saved
+# ZIP file, whose extraction then reports the damage
+def test_stream_crc_error_is_not_resumed(tmp_path, standin):
+    data_dir = standin()
+    server = standin.servers[0]
+    zip_path = next((tmp_path / 'served' / '2022LiDAR').iterdir())
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED) as archive:
+        archive.writestr(zip_path.stem + '.las', random.Random(1).randbytes(200 * 1024))
+        archive.writestr(zip_path.stem + '.lasx', random.Random(2).randbytes(200 * 1024))
+        archive.writestr(zip_path.stem + '.txt', random.Random(3).randbytes(2048 * 1024))  # So the error comes well before the end of the body
+        offset = archive.getinfo(zip_path.stem + '.lasx').header_offset
+    data = bytearray(zip_path.read_bytes())
+    data[offset + 100 * 1024] ^= 0xFF  # A byte inside the second member
+    zip_path.write_bytes(bytes(data))
+
+    with Downloader(output_dir=str(tmp_path / 'output'), data_dir=data_dir, echo=None, extract_jobs=0, min_free=None, retries=0) as downloader:
+        runs = downloader.prepare([2022])
+        downloader.download(runs, progress=False)
+    assert runs[0].failures and 'CRC' in next(iter(runs[0].failures.values()))
+    assert server.stats['range'] == 0
@@ -0,0 +1,45 @@
+import time  # Import the time module to time the held-back items
+
+from vanlidar.engine import DownloadEngine  # Engine under test
+from vanlidar.scheduler import WorkQueue  # Queue with held-back items
+
+
+# A held-back item does not occupy a worker: with a single worker, the items that are ready run first,
+# and the held-back one starts once it is due, even after every other item has finished
+def test_held_back_items_do_not_block_workers():
+    engine = DownloadEngine(max_workers=1)
+    queue = WorkQueue()
+    started = time.monotonic()
+    queue.push('retry', not_before=started + 0.5)
+    for name in ('a', 'b'):
+        queue.push(name)
+    starts = {}
+
+    def work(name):
+        starts[name] = time.monotonic() - started
+        time.sleep(0.1)
+
+    try:
+        results = [name for name, _ in engine.run(work, queue)]
+    finally:
+        engine.close()
+    assert results == ['a', 'b', 'retry']
+    assert starts['b'] < 0.3
+    assert 0.5 <= starts['retry'] < 0.9
+    assert not len(queue)
+
+
+# Items pushed while the results are handed back are picked up by the same run, held back or not
+def test_items_pushed_during_run_are_started():
+    engine = DownloadEngine(max_workers=2)
+    queue = WorkQueue(['a'])
+    results = []
+    try:
+        for name, _ in engine.run(lambda name: None, queue):
+            results.append(name)
+            if name == 'a':
+                queue.push('retry', not_before=time.monotonic() + 0.2)
+                queue.push('b')
+    finally:
+        engine.close()
+    assert results == ['a', 'b', 'retry']
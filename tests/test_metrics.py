@@ -0,0 +1,12 @@
+from vanlidar.metrics import Metrics  # Metrics under test
+
+
+# The event and Prometheus files can go in folders that do not exist yet (e.g. a fresh --output-dir)
+def test_metrics_creates_missing_folders(tmp_path):
+    events_path = tmp_path / 'out' / 'events.jsonl'
+    prometheus_path = tmp_path / 'out' / 'prom' / 'vanlidar.prom'
+    with Metrics(str(events_path), str(prometheus_path)) as metrics:
+        metrics.event('run_start', tiles=0)
+        metrics.flush(force=True)
+    assert '"run_start"' in events_path.read_text()
+    assert prometheus_path.exists()
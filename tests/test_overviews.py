@@ -0,0 +1,73 @@
+import argparse  # Import argparse to build the command line arguments of write_overviews
+import os  # Import the os module for the paths
+import xml.etree.ElementTree as ElementTree  # Import ElementTree to read the mosaic
+import zipfile  # Import the zipfile module to unpack the stand-in GeoTIFF tiles
+
+import numpy
+import rasterio
+
+from vanlidar.cli import write_overviews  # --overviews step of the command line
+from vanlidar.datasets import get_dataset  # Folder of the 2013 GeoTIFF files
+from vanlidar.overviews import build_overviews, write_mosaic  # Overviews and mosaic under test
+from standin import make_dataset  # Synthetic tiles of the stand-in server (put on the path by conftest.py)
+
+
+# Write a 64 x 64 single-band GeoTIFF with the given pixel size and top-left corner
+def write_tiff(path, pixel, left, top):
+    profile = {'driver': 'GTiff', 'width': 64, 'height': 64, 'count': 1, 'dtype': 'uint8', 'crs': 'EPSG:26910',
+               'transform': rasterio.Affine(pixel, 0.0, left, 0.0, -pixel, top)}
+    with rasterio.open(path, 'w', **profile) as dataset:
+        dataset.write(numpy.full((1, 64, 64), 7, dtype='uint8'))
+    return str(path)
+
+
+# Return the source file names listed in a mosaic
+def mosaic_sources(path):
+    return sorted(os.path.basename(element.text) for element in ElementTree.parse(path).iter('SourceFilename'))
+
+
+# Pixel sizes that differ by rounding noise share a mosaic; a raster at another resolution is left out and reported
+def test_mosaic_tolerates_rounding_and_skips_other_resolutions(tmp_path):
+    rasters = [write_tiff(tmp_path / 'a.tif', 1.0, 490000.0, 5460000.0),
+               write_tiff(tmp_path / 'b.tif', 1.0000000001, 490064.0, 5460000.0),
+               write_tiff(tmp_path / 'c.tif', 2.0, 490128.0, 5460000.0)]
+    skipped = write_mosaic(str(tmp_path / 'mosaic.vrt'), rasters)
+    assert list(skipped) == [rasters[2]]
+    assert mosaic_sources(tmp_path / 'mosaic.vrt') == ['a.tif', 'b.tif']
+
+
+# build_overviews reports the left-out raster as a failure of its source GeoTIFF, on later runs too
+def test_build_overviews_reports_mismatched_raster(tmp_path):
+    write_tiff(tmp_path / 'a.tif', 1.0, 490000.0, 5460000.0)
+    write_tiff(tmp_path / 'b.tif', 2.0, 490064.0, 5460000.0)
+    built, failures, mosaic_path = build_overviews(str(tmp_path), workers=1)
+    assert built == 2
+    assert list(failures) == [str(tmp_path / 'b.tif')]
+    assert mosaic_sources(mosaic_path) == ['a.tif']
+    built, failures, _ = build_overviews(str(tmp_path), workers=1)  # Nothing to rebuild, but the raster is still left out
+    assert built == 0
+    assert list(failures) == [str(tmp_path / 'b.tif')]
+
+
+# A copy that cannot be read makes --overviews fail with a message instead of a traceback
+def test_write_overviews_reports_unreadable_copy(tmp_path, capsys):
+    product = get_dataset(2013).products[1]
+    directory = product.directory(None, str(tmp_path))
+    os.makedirs(os.path.join(directory, 'cog'))
+    write_tiff(os.path.join(directory, 'a.tif'), 1.0, 490000.0, 5460000.0)
+    with open(os.path.join(directory, 'cog', 'a.tif'), 'wb') as file:  # Newer than its source, so it is not rebuilt
+        file.write(b'not a GeoTIFF')
+    args = argparse.Namespace(year=[2013], output_dir=str(tmp_path), extract_jobs=1)
+    assert write_overviews(args) == 1
+    assert 'Could not build the overviews' in capsys.readouterr().out
+
+
+# The GeoTIFF tiles of the stand-in server share one pixel grid, so every one of them lands in the mosaic
+def test_standin_geotiffs_share_a_mosaic(tmp_path):
+    tiles = make_dataset(str(tmp_path / 'served'), 4, 1024, years=(2013,))
+    for name, _, paths in tiles[2013]:
+        with zipfile.ZipFile(tmp_path / 'served' / paths['GeoTIFF_URL']) as archive:
+            archive.extractall(tmp_path / 'tiles')
+    built, failures, mosaic_path = build_overviews(str(tmp_path / 'tiles'), workers=2)
+    assert built == 4 and not failures
+    assert len(set(mosaic_sources(mosaic_path))) == 4
@@ -0,0 +1,11 @@
+import pytest
+
+from vanlidar.query import query_points  # Point query under test
+from vanlidar.spatial import BoundingBox  # Area of the query
+
+
+# Download options are refused when nothing is downloaded, instead of being ignored
+def test_query_points_refuses_options_without_fetching(tmp_path):
+    area = BoundingBox(-123.2, 49.25, -123.19, 49.26)
+    with pytest.raises(TypeError, match='laz'):
+        next(query_points(area, output_dir=str(tmp_path), fetch_missing=False, laz=True))
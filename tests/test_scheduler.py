@@ -0,0 +1,43 @@
+import errno  # Import the errno module to recognise a full disk
+import os  # Import the os module for the device of the test folder
+import shutil  # Import the shutil module for the free space
+import time  # Import the time module for the held-back items
+
+import pytest
+
+from vanlidar.scheduler import DiskBudget, WorkQueue  # Disk reservations and the work queue under test
+
+
+# Growing a reservation adds to the space it holds, and releasing it gives all of it back once
+def test_reservation_grows_and_releases_in_full(tmp_path):
+    budget = DiskBudget(min_free=0)
+    device = os.stat(tmp_path).st_dev
+    reservation = budget.reserve(str(tmp_path), 1000)
+    reservation.grow(str(tmp_path), 500)
+    assert reservation.amount == 1500 and budget._reserved[device] == 1500
+    reservation.release()
+    reservation.release()
+    assert budget._reserved[device] == 0
+
+
+# A tile that cannot grow its own reservation fails at once instead of waiting for itself to free space
+def test_reservation_grow_past_free_space_fails(tmp_path):
+    budget = DiskBudget(min_free=0)
+    reservation = budget.reserve(str(tmp_path), 1000)
+    with pytest.raises(OSError) as raised:
+        reservation.grow(str(tmp_path), 2 * shutil.disk_usage(tmp_path).free)
+    assert raised.value.errno == errno.ENOSPC
+    assert reservation.amount == 1000
+
+
+# An item pushed with a not_before time is held back, and handed out once it is due
+def test_work_queue_holds_back_items_until_due():
+    queue = WorkQueue(['first'])
+    queue.push('retry', not_before=time.monotonic() + 0.2)
+    queue.push('second')
+    assert len(queue) == 3
+    assert list(queue) == ['first', 'second']
+    assert len(queue) == 1 and 0 < queue.next_due() <= 0.2
+    time.sleep(0.25)
+    assert queue.next_due() == 0
+    assert list(queue) == ['retry'] and queue.next_due() is None
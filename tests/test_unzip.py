@@ -0,0 +1,108 @@
+import io  # Import the io module to build ZIP files in memory
+import os  # Import the os module to list the output folder
+import random  # Import the random module for the member data
+import zipfile  # Import the zipfile module to write the archives
+
+import pytest
+
+from vanlidar.unzip import StreamProgress, StreamTruncatedError, StreamZipError, stream_extract  # Streamed extraction under test
+
+# Member data: random bytes do not compress, so their place in the archive is easy to predict
+DATA = {'a.las': random.Random(1).randbytes(50 * 1024), 'b.lasx': random.Random(2).randbytes(20 * 1024)}
+
+
+# File object that cannot seek, like a socket, so zipfile writes data descriptors after the members
+class Unseekable(io.RawIOBase):
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+
+# Return a ZIP file holding DATA, with the given compression, and with data descriptors if unseekable
+def make_zip(compression=zipfile.ZIP_STORED, unseekable=False):
+    target = Unseekable() if unseekable else io.BytesIO()
+    with zipfile.ZipFile(target, 'w', compression) as archive:
+        for name, content in DATA.items():
+            if unseekable:
+                with archive.open(name, 'w') as member:  # Sizes are only known once the member is written
+                    member.write(content)
+            else:
+                archive.writestr(name, content)
+    return (target.buffer if unseekable else target).getvalue()
+
+
+# Split data into chunks of size bytes, like a download read in pieces
+def chunked(data, size=4096):
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+# Return the files in a folder
+def written(folder):
+    return sorted(os.listdir(folder))
+
+
+# Every member of an archive read in chunks is written under its own name
+def test_stream_extract_writes_every_member(tmp_path):
+    members = stream_extract(chunked(make_zip(zipfile.ZIP_DEFLATED)), lambda name: str(tmp_path))
+    assert [member.name for member in members] == list(DATA)
+    for name, content in DATA.items():
+        assert (tmp_path / name).read_bytes() == content
+
+
+# A member followed by a data descriptor (sizes after the data) is extracted and checked against it
+def test_stream_extract_reads_data_descriptors(tmp_path):
+    data = make_zip(zipfile.ZIP_DEFLATED, unseekable=True)
+    assert zipfile.ZipFile(io.BytesIO(data)).infolist()[0].flag_bits & 0x08
+    members = stream_extract(chunked(data, 1000), lambda name: str(tmp_path))
+    assert [(member.name, member.size) for member in members] == [(name, len(content)) for name, content in DATA.items()]
+    assert (tmp_path / 'a.las').read_bytes() == DATA['a.las']
+
+
+# A stored member cannot be streamed without its sizes, whatever the descriptor says afterwards
+def test_stream_extract_rejects_stored_member_without_sizes(tmp_path):
+    with pytest.raises(StreamZipError):
+        stream_extract(chunked(make_zip(zipfile.ZIP_STORED, unseekable=True)), lambda name: str(tmp_path))
+    assert written(tmp_path) == []
+
+
+# A download cut off in the middle of a member keeps the members before it and nothing of the broken one;
+# the progress points at the start of the broken member, where a Range request can pick up
+def test_stream_extract_truncated_stream(tmp_path):
+    data = make_zip()
+    progress = StreamProgress()
+    with pytest.raises(StreamTruncatedError):
+        stream_extract(chunked(data[:len(data) - 10 * 1024]), lambda name: str(tmp_path), progress=progress)
+    assert written(tmp_path) == ['a.las']
+    assert [member.name for member in progress.members] == ['a.las']
+    assert data[progress.offset:progress.offset + 4] == b'PK\x03\x04'
+
+    rest = stream_extract(chunked(data[progress.offset:]), lambda name: str(tmp_path), progress=progress)
+    assert [member.name for member in rest] == list(DATA)
+    assert (tmp_path / 'b.lasx').read_bytes() == DATA['b.lasx']
+
+
+# A member whose data does not match its CRC is not kept, not even under its temporary name
+@pytest.mark.parametrize('compression', [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED])
+def test_stream_extract_crc_mismatch(tmp_path, compression):
+    data = bytearray(make_zip(compression))
+    info = zipfile.ZipFile(io.BytesIO(bytes(data))).getinfo('a.las')
+    data[14:18] = ((info.CRC + 1) & 0xFFFFFFFF).to_bytes(4, 'little')  # CRC field of the first local header
+    with pytest.raises(StreamZipError, match='CRC') as raised:
+        stream_extract(chunked(bytes(data)), lambda name: str(tmp_path))
+    assert not isinstance(raised.value, StreamTruncatedError)  # Not worth resuming
+    assert written(tmp_path) == []
+
+
+# Members routed to None are read through and dropped
+def test_stream_extract_skips_unrouted_members(tmp_path):
+    def route(name):
+        return str(tmp_path) if name.endswith('.las') else None
+
+    members = stream_extract(chunked(make_zip(zipfile.ZIP_DEFLATED)), route)
+    assert [member.name for member in members] == ['a.las']
+    assert written(tmp_path) == ['a.las']
@@ -0,0 +1,18 @@
+# Downloader for the City of Vancouver LiDAR tiles (2013, 2018 and 2022)
+from .engine import DownloadEngine, ExtractionPool  # Concurrent download engine and extraction process pool
+from .unzip import ExtractedMember, MemberFile, StreamZipError, central_directory_sizes, extract_and_remove, extract_archive, extract_timed, stream_extract  # Streaming and on-disk ZIP extraction
+from .manifest import MANIFEST_NAME, STATUS_CHANGED, STATUS_COMPLETE, STATUS_FAILED, STATUS_MISSING, Manifest, file_checksums, las_complete  # Download manifest recording every tile
+from .transfer import IncompleteDownloadError, ResponseStream, download_resumable, has_partial, preallocate, response_state  # Resumable downloads with Range requests
+from .laz import LazFile, laz_available  # Optional recompression of LAS members to LAZ
+from .lasheader import LasHeaderError, LasHeaderInfo, parse_las_header, read_las_header  # LAS public header blocks
+from .lasreader import LasReader, PointRecords, point_dtype  # Memory-mapped LAS point reader (needs NumPy)
+from .catalogue import Catalogue, CatalogueError, Tile, load_catalogue, parse_catalogue  # Catalogue loading and caching
+from .datasets import DATASETS, Dataset, Product, get_dataset, tile_shard  # Per-year dataset descriptors
+from .scheduler import DiskBudget, RateLimiter, Reservation, RetryPolicy, WorkQueue  # Retries with backoff, rate limits and disk space
+from .metrics import STAGES, Metrics  # Per-stage timings and counters, as JSON-lines events and a Prometheus file
+from .spatial import BoundingBox, PointRadius, PolygonArea, TileIndex, lonlat_to_utm  # Spatial tile selection
+from .inventory import Inventory, InventoryTile, build_inventory, point_density  # Index of the point cloud tiles on disk
+from .downloader import Downloader, ProductRun, fetch  # Multi-year downloader and Python API
+from .query import MissingTilesError, PointBatch, ProjectedArea, query_points, read_chunks  # Points inside an area across years
+from .overviews import build_cog, build_overviews, mosaic_skipped, overview_factors, write_mosaic  # Tiled GeoTIFFs with overview pyramids (needs rasterio)
+from .gridding import GRID_PRODUCTS, GridBuilder, blend_tile, build_grids, grid_points  # DSM, DTM and density rasters (needs NumPy and rasterio)
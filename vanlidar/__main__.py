@@ -0,0 +1,6 @@
+import sys  # Import the sys module for the exit status
+
+from .cli import main  # Command line entry point
+
+if __name__ == '__main__':  # Extraction worker processes import this module too on Windows
+    sys.exit(main())
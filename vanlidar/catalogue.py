@@ -0,0 +1,212 @@
+import json  # Import the json module for the text part of the cache file
+import os  # Import the os module for file operations
+import re  # Import the re module for picking the coordinates out of the Geom column
+import struct  # Import the struct module for the cache file header
+import sys  # Import the sys module to record the byte order of the cache file
+from array import array  # Import array for the compact float columns
+from collections import namedtuple  # Import namedtuple for the tile records
+
+# One tile of a catalogue: its name, its download URLs keyed by column, its footprint as a
+# list of (longitude, latitude) points and its centroid as (latitude, longitude)
+Tile = namedtuple('Tile', ['name', 'urls', 'footprint', 'centroid'])
+
+# A "[x, y]" coordinate pair inside the GeoJSON of the Geom column
+COORDINATE_PAIR = re.compile(r'\[\s*(-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)\s*,\s*(-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)\s*\]')
+
+# Columns every catalogue must have
+REQUIRED_COLUMNS = ('NAME', 'Geom', 'geo_point_2d')
+
+# Suffix of the binary cache written next to each catalogue
+CACHE_SUFFIX = '.cache'
+
+# Header of the cache file: magic, CSV modification time (ns), CSV size, length of the JSON part
+CACHE_MAGIC = b'VLCAT2'
+CACHE_HEADER = struct.Struct('<6sqqI')
+
+# How far (in degrees) a centroid may sit outside its footprint before the row is rejected
+CENTROID_TOLERANCE = 0.001
+
+
+# Raised when a catalogue row cannot be parsed or fails validation
+class CatalogueError(ValueError):
+    pass
+
+
+# Columnar view of a catalogue. Names and URLs are lists, while the footprint bounds, centroids and
+# footprint coordinates are flat float arrays (footprint i is coordinates[2*offsets[i]:2*offsets[i+1]]).
+class Catalogue:
+    def __init__(self, names, urls, bounds, centroids, offsets, coordinates, source=None):
+        self.names = names  # Tile names from the NAME column
+        self.urls = urls  # Download URLs, one list per *_URL column
+        self.bounds = bounds  # Four arrays: min longitude, min latitude, max longitude, max latitude
+        self.centroids = centroids  # Two arrays: latitude, longitude
+        self.offsets = offsets  # Start of each footprint in points (len(names) + 1 entries)
+        self.coordinates = coordinates  # Interleaved longitude/latitude of every footprint point
+        self.source = source  # CSV file the catalogue was read from
+        self._positions = {name: position for position, name in enumerate(names)}  # Row of each tile name
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return (self.tile(position) for position in range(len(self.names)))
+
+    def __contains__(self, name):
+        return name in self._positions
+
+    # Return the position of a tile name
+    def position(self, name):
+        return self._positions[name]
+
+    # Return the footprint of the tile at a position as a list of (longitude, latitude) points
+    def footprint(self, position):
+        start, end = 2 * self.offsets[position], 2 * self.offsets[position + 1]
+        values = self.coordinates[start:end]
+        return list(zip(values[0::2], values[1::2]))
+
+    # Return the (min lon, min lat, max lon, max lat) bounds of the tile at a position
+    def tile_bounds(self, position):
+        return tuple(column[position] for column in self.bounds)
+
+    # Return the Tile at a position
+    def tile(self, position):
+        return Tile(self.names[position],
+                    {column: values[position] for column, values in self.urls.items()},
+                    self.footprint(position),
+                    (self.centroids[0][position], self.centroids[1][position]))
+
+    # Return a spatial index over the tile footprints
+    def index(self):
+        from .spatial import TileIndex  # Imported here because spatial has no need for the catalogue
+        return TileIndex(list(self), bounds=[self.tile_bounds(position) for position in range(len(self))])
+
+
+# Parse a catalogue CSV file in one pass, validating every row.
+# The files are semicolon-delimited, but the 2022 export has broken nested quoting around the geometry
+# ("""coordinates""" and values split across comma columns). None of the values contain quotes or
+# semicolons of their own, so each line is split on semicolons once its quotes are removed, and the
+# coordinates are picked out of the Geom text with a pattern instead of a JSON parser.
+def parse_catalogue(csv_path):
+    with open(csv_path, 'r', encoding='utf-8-sig') as file:  # Open the catalogue, dropping the byte order mark
+        lines = file.read().splitlines()  # Read the whole file at once
+    if not lines:
+        raise CatalogueError(f"{csv_path} is empty")
+    header = [name.strip() for name in lines[0].replace('"', '').rstrip(',').split(';')]  # Column names from the header row
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    url_columns = [name for name in header if name.endswith('_URL')]
+    if missing or not url_columns:
+        raise CatalogueError(f"{csv_path}: missing columns {', '.join(missing or ['*_URL'])}")
+    name_index, geom_index, point_index = (header.index(column) for column in REQUIRED_COLUMNS)
+    url_indexes = [header.index(column) for column in url_columns]
+
+    names = []
+    urls = {column: [] for column in url_columns}
+    bounds = [array('d') for _ in range(4)]
+    centroids = [array('d'), array('d')]
+    offsets = array('q', [0])
+    coordinates = array('d')
+    for line_number, line in enumerate(lines[1:], start=2):
+        fields = line.replace('"', '').rstrip(',').split(';')  # Values of the row
+        if fields == ['']:  # Skip blank lines
+            continue
+        where = f"{csv_path}, line {line_number}"
+        if len(fields) != len(header):
+            raise CatalogueError(f"{where}: expected {len(header)} columns, found {len(fields)}")
+
+        name = fields[name_index].strip()
+        if not name:
+            raise CatalogueError(f"{where}: empty NAME")
+        row_urls = [fields[index].strip() for index in url_indexes]
+        for column, url in zip(url_columns, row_urls):
+            if not url.startswith(('http://', 'https://')) or not url.lower().endswith('.zip'):
+                raise CatalogueError(f"{where}: {column} is not a ZIP URL: {url!r}")
+
+        geom = fields[geom_index]
+        points = [(float(x), float(y)) for x, y in COORDINATE_PAIR.findall(geom)]
+        if 'Polygon' not in geom or len(points) < 4:
+            raise CatalogueError(f"{where}: Geom is not a polygon")
+        if not all(-180.0 <= x <= 180.0 and -90.0 <= y <= 90.0 for x, y in points):
+            raise CatalogueError(f"{where}: Geom has coordinates outside longitude/latitude range")
+        if points[0] != points[-1]:
+            points.append(points[0])  # Close the ring
+
+        try:
+            lat, lon = (float(value) for value in fields[point_index].split(','))
+        except ValueError:
+            raise CatalogueError(f"{where}: geo_point_2d is not 'LAT, LON': {fields[point_index]!r}")
+        min_x, max_x = min(x for x, _ in points), max(x for x, _ in points)
+        min_y, max_y = min(y for _, y in points), max(y for _, y in points)
+        if not (min_x - CENTROID_TOLERANCE <= lon <= max_x + CENTROID_TOLERANCE and min_y - CENTROID_TOLERANCE <= lat <= max_y + CENTROID_TOLERANCE):
+            raise CatalogueError(f"{where}: geo_point_2d lies outside the Geom footprint")
+
+        names.append(name)
+        for column, url in zip(url_columns, row_urls):
+            urls[column].append(url)
+        for column, value in zip(bounds, (min_x, min_y, max_x, max_y)):
+            column.append(value)
+        centroids[0].append(lat)
+        centroids[1].append(lon)
+        for x, y in points:
+            coordinates.append(x)
+            coordinates.append(y)
+        offsets.append(offsets[-1] + len(points))
+
+    if len(set(names)) != len(names):
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        raise CatalogueError(f"{csv_path}: duplicate tile names {', '.join(duplicates)}")
+    return Catalogue(names, urls, bounds, centroids, offsets, coordinates, source=csv_path)
+
+
+# Write a catalogue to its binary cache file, keyed on the CSV modification time and size
+def write_cache(catalogue, cache_path, stat):
+    text = json.dumps({
+        'names': catalogue.names,
+        'urls': catalogue.urls,
+        'points': len(catalogue.coordinates) // 2,
+        'byteorder': sys.byteorder,
+    }).encode('utf-8')
+    temporary_path = cache_path + '.tmp'
+    with open(temporary_path, 'wb') as file:
+        file.write(CACHE_HEADER.pack(CACHE_MAGIC, stat.st_mtime_ns, stat.st_size, len(text)))
+        file.write(text)
+        for column in catalogue.bounds + catalogue.centroids + [catalogue.offsets, catalogue.coordinates]:
+            column.tofile(file)  # Raw machine values, read back with fromfile
+    os.replace(temporary_path, cache_path)  # Swap it in atomically
+
+
+# Read a catalogue from its binary cache, or return None if the cache is missing or stale
+def read_cache(cache_path, stat, source=None):
+    try:
+        with open(cache_path, 'rb') as file:
+            magic, mtime_ns, size, text_length = CACHE_HEADER.unpack(file.read(CACHE_HEADER.size))
+            if magic != CACHE_MAGIC or mtime_ns != stat.st_mtime_ns or size != stat.st_size:  # Written for another version of the CSV
+                return None
+            meta = json.loads(file.read(text_length).decode('utf-8'))
+            count, points = len(meta['names']), meta['points']
+            columns = []
+            for typecode, length in [('d', count)] * 6 + [('q', count + 1), ('d', 2 * points)]:
+                column = array(typecode)
+                column.fromfile(file, length)  # Read the raw values
+                if meta['byteorder'] != sys.byteorder:
+                    column.byteswap()
+                columns.append(column)
+    except (OSError, EOFError, ValueError, KeyError, struct.error):  # A missing, truncated or foreign file is just rebuilt
+        return None
+    return Catalogue(meta['names'], meta['urls'], columns[0:4], columns[4:6], columns[6], columns[7], source=source)
+
+
+# Load a catalogue, from its binary cache when it is up to date, otherwise from the CSV (refreshing the cache)
+def load_catalogue(csv_path, use_cache=True):
+    stat = os.stat(csv_path)  # Modification time and size the cache is keyed on
+    cache_path = csv_path + CACHE_SUFFIX
+    if use_cache:
+        catalogue = read_cache(cache_path, stat, source=csv_path)
+        if catalogue is not None:
+            return catalogue
+    catalogue = parse_catalogue(csv_path)
+    if use_cache:
+        try:
+            write_cache(catalogue, cache_path, stat)
+        except OSError:  # A read-only data folder just means no cache
+            pass
+    return catalogue
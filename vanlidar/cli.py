@@ -0,0 +1,177 @@
+import argparse  # Import the argparse module for reading command line options
+import os  # Import the os module for exiting from the signal handler
+import signal  # Import the signal module for handling signals like SIGINT (Ctrl+C)
+
+from .datasets import DATASETS, get_dataset  # Years that can be downloaded
+from .downloader import Downloader  # Multi-year downloader
+from .engine import DEFAULT_CONNECT_TIMEOUT, DEFAULT_EXTRACT_WORKERS, DEFAULT_PER_HOST, DEFAULT_READ_TIMEOUT, DEFAULT_WORKERS  # Default pool sizes and timeouts
+from .gridding import DEFAULT_RESOLUTION, DTM_STATISTICS, GridBuilder, grid_available  # DSM, DTM and density rasters
+from .inventory import build_inventory  # Index of the point cloud tiles on disk
+from .laz import laz_available  # Check for the optional LAZ backend
+from .metrics import Metrics  # Stage timings and counters
+from .overviews import build_overviews, overviews_available  # Tiled GeoTIFFs with overview pyramids
+from .scheduler import DEFAULT_MIN_FREE, DEFAULT_RETRIES  # Default free disk space and number of retries
+from .spatial import BoundingBox, PointRadius, PolygonArea, parse_point  # Spatial tile selection
+
+
+# Build the command line parser
+def build_parser():
+    parser = argparse.ArgumentParser(prog='vanlidar', description='Download and extract the City of Vancouver LiDAR tiles (and the 2013 GeoTIFF tiles).')
+    parser.add_argument('--year', nargs='+', type=int, choices=sorted(DATASETS), default=sorted(DATASETS), help='years to download (default: all)')
+    parser.add_argument('--jobs', '-j', type=int, default=DEFAULT_WORKERS, help=f'number of tiles downloaded at the same time (default: {DEFAULT_WORKERS})')
+    parser.add_argument('--per-host', type=int, default=DEFAULT_PER_HOST, help=f'maximum connections to one host (default: {DEFAULT_PER_HOST})')
+    parser.add_argument('--data-dir', default='.', help='folder holding the lidar-20xx.csv files (default: current folder)')
+    parser.add_argument('--output-dir', default='.', help='folder the VanLidar20xx folders are created in (default: current folder)')
+    parser.add_argument('--no-stream', dest='streaming', action='store_false', help='save each ZIP file before extracting it, so every transfer can be resumed')
+    parser.add_argument('--extract-jobs', type=int, default=DEFAULT_EXTRACT_WORKERS, help=f'processes extracting saved ZIP files while the next ones download, 0 to extract on the download threads (default: {DEFAULT_EXTRACT_WORKERS})')
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES, help=f'times a failed tile is tried again, with exponential backoff, before it is given up for this run (default: {DEFAULT_RETRIES})')
+    parser.add_argument('--timeout', nargs=2, type=float, default=[DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT], metavar=('CONNECT', 'READ'),
+                        help=f'seconds to wait for a connection and between two reads (default: {DEFAULT_CONNECT_TIMEOUT} {DEFAULT_READ_TIMEOUT})')
+    parser.add_argument('--max-requests', type=float, metavar='PER_SECOND', help='limit the number of requests sent per second over all downloads')
+    parser.add_argument('--max-rate', type=float, metavar='MB_PER_SECOND', help='limit the total download speed in MB/s')
+    parser.add_argument('--min-free', type=float, default=DEFAULT_MIN_FREE / 1024 ** 3, metavar='GB',
+                        help=f'free disk space to keep: tiles wait while they would leave less, 0 to turn the check off (default: {DEFAULT_MIN_FREE / 1024 ** 3:g})')
+    parser.add_argument('--shard', action='store_true', help='write the tiles into one sub-folder per 10 km block (e.g. 480E_5450N), which keeps the folders small')
+    parser.add_argument('--laz', action='store_true', help='write the LAS files as compressed LAZ files while they are extracted (needs laspy[lazrs])')
+    parser.add_argument('--index', metavar='FILE', help='after the download, write a GeoJSON index of the LAS/LAZ tiles on disk (footprint, point format and count, scale/offset, XYZ range, density)')
+    parser.add_argument('--overviews', action='store_true', help='after the download, build tiled GeoTIFFs with overview pyramids and a mosaic.vrt in a cog sub-folder of each GeoTIFF folder (needs rasterio)')
+    parser.add_argument('--grid', action='store_true', help='build DSM, DTM and point density GeoTIFFs (and a mosaic.vrt of each) from the point cloud tiles as they download, '
+                                                              'in a grid sub-folder of each LiDAR folder (needs numpy and rasterio)')
+    parser.add_argument('--grid-resolution', type=float, default=DEFAULT_RESOLUTION, metavar='METRES', help=f'cell size of the --grid rasters (default: {DEFAULT_RESOLUTION:g})')
+    parser.add_argument('--dtm', choices=DTM_STATISTICS, default=DTM_STATISTICS[0], help='elevation of a DTM cell: the mean or the lowest of its ground points (default: mean)')
+    parser.add_argument('--update', action='store_true', help='ask the server (HEAD or conditional GET) which downloaded tiles have changed and download those again')
+    parser.add_argument('--metrics', metavar='FILE', help='append JSON-lines events (per-tile stage timings, bytes, retries, queue depths) to this file')
+    parser.add_argument('--prometheus', metavar='FILE', help='keep a Prometheus text file of the stage timings and counters up to date, e.g. for the node exporter textfile collector')
+    parser.add_argument('--verify', action='store_true', help='re-check the files on disk (sizes and SHA-256 digests) against the download manifests before downloading')
+    area = parser.add_mutually_exclusive_group()
+    area.add_argument('--bbox', nargs=4, type=float, metavar=('MIN_LON', 'MIN_LAT', 'MAX_LON', 'MAX_LAT'), help='only download tiles touching this longitude/latitude box')
+    area.add_argument('--polygon', metavar='FILE', help='only download tiles touching the polygons in this GeoJSON file')
+    area.add_argument('--point', metavar='LAT,LON', help='only download tiles within --radius metres of this point')
+    parser.add_argument('--radius', type=float, default=0.0, metavar='METRES', help='search radius around --point (default: 0, the tile containing the point)')
+    parser.add_argument('--yes', '-y', action='store_true', help='do not ask for confirmation before downloading')
+    return parser
+
+
+# Build the area selected with --bbox, --polygon or --point, or None for the whole city
+def selected_area(args):
+    if args.bbox:
+        return BoundingBox(*args.bbox)
+    if args.polygon:
+        return PolygonArea.from_geojson(args.polygon)
+    if args.point:
+        return PointRadius(*parse_point(args.point), radius=args.radius)
+    return None
+
+
+# Write the --index GeoJSON file of the point cloud tiles on disk, limited to the selected area
+def write_index(args, area=None):
+    inventory = build_inventory(args.year, output_dir=args.output_dir, data_dir=args.data_dir)
+    tiles = inventory.query(area) if area is not None else None
+    inventory.write_geojson(args.index, tiles)
+    print(f"Wrote {len(inventory) if tiles is None else len(tiles)} LAS/LAZ tiles to the index {args.index}")
+
+
+# Build the --overviews copies of the GeoTIFF folders of the selected years
+def write_overviews(args):
+    failed = 0
+    for year in args.year:
+        for product in get_dataset(year).products:
+            directory = product.directory(None, args.output_dir)  # Folder the GeoTIFF files were extracted to
+            if '.tif' in product.extensions and os.path.isdir(directory):
+                try:
+                    _, failures, _ = build_overviews(directory, workers=max(1, args.extract_jobs), echo=print)
+                except (OSError, ValueError) as e:  # e.g. a copy or the mosaic could not be read or written
+                    print(f"Could not build the overviews of {directory}: {e}")
+                    failed += 1
+                    continue
+                for path, message in failures.items():
+                    print(f"  {path}: {message}")
+                failed += len(failures)
+    return failed
+
+
+# Finish the --grid rasters and report the tiles that could not be gridded; returns their number
+def write_grids(gridder):
+    try:
+        _, failures, _ = gridder.finish()
+    finally:
+        gridder.close()
+    for path, message in failures.items():
+        print(f"  {path}: {message}")
+    return len(failures)
+
+
+# Entry point of "python -m vanlidar" and of the VanLidar20xx.py scripts
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)  # Parse the command line options
+    try:
+        area = selected_area(args)  # Area the download is limited to, if any
+    except (OSError, ValueError) as e:
+        parser.error(str(e))  # Report a bad --bbox, --polygon or --point and exit
+    if args.laz and not laz_available():
+        parser.error("--laz needs laspy with the lazrs backend: pip install laspy[lazrs]")
+    if args.overviews and not overviews_available():
+        parser.error("--overviews needs rasterio: pip install rasterio")
+    if args.grid and not grid_available():
+        parser.error("--grid needs numpy and rasterio: pip install numpy rasterio")
+    if args.grid_resolution <= 0:
+        parser.error("--grid-resolution must be greater than 0")
+    try:
+        metrics = Metrics(args.metrics, args.prometheus) if args.metrics or args.prometheus else None
+    except OSError as e:
+        parser.error(f"cannot write the metrics files: {e}")  # e.g. a read-only folder
+    gridder = GridBuilder(output_dir=args.output_dir, data_dir=args.data_dir, resolution=args.grid_resolution, workers=max(1, args.extract_jobs),
+                          dtm_statistic=args.dtm, echo=print) if args.grid else None
+    downloader = Downloader(output_dir=args.output_dir, data_dir=args.data_dir, jobs=args.jobs, per_host=args.per_host, streaming=args.streaming,
+                            extract_jobs=args.extract_jobs, retries=args.retries, timeout=tuple(args.timeout), requests_per_second=args.max_requests,
+                            bytes_per_second=args.max_rate * 1024 * 1024 if args.max_rate else None, laz=args.laz,
+                            min_free=args.min_free * 1024 ** 3 if args.min_free > 0 else None, shard=args.shard,
+                            metrics=metrics, gridder=gridder)
+    runs = downloader.prepare(args.year, verify=args.verify, area=area, update=args.update)  # Read the catalogues and cross-check the output folders
+    num_files = sum(len(run.urls) for run in runs)  # Number of tiles in the selected catalogues
+
+    # Prompt the user for a response, unless --yes was given
+    if not args.yes:
+        user_response = input(f"Do you want to proceed with downloading and extracting {num_files} files? (Y/y/N/n): ")  # Prompt the user for confirmation
+        if user_response.lower() not in ['y', 'yes']:  # If the user does not confirm
+            print("Skipping the download and extraction process.")
+            downloader.close()
+            status = 0
+            if args.index:
+                write_index(args, area)  # The files already on disk can still be indexed
+            if args.overviews and write_overviews(args):
+                status = 1
+            if gridder is not None:
+                gridder.watch(runs)  # The tiles already on disk can still be gridded
+                if write_grids(gridder):
+                    status = 1
+            return status
+
+    def signal_handler(sig, frame):
+        print("\nProcess terminated by user.")  # Print a message indicating that the process was terminated by the user
+        downloader.summarize(runs, ' before termination')  # Print the counts before termination
+        os._exit(0)  # Exit the program with status code 0
+
+    signal.signal(signal.SIGINT, signal_handler)  # Register the signal handler for SIGINT (Ctrl+C)
+
+    print("Initializing Downloading Process...")
+    try:
+        downloader.download(runs)  # Download every missing tile of every selected year
+        downloader.summarize(runs)  # Print the final counts and any tiles that failed
+        status = 1 if any(run.failures for run in runs) else 0
+    except Exception as e:
+        print(f"An error occurred: {str(e)}")  # Print an error message if an exception occurs
+        downloader.summarize(runs, ' before the error')  # Print the counts before the error
+        if gridder is not None:
+            gridder.close()
+        return 1
+    finally:
+        downloader.close()
+    if args.index:
+        write_index(args, area)  # Index the tiles once the manifests are closed
+    if args.overviews and write_overviews(args):  # Only GeoTIFF files that are new or changed are rebuilt
+        status = 1
+    if gridder is not None and write_grids(gridder):  # Blend the tiles still waiting and write the mosaics
+        status = 1
+    return status
@@ -0,0 +1,126 @@
+import copy  # Import the copy module for the LAZ and sharded variants of a product
+import os  # Import the os module for building paths
+import re  # Import the re module for reading the coordinates in tile names
+
+from .unzip import MemberFile  # Default writer of extracted members
+
+# Side (in metres) of the square blocks of tiles that share a folder in the sharded layout
+SHARD_SIZE = 10000
+
+# Easting and northing at the start of a tile NAME: '4830E_54540N' (2013, 2018; hundreds of metres) or '480000_5457000' (2022; metres)
+TILE_NAME = re.compile(r'(\d+)E?_(\d+)N?')
+
+
+# Return the shard folder of a tile: the SHARD_SIZE block its NAME falls in, named after the block's
+# south-west corner in kilometres, e.g. '480E_5450N' for both 4830E_54540N and 480000_5457000.
+# Names without coordinates go to 'other'.
+def tile_shard(name):
+    match = TILE_NAME.search(name or '')
+    if match is None:
+        return 'other'
+    easting, northing = int(match.group(1)), int(match.group(2))
+    if easting < 100000:  # Given in hundreds of metres
+        easting, northing = easting * 100, northing * 100
+    return f'{easting // SHARD_SIZE * SHARD_SIZE // 1000}E_{northing // SHARD_SIZE * SHARD_SIZE // 1000}N'
+
+
+# One downloadable series of a year (e.g. the 2013 LiDAR tiles or the 2013 GeoTIFF tiles).
+# It knows which catalogue column holds the ZIP URLs, where the extracted files go, and which files
+# every tile is expected to produce. With compress_las, .las members are recompressed to .laz while
+# they are extracted (see laz.LazFile), and .laz takes the place of .las in extensions. With sharded,
+# every folder holds one sub-folder per block of tiles (see tile_shard), and route and expected_paths
+# take the tile's shard.
+class Product:
+    def __init__(self, name, url_column, output_directory, extensions, subdirectories=None, keep_other_files=False, compress_las=False, sharded=False):
+        self.name = name  # Short label used in messages, e.g. 'LiDAR'
+        self.url_column = url_column  # Catalogue column holding the ZIP URLs
+        self.output_directory = output_directory  # Folder the tiles are extracted to
+        self.extensions = tuple(extensions)  # Extensions every tile must produce, in reporting order
+        self.subdirectories = dict(subdirectories or {})  # Extensions that go to a sub-folder of output_directory
+        self.keep_other_files = keep_other_files  # Extract members with other extensions to output_directory too
+        self.compress_las = compress_las  # Write .las members as .laz
+        self.sharded = sharded  # Split the folders into one sub-folder per block of tiles
+
+    # Return a copy of the product that writes its LAS files as LAZ files, or the product itself if it has none
+    def compressed(self):
+        if '.las' not in self.extensions:
+            return self
+        product = copy.copy(self)
+        product.extensions = tuple('.laz' if extension == '.las' else extension for extension in self.extensions)
+        product.compress_las = True
+        return product
+
+    # Return a copy of the product that writes every tile to the shard folder of its name
+    def shard(self):
+        product = copy.copy(self)
+        product.sharded = True
+        return product
+
+    # Return the folder files with the given extension are extracted to
+    def directory(self, extension, root='.'):
+        base = os.path.join(root, self.output_directory)  # Folder of the product under the output root
+        subdirectory = self.subdirectories.get(extension)  # Sub-folder for this extension, if any
+        return os.path.normpath(os.path.join(base, subdirectory) if subdirectory else base)
+
+    # Return every folder the product writes to
+    def directories(self, root='.'):
+        return [self.directory(None, root)] + [self.directory(extension, root) for extension in self.subdirectories]
+
+    # Return the folder a ZIP member is extracted to, or None to skip it. shard is the tile's shard folder, if sharded.
+    def route(self, member, root='.', shard=None):
+        extension = os.path.splitext(member)[1].lower()  # Extension of the member
+        if extension == '.las' and self.compress_las:
+            extension = '.laz'  # The member is written as a LAZ file
+        if extension in self.extensions or self.keep_other_files:  # If the member is wanted
+            directory = self.directory(extension, root)
+            return os.path.join(directory, shard) if self.sharded and shard else directory
+        return None
+
+    # Return the writer of an extracted member (see unzip.MemberFile): a LazFile for LAS members of a
+    # compressed product, a plain MemberFile otherwise. Passed as writer= to the extraction functions.
+    def member_writer(self, path, size=None):
+        if self.compress_las and os.path.splitext(path)[1].lower() == '.las':
+            from .laz import LazFile  # laspy is only imported when LAZ output is used
+            return LazFile(path, size)
+        return MemberFile(path, size)
+
+    # Return the files a tile is expected to produce, named after its ZIP file
+    def expected_paths(self, url, root='.', shard=None):
+        stem = os.path.splitext(os.path.basename(url))[0]  # ZIP file name without the extension
+        directories = [self.directory(extension, root) for extension in self.extensions]
+        if self.sharded and shard:
+            directories = [os.path.join(directory, shard) for directory in directories]
+        return [os.path.join(directory, stem + extension) for directory, extension in zip(directories, self.extensions)]
+
+
+# Everything the downloader needs to know about one year of the City's LiDAR data
+class Dataset:
+    def __init__(self, year, csv_file, products, source):
+        self.year = year  # Year the data was captured
+        self.csv_file = csv_file  # Catalogue exported from the Open Data Portal
+        self.products = list(products)  # Series downloaded for the year
+        self.source = source  # Open Data Portal page of the dataset
+
+
+# Descriptors of the three vintages published by the City of Vancouver
+DATASETS = {
+    2013: Dataset(2013, 'lidar-2013.csv', [
+        Product('LiDAR', 'LiDAR_URL', 'VanLidar2013', ['.las']),
+        Product('GeoTIFF', 'GeoTIFF_URL', 'VanGeoTiff2013', ['.tif', '.tfw']),
+    ], 'https://opendata.vancouver.ca/explore/dataset/lidar-2013/'),
+    2018: Dataset(2018, 'lidar-2018.csv', [
+        Product('LiDAR', 'LiDAR_URL', 'VanLidar2018', ['.prj', '.las'], subdirectories={'.prj': 'prj'}, keep_other_files=True),
+    ], 'https://opendata.vancouver.ca/explore/dataset/lidar-2018/'),
+    2022: Dataset(2022, 'lidar-2022.csv', [
+        Product('LiDAR', 'LiDAR_URL', 'VanLidar2022', ['.las', '.lasx'], subdirectories={'.lasx': 'lasx'}, keep_other_files=True),
+    ], 'https://opendata.vancouver.ca/explore/dataset/lidar-2022/'),
+}
+
+
+# Return the descriptor of a year, raising ValueError for years the City has not published
+def get_dataset(year):
+    try:
+        return DATASETS[int(year)]
+    except (KeyError, ValueError):
+        raise ValueError(f"No LiDAR dataset for {year}; available years are {', '.join(map(str, sorted(DATASETS)))}")
+
@@ -0,0 +1,593 @@
+import os  # Import the os module for file and directory operations
+import time  # Import the time module for measuring throughput
+from collections import Counter, namedtuple  # Import Counter for the update check and namedtuple for the ZIP files waiting to be extracted
+from functools import partial  # Import partial to bind routing rules to an output folder
+
+import requests  # Import the requests module for catching dropped connections
+from tqdm import tqdm  # Import the tqdm module for progress bars
+
+from .catalogue import load_catalogue  # Catalogue loading
+from .datasets import get_dataset, tile_shard  # Dataset descriptors and the sharded layout
+from .engine import DEFAULT_CONNECT_TIMEOUT, DEFAULT_EXTRACT_WORKERS, DEFAULT_PER_HOST, DEFAULT_READ_TIMEOUT, DEFAULT_WORKERS, DownloadEngine, ExtractionPool  # Concurrent download and extraction
+from .laz import laz_available  # Check for the optional LAZ backend
+from .manifest import MANIFEST_NAME, STATUS_CHANGED, STATUS_COMPLETE, STATUS_FAILED, Manifest  # Download manifest
+from .metrics import Metrics, stage_timer  # Per-stage timings, counters and their exports
+from .scheduler import DEFAULT_MIN_FREE, DEFAULT_RETRIES, DiskBudget, Reservation, RetryPolicy, WorkQueue, is_fatal  # Retries, disk space and the work queue
+from .transfer import CONTENT_RANGE, IncompleteDownloadError, ResponseStream, download_resumable, has_partial, response_state  # Resumable downloads
+from .unzip import StreamProgress, StreamTruncatedError, StreamZipError, central_directory_sizes, extract_and_remove, extract_timed, stream_extract  # ZIP extraction
+
+# Bytes in a megabyte, for the MB/s figures
+MEGABYTE = 1024 * 1024
+
+# A downloaded ZIP file handed to the extraction pool, with the transfer details for the manifest
+# and the disk space reserved for its files, given back once it is extracted
+SavedArchive = namedtuple('SavedArchive', ['path', 'transfer', 'reservation'], defaults=[None])
+
+# One attempt at a tile: attempt counts from 0
+TileJob = namedtuple('TileJob', ['run', 'url', 'attempt'])
+
+# A tile attempt that raised an error, handed back to the main thread instead of stopping the run
+TileFailure = namedtuple('TileFailure', ['error'])
+
+# Status codes of servers that do not allow HEAD requests
+HEAD_NOT_ALLOWED = (405, 501)
+
+# Seconds between two samples of the queue depths
+QUEUE_SAMPLE_INTERVAL = 1.0
+
+# Bytes asked for from the end of a ZIP file to read its central directory, which lists the size of every member
+TAIL_PROBE_SIZE = 64 * 1024
+
+# Ratio of extracted size to ZIP size assumed when the central directory cannot be read (no Range support)
+ZIP_EXPANSION_ESTIMATE = 4.0
+
+
+# Compare a manifest record with the size and validators the server sends now. The strongest validator
+# both sides have decides: ETag, then Last-Modified, then size. Returns True if the tile changed, False
+# if not, and None if there is nothing to compare (e.g. files adopted from disk).
+def tile_changed(record, state):
+    if record.get('etag') and state['etag']:
+        return record['etag'] != state['etag']
+    if record.get('last_modified') and state['last_modified']:
+        return record['last_modified'] != state['last_modified']
+    if record.get('size') is not None and state['size'] is not None:
+        return record['size'] != state['size']
+    return None
+
+
+# State of one product (e.g. the 2018 LiDAR tiles) during a run: its URLs, manifest and counters
+class ProductRun:
+    def __init__(self, dataset, product, root, urls, manifest, names=None):
+        self.dataset = dataset  # Year descriptor
+        self.product = product  # Product descriptor
+        self.root = root  # Output root folder
+        self.urls = urls  # URL of every tile in the catalogue
+        self.names = names or {}  # URL -> tile NAME from the catalogue, for the sharded layout
+        self.manifest = manifest  # Manifest of the product's output folder
+        self.pending = []  # URLs whose files are still missing
+        self.downloaded_count = 0  # Number of downloaded ZIP files
+        self.uncompressed_count = {extension: 0 for extension in product.extensions}  # Number of extracted files of each extension
+        self.removed_count = 0  # Number of removed ZIP files
+        self.retried_count = 0  # Number of attempts that failed and were queued again
+        self.failures = {}  # URL -> error message of the tiles that failed permanently
+
+    @property
+    def label(self):
+        return f"{self.dataset.year} {self.product.name}"  # e.g. '2013 GeoTIFF'
+
+    @property
+    def directory(self):
+        return self.product.directory(None, self.root)  # Output folder of the product
+
+    # Return the shard folder of a tile (see datasets.tile_shard), or None if the product is not sharded
+    def shard(self, url):
+        if not self.product.sharded:
+            return None
+        return tile_shard(self.names.get(url) or os.path.splitext(os.path.basename(url))[0])
+
+    # Return the routing rules of a tile's members; a partial, so it can be sent to an extraction process
+    def route(self, url):
+        return partial(self.product.route, root=self.root, shard=self.shard(url))
+
+    # Return the files a tile is expected to produce
+    def expected_paths(self, url):
+        return self.product.expected_paths(url, self.root, self.shard(url))
+
+    # Return the number of files of each extension recorded in the manifest
+    def totals(self):
+        return {extension: self.manifest.count(extension) for extension in self.product.extensions}
+
+
+# Downloads one or more years of LiDAR tiles through a single shared connection pool and scheduler.
+# ZIP files that are saved to disk (--no-stream, or when streaming fails) are extracted by a separate
+# pool of extract_jobs processes while the next tiles download; with extract_jobs=0 they are extracted
+# on the download thread. Each tile reserves the disk space it will need before it starts, and waits
+# while that would leave less than min_free bytes free (None turns the check off; see DiskBudget).
+# shard=True writes the tiles into one sub-folder per 10 km block (see datasets.tile_shard), which
+# keeps the folders small enough to list quickly. gridder (a gridding.GridBuilder) is handed every
+# point cloud tile as it finishes, so its rasters are built while the download goes on. Typical use from Python:
+#     with Downloader(output_dir='data', jobs=8) as downloader:
+#         runs = downloader.prepare([2018, 2022])
+#         downloader.download(runs)
+class Downloader:
+    def __init__(self, output_dir='.', data_dir='.', jobs=DEFAULT_WORKERS, per_host=DEFAULT_PER_HOST, streaming=True, echo=print, engine=None,
+                 extract_jobs=DEFAULT_EXTRACT_WORKERS, extract_queue=None, retries=DEFAULT_RETRIES, timeout=(DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT),
+                 requests_per_second=None, bytes_per_second=None, laz=False, metrics=None, min_free=DEFAULT_MIN_FREE, shard=False,
+                 gridder=None):
+        self.output_dir = output_dir  # Folder the VanLidar20xx folders are created in
+        self.data_dir = data_dir  # Folder holding the lidar-20xx.csv catalogues
+        self.streaming = streaming  # Extract ZIP files while they download
+        self.echo = echo or (lambda *args, **kwargs: None)  # Function used for messages (print, or None for silence)
+        self.engine = engine or DownloadEngine(max_workers=jobs, max_per_host=per_host, timeout=timeout,
+                                               requests_per_second=requests_per_second, bytes_per_second=bytes_per_second)  # Shared concurrent download engine
+        self.extractor = ExtractionPool(extract_jobs, extract_queue) if extract_jobs else None  # Process pool extracting saved ZIP files
+        self.retry = RetryPolicy(retries)  # When failed tiles are tried again
+        self.laz = laz  # Recompress LAS members to LAZ while they are extracted
+        self.metrics = metrics or Metrics()  # Stage timings and counters, exported if the Metrics was given file paths
+        self.disk = DiskBudget(min_free) if min_free is not None else None  # Disk space shared out between the tiles in flight
+        self.shard = shard  # Write the tiles into one sub-folder per block
+        self.gridder = gridder  # Builds rasters from the point cloud tiles as they finish, or None
+        if laz and not laz_available():
+            raise RuntimeError("--laz needs laspy with the lazrs backend: pip install laspy[lazrs]")
+        self._manifests = {}  # Open manifests, keyed by output folder
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Return the manifest of an output folder, opening it the first time
+    def manifest(self, directory):
+        if directory not in self._manifests:
+            os.makedirs(directory, exist_ok=True)  # Create the output folder if it doesn't exist
+            self._manifests[directory] = Manifest(os.path.join(directory, MANIFEST_NAME))
+        return self._manifests[directory]
+
+    # Read the catalogues of the given years and work out which tiles still need downloading.
+    # area (a BoundingBox, PolygonArea or PointRadius from vanlidar.spatial) limits the run to the tiles it touches,
+    # and products (names such as 'LiDAR') to some of the products of each year. update=True also asks the
+    # server which downloaded tiles have changed and queues them again (see check_updates).
+    def prepare(self, years, verify=False, area=None, products=None, update=False):
+        runs = []  # One ProductRun per product of every year
+        os.makedirs(self.output_dir, exist_ok=True)  # Create the output root if it doesn't exist
+        for year in years:
+            dataset = get_dataset(year)  # Look up the year's descriptor
+            catalogue = load_catalogue(os.path.join(self.data_dir, dataset.csv_file))  # Every tile of the year's catalogue
+            positions = range(len(catalogue))
+            if area is not None:
+                positions = [catalogue.position(tile.name) for tile in catalogue.index().query(area)]  # Tiles whose footprint touches the area
+                self.echo(f"Selected {len(positions)} of {len(catalogue)} {dataset.year} tiles in the requested area.")
+            for product in dataset.products:
+                if products is not None and product.name not in products:
+                    continue
+                if self.laz:
+                    product = product.compressed()  # Write the LAS files as LAZ files
+                if self.shard:
+                    product = product.shard()  # Write every tile into the folder of its block
+                column = catalogue.urls[product.url_column]
+                urls = [column[position] for position in positions]  # URL of every selected tile
+                names = {column[position]: catalogue.names[position] for position in positions}  # Tile name of every URL
+                self.echo(f"{len(urls)} {product.name} URLs read from {dataset.csv_file}")
+                for directory in product.directories(self.output_dir):
+                    os.makedirs(directory, exist_ok=True)  # Create the output directories if they don't exist
+                run = ProductRun(dataset, product, self.output_dir, urls, self.manifest(product.directory(None, self.output_dir)), names)
+                self.cross_check(run, verify)  # Find the missing tiles
+                runs.append(run)
+        if update:
+            self.check_updates(runs)  # Find the tiles that changed on the server
+        return runs
+
+    # Compare the catalogue with the manifest and fill run.pending with the tiles that are missing files.
+    # verify=True re-checks every recorded file on disk, including its SHA-256 digest.
+    def cross_check(self, run, verify=False):
+        product = run.product
+        if verify or not run.manifest.existed:  # Check the disk when asked to, or the first time the manifest is used
+            self.echo(f"Verifying the {run.label} files on disk against the download manifest{' (with checksums)' if verify else ''}...")
+            started = time.perf_counter()
+            adopted_count, missing_count = run.manifest.verify(run.urls, run.expected_paths, checksums=verify)
+            self.metrics.event('verify', year=run.dataset.year, product=run.product.name, checksums=verify, adopted=adopted_count, missing=missing_count,
+                               seconds=round(time.perf_counter() - started, 3))
+            self.echo(f"{adopted_count} ZIP files found on disk were added to the manifest and {missing_count} ZIP files have missing or changed files.")
+
+        self.echo(f"Cross-checking {', '.join(product.extensions)} files to see how many already exist...")
+        skipped_count = {extension: 0 for extension in product.extensions}  # Files already on disk
+        run.pending = []
+        for url in run.urls:
+            file_name = os.path.basename(url)  # Tiles are keyed by their ZIP file name
+            present = [run.manifest.has_extension(file_name, extension) for extension in product.extensions]
+            for extension, found in zip(product.extensions, present):
+                skipped_count[extension] += found  # Count the files that already exist
+            if not all(present):  # If any of the files are missing
+                run.pending.append(url)  # Queue the tile for downloading
+        self.echo(f"Cross-checking {run.label} URLs to the {run.directory} folder Completed.")
+        for extension in product.extensions:
+            self.echo(f"{skipped_count[extension]} {extension} files already exist.")
+            self.echo(f"{len(run.urls) - skipped_count[extension]} {extension} files are missing.")
+        return run.pending
+
+    # Ask the server whether a downloaded tile has changed since it was recorded; runs on a worker thread.
+    # job is (run, url, manifest record). A HEAD request is sent; servers that do not allow HEAD get a GET
+    # with If-None-Match/If-Modified-Since instead, whose body is never read. Returns (changed, state), where
+    # changed is as in tile_changed and state holds the server's size and validators, or a TileFailure.
+    def check_tile(self, job):
+        _, url, record = job
+        try:
+            with self.engine.host_slot(url):
+                with self.engine.head(url) as response:
+                    if response.status_code not in HEAD_NOT_ALLOWED:
+                        response.raise_for_status()
+                        state = response_state(response)
+                        return tile_changed(record, state), state
+                headers = {'Accept-Encoding': 'identity'}  # Validators of the raw file, as for the downloads
+                if record.get('etag'):
+                    headers['If-None-Match'] = record['etag']
+                if record.get('last_modified'):
+                    headers['If-Modified-Since'] = record['last_modified']
+                with self.engine.get(url, headers=headers) as response:  # Closed without reading the body
+                    if response.status_code == 304:  # Not modified
+                        return False, {'etag': record.get('etag'), 'last_modified': record.get('last_modified'), 'size': record.get('size')}
+                    response.raise_for_status()
+                    state = response_state(response)
+                    return tile_changed(record, state), state
+        except requests.RequestException as error:
+            return TileFailure(error)
+
+    # Check every downloaded tile of the runs against the server in parallel, through the shared engine.
+    # Changed tiles are marked as such in the manifest and queued in run.pending, so they are downloaded
+    # again (also by a later run if this one stops). Tiles recorded without validators get the server's
+    # current ones, so the next update can compare them. Only headers are transferred.
+    def check_updates(self, runs):
+        jobs = [(run, url, run.manifest.get(os.path.basename(url))) for run in runs for url in run.urls if run.manifest.is_complete(os.path.basename(url))]
+        if not jobs:
+            return Counter()
+        self.echo(f"Checking {len(jobs)} downloaded tiles on the server for changes...")
+        counts = Counter()
+        for (run, url, _), result in self.engine.run(self.check_tile, jobs):
+            tile = os.path.basename(url)
+            if isinstance(result, TileFailure):
+                response = getattr(result.error, 'response', None)
+                counts['gone' if response is not None and response.status_code in (404, 410) else 'unchecked'] += 1
+                continue
+            changed, state = result
+            if changed:
+                run.manifest.update(tile, status=STATUS_CHANGED)  # The files on disk are out of date
+                run.pending.append(url)  # Download the tile again
+                counts['changed'] += 1
+            elif changed is None:
+                run.manifest.update(tile, size=state['size'], etag=state['etag'], last_modified=state['last_modified'])  # Remember what the server has now
+                counts['recorded'] += 1
+            else:
+                counts['unchanged'] += 1
+        self.echo(f"{counts['changed']} tiles changed on the server and will be downloaded again, {counts['unchanged']} are unchanged.")
+        if counts['recorded']:
+            self.echo(f"{counts['recorded']} tiles had no ETag, Last-Modified or size to compare with; the server's current ones were recorded.")
+        if counts['gone'] or counts['unchecked']:
+            self.echo(f"{counts['gone']} tiles are no longer on the server and {counts['unchecked']} could not be checked; their files were kept.")
+        return counts
+
+    # Ask the server for the last TAIL_PROBE_SIZE bytes of a ZIP file; runs on a worker thread. Returns (size,
+    # members): the size of the whole file and [(name, size)] from its central directory, or None for what the
+    # server did not tell. A server that ignores the Range header is not read from; only its Content-Length is kept.
+    def probe_zip(self, url):
+        headers = {'Range': f'bytes=-{TAIL_PROBE_SIZE}', 'Accept-Encoding': 'identity'}  # Suffix range: the end of the file, however long it is
+        try:
+            with self.engine.host_slot(url), self.engine.get(url, headers=headers) as response:
+                response.raise_for_status()
+                if response.status_code != 206:  # The whole file is coming; close the connection unread
+                    return response_state(response)['size'], None
+                match = CONTENT_RANGE.match(response.headers.get('Content-Range', ''))
+                if match is None or match.group(3) == '*':
+                    return None, None
+                size = int(match.group(3))
+                return size, central_directory_sizes(response.content, size)
+        except requests.RequestException:  # The download itself will retry or report it
+            return None, None
+
+    # Reserve the disk space a tile will take before it starts (see DiskBudget): the size of the members the
+    # product keeps, from the ZIP file's central directory, and the ZIP file itself when it is saved first.
+    # Without a central directory the extracted size is estimated from the ZIP size, and without either
+    # nothing can be reserved. Returns (Reservation, ZIP size): the reservation is empty when the check is
+    # turned off, and the size (None when unknown) lets a streamed tile grow it if the ZIP file is saved after all.
+    def reserve_space(self, run, url, route, saved):
+        if self.disk is None:
+            return Reservation(None, None, 0), None
+        size, members = self.probe_zip(url)
+        if members is not None:
+            needed = sum(member_size for name, member_size in members if not name.endswith('/') and route(name) is not None)
+        else:
+            needed = int((size or 0) * ZIP_EXPANSION_ESTIMATE)
+        if saved:
+            needed += size or 0
+        return self.disk.reserve(run.directory, needed, self.engine.wait_until), size
+
+    # Stream one tile: extract its members straight from the download (see stream_extract) and return
+    # (transfer state, members). When the connection drops after some members were written, the rest of the
+    # file is asked for with a Range request from the first member not yet extracted, guarded by If-Range like
+    # download_resumable, for as long as each attempt gets at least one more member through. Errors that
+    # leave nothing to resume from (or a server that ignores the range) are raised for the caller to handle.
+    # The time spent waiting for the socket is added to stages['transfer'] and the rest of the pass to
+    # 'extract' and 'verify'.
+    def stream_tile(self, url, route, writer, stages):
+        progress = StreamProgress()  # Where the extraction has got to
+        transfer = None  # Size and validators of the file, from the first response
+        received = 0  # Bytes received over all the attempts
+        while True:
+            offset = progress.offset  # First byte of the file this attempt asks for
+            headers = {'Accept-Encoding': 'identity'}  # Ask for the raw bytes so byte offsets match the file on the server
+            if offset:
+                headers['Range'] = f'bytes={offset}-'  # Only ask for the members still missing
+                validator = transfer['etag'] or transfer['last_modified']
+                if validator:
+                    headers['If-Range'] = validator  # The server sends the whole file if it has changed
+            try:
+                with self.engine.host_slot(url), self.engine.get(url, headers=headers) as response:  # Wait for a free connection slot and send a GET request
+                    if offset:
+                        match = CONTENT_RANGE.match(response.headers.get('Content-Range', ''))  # Range actually sent by the server
+                        etag = response.headers.get('ETag')
+                        if response.status_code != 206 or match is None or int(match.group(1)) != offset or (transfer['etag'] and etag != transfer['etag']):
+                            raise StreamZipError(f"{url} cannot be resumed from byte {offset}")  # The file changed or the range was ignored
+                    else:
+                        transfer = response_state(response)  # Keep the size, ETag and Last-Modified sent by the server
+                    stream = ResponseStream(response, throttle=self.engine.throttle)  # Read the body in adaptive chunks, within the bandwidth limit
+                    extract_reads = None  # Part of the extraction spent waiting for data
+                    try:
+                        with stage_timer(stages, 'extract'):
+                            stream_extract(stream, route, writer, progress)  # Extract the files straight from the download
+                        extract_reads = stream.read_seconds
+                        with stage_timer(stages, 'verify'):
+                            stream.drain()  # Read the central directory too, so the whole body is counted
+                    except StreamTruncatedError:  # Other StreamZipErrors (bad CRC, unstreamable member) go straight to the saved-ZIP fallback
+                        if transfer['size'] is not None and offset + stream.bytes_read < transfer['size']:  # The body was cut off in the middle of a member
+                            raise IncompleteDownloadError(f"Received {offset + stream.bytes_read} of {transfer['size']} bytes of {url}")
+                        raise
+                    finally:  # Move the waits for the socket to the transfer stage, even for an attempt that dropped
+                        extract_reads = stream.read_seconds if extract_reads is None else extract_reads
+                        received += stream.bytes_read
+                        stages['transfer'] = stages.get('transfer', 0.0) + stream.read_seconds
+                        stages['extract'] -= extract_reads
+                        stages['verify'] = stages.get('verify', 0.0) - (stream.read_seconds - extract_reads)
+                    if transfer['size'] is not None and offset + stream.bytes_read != transfer['size']:  # Compare with the declared length
+                        raise IncompleteDownloadError(f"Received {offset + stream.bytes_read} of {transfer['size']} bytes of {url}")
+            except (IncompleteDownloadError, requests.RequestException):
+                if progress.offset == offset:  # Nothing more was extracted, so trying again would not get further
+                    raise
+                continue  # Carry on from the first member not yet extracted
+            transfer['received'] = received
+            return transfer, progress.members
+
+    # Download and extract one tile, record it in the manifest and return the extracted members.
+    # With defer_extraction=True a ZIP file that had to be saved is not extracted here; a SavedArchive
+    # is returned instead, to be extracted by extract_and_remove and recorded with record_tile, which
+    # carries the tile's disk reservation so it can be given back once the extraction ends.
+    # The seconds spent in each stage (see metrics.STAGES) are kept in transfer['stages']; for a streamed
+    # tile the time spent waiting for the socket counts as transfer and the rest of the pass as extraction.
+    def download_tile(self, run, url, defer_extraction=False):
+        file_name = os.path.basename(url)  # Extract the file name from the URL
+        zip_file_path = os.path.join(run.directory, file_name)  # Where the ZIP file is saved when it is not streamed
+        route = run.route(url)  # Routing rules of the product
+        writer = run.product.member_writer  # Writes each member, compressing LAS members with --laz
+        streaming = self.streaming and not (run.product.compress_las and defer_extraction)  # Compression is CPU-bound, so it belongs in the extraction pool
+        streaming = streaming and not has_partial(zip_file_path)  # Extract while downloading, unless a partial download is waiting
+
+        reservation, zip_size = self.reserve_space(run, url, route, saved=not streaming)  # Wait for room on the disk
+        deferred = False  # True once the reservation is handed to the extraction pool
+        try:
+            started = time.perf_counter()  # Start of the transfer, for the throughput figure
+            self.engine.request_timings()  # Time the connections of this tile from here
+            stages = {}  # Seconds spent in each stage
+            members = None  # Initialize the list of extracted files
+            if streaming:
+                try:
+                    transfer, members = self.stream_tile(url, route, writer, stages)  # Extract the files straight from the download
+                except (StreamZipError, IncompleteDownloadError, requests.RequestException):  # If the ZIP file cannot be streamed, is incomplete or the connection dropped
+                    members = None  # Fall back to a resumable download of the ZIP file
+                    stages = {}  # Only the fallback's stages are reported; its connections include the failed attempt's
+                    reservation.grow(run.directory, zip_size or 0, self.engine.wait_until)  # The ZIP file is saved after all, so it needs room too
+            stages['disk_wait'] = reservation.waited
+
+            if members is None:  # If the ZIP file has not been extracted yet
+                with stage_timer(stages, 'transfer'):
+                    transfer = download_resumable(self.engine, url, zip_file_path)  # Download the ZIP file, resuming a partial download
+                transfer['seconds'] = round(time.perf_counter() - started, 3)  # Time spent on the transfer alone
+                transfer['streamed'] = False
+                transfer['stages'] = stages
+                stages.update(self.engine.request_timings())
+                stages['transfer'] = max(0.0, stages['transfer'] - stages['connect'] - stages['first_byte'])  # Leave the body
+                if defer_extraction:
+                    deferred = True
+                    return SavedArchive(zip_file_path, transfer, reservation)  # Leave the extraction to the pool
+                members = extract_and_remove(zip_file_path, route, transfer['size'], writer, stages)  # Check, extract and remove the ZIP file
+            else:
+                transfer['seconds'] = round(time.perf_counter() - started, 3)  # Time spent on the transfer and extraction
+                transfer['streamed'] = True
+                transfer['stages'] = stages
+                stages.update(self.engine.request_timings())
+        finally:
+            if not deferred:
+                reservation.release()  # The files are written (or the tile failed)
+
+        self.record_tile(run, url, transfer, members)
+        return members
+
+    # Record a finished tile in its product's manifest, with the transfer size and time, and report it to the metrics
+    def record_tile(self, run, url, transfer, members):
+        stages = transfer.setdefault('stages', {})
+        with stage_timer(stages, 'record'):
+            run.manifest.record(os.path.basename(url), STATUS_COMPLETE, url=url, size=transfer['size'], etag=transfer['etag'], last_modified=transfer['last_modified'],
+                                members=members, received=transfer['received'], seconds=transfer['seconds'])
+        written = sum(member.size for member in members)  # Bytes of extracted files
+        self.metrics.observe(stages)
+        self.metrics.increment('vanlidar_tiles_total', year=run.dataset.year, product=run.product.name, status='complete')
+        self.metrics.increment('vanlidar_bytes_received_total', transfer['received'] or 0, year=run.dataset.year, product=run.product.name)
+        self.metrics.increment('vanlidar_bytes_written_total', written, year=run.dataset.year, product=run.product.name)
+        self.metrics.event('tile', year=run.dataset.year, product=run.product.name, tile=os.path.basename(url), status=STATUS_COMPLETE,
+                           streamed=transfer.get('streamed'), received=transfer['received'], written=written, files=len(members),
+                           seconds=transfer['seconds'], stages={stage: round(seconds, 4) for stage, seconds in stages.items()})
+
+    # Run one attempt at a tile on a worker thread (retries only reach it once their backoff is over, see
+    # WorkQueue). Errors that concern only this tile are handed back as a TileFailure; errors about the
+    # machine (e.g. a full disk) still stop the run.
+    def attempt_tile(self, job):
+        try:
+            return self.download_tile(job.run, job.url, defer_extraction=self.extractor is not None)
+        except Exception as error:
+            if is_fatal(error):
+                raise
+            return TileFailure(error)
+
+    # Download every pending tile of the given runs through the shared engine.
+    # Saved ZIP files go to the extraction pool; when it is full, the main thread waits for an extraction
+    # to finish before taking more downloads, which also holds back the download workers.
+    # A tile that fails is queued again after a backoff delay (see RetryPolicy) while the other tiles carry
+    # on; once it runs out of attempts it is recorded as failed in the manifest and in run.failures.
+    # Counters are updated on the calling thread as each tile finishes, and the progress bar shows the
+    # throughput of the last tile and of the whole run in MB/s.
+    def download(self, runs, progress=True):
+        queue = WorkQueue(TileJob(run, url, 0) for run in runs for url in run.pending)  # One job per missing tile, over all products
+        total = sum(len(run.urls) for run in runs)  # Number of tiles in all the catalogues
+        progress_bar = tqdm(total=total, initial=total - len(queue), unit='file', desc='Overall Progress', leave=False, disable=not progress)  # Create a progress bar for the overall process
+        started = time.perf_counter()  # Start of the run, for the overall throughput
+        received = 0  # Bytes downloaded in this run
+        extractor = self.extractor
+
+        def postfix(tile_rate=None):
+            downloaded = sum(r.downloaded_count for r in runs)
+            uncompressed = sum(sum(r.uncompressed_count.values()) for r in runs)
+            removed = sum(r.removed_count for r in runs)
+            text = f"{downloaded} ZIP files Downloaded, {uncompressed} files Uncompressed, {removed} ZIP files Removed"
+            if tile_rate is not None:
+                overall_rate = received / MEGABYTE / max(time.perf_counter() - started, 0.001)
+                text += f", {tile_rate:.1f} MB/s last tile, {overall_rate:.1f} MB/s overall"
+            retried = sum(r.retried_count for r in runs)
+            failed = sum(len(r.failures) for r in runs)
+            if retried or failed:
+                text += f", {retried} retried, {failed} failed"
+            progress_bar.set_postfix_str(text)  # Update the progress bar with the counts and rates
+
+        def finished(run, url, members):
+            nonlocal received
+            run.downloaded_count += 1  # Increment the count of downloaded ZIP files
+            run.removed_count += 1  # Increment the count of removed (or never written) ZIP files
+            for member in members:
+                extension = os.path.splitext(member.path)[1].lower()  # .laz for LAS members written with --laz
+                if extension in run.uncompressed_count:
+                    run.uncompressed_count[extension] += 1  # Increment the count of extracted files
+            record = run.manifest.get(os.path.basename(url))  # Transfer size and time of the tile
+            received += record['received']
+            postfix(record['received'] / MEGABYTE / max(record['seconds'], 0.001))
+            progress_bar.update(1)  # Update the progress bar by one unit
+            if self.gridder is not None:
+                self.gridder.tile_finished(run, url, members)  # Grid the tile, and blend it once its neighbours are in
+
+        def failed(job, error):
+            message = f"{type(error).__name__}: {error}"
+            labels = {'year': job.run.dataset.year, 'product': job.run.product.name}
+            if self.retry.should_retry(error, job.attempt):  # Queue the tile again after a backoff delay
+                delay = self.retry.delay(job.attempt, error)
+                queue.push(job._replace(attempt=job.attempt + 1), not_before=time.monotonic() + delay)  # Held back in the queue, not on a worker
+                job.run.retried_count += 1
+                self.metrics.increment('vanlidar_retries_total', **labels)
+                self.metrics.event('retry', tile=os.path.basename(job.url), attempt=job.attempt + 1, delay=round(delay, 3), error=message, **labels)
+            else:  # Out of attempts, or an error that will not go away
+                job.run.failures[job.url] = message
+                job.run.manifest.record(os.path.basename(job.url), STATUS_FAILED, url=job.url, error=message, attempts=job.attempt + 1)
+                self.metrics.increment('vanlidar_tiles_total', status=STATUS_FAILED, **labels)
+                self.metrics.event('tile', tile=os.path.basename(job.url), status=STATUS_FAILED, attempts=job.attempt + 1, error=message, **labels)
+                progress_bar.update(1)
+            postfix()
+
+        def extracted(results):
+            for (job, transfer), result in results:  # Tiles the extraction pool has finished
+                if isinstance(result, BaseException):
+                    if is_fatal(result):
+                        raise result
+                    failed(job, result)
+                else:
+                    members, timings = result
+                    transfer['stages'].update(timings)  # Verify, extract and cleanup, timed in the worker process
+                    self.record_tile(job.run, job.url, transfer, members)
+                    finished(job.run, job.url, members)
+
+        sampled = 0.0  # time.monotonic() of the last queue sample
+
+        def sample_queues(force=False):
+            nonlocal sampled
+            if not force and time.monotonic() - sampled < QUEUE_SAMPLE_INTERVAL:
+                return
+            sampled = time.monotonic()
+            depths = {'waiting': len(queue), 'downloading': self.engine.active, 'extracting': len(extractor) if extractor is not None else 0,
+                      'waiting_for_disk': self.disk.waiting if self.disk is not None else 0}
+            for name, depth in depths.items():
+                self.metrics.set('vanlidar_queue_depth', depth, queue=name)
+            self.metrics.event('queues', **depths)
+            self.metrics.flush()  # Rewrite the Prometheus file if it is due
+
+        if self.gridder is not None:
+            self.gridder.watch(runs)  # Tiles already on disk are gridded straight away; neighbours wait for the pending ones
+        self.metrics.set('vanlidar_workers', self.engine.max_workers, pool='download')
+        self.metrics.set('vanlidar_workers', extractor.max_workers if extractor is not None else 0, pool='extract')
+        self.metrics.event('run_start', tiles=len(queue), total=total, workers=self.engine.max_workers,
+                           extract_workers=extractor.max_workers if extractor is not None else 0, streaming=self.streaming)
+
+        try:
+            while len(queue) or (extractor is not None and len(extractor)):  # Until no tile is waiting or being retried
+                for job, result in self.engine.run(self.attempt_tile, queue):  # Iterate over the finished attempts
+                    if isinstance(result, TileFailure):
+                        failed(job, result.error)
+                    elif isinstance(result, SavedArchive):  # The ZIP file still has to be extracted
+                        while extractor.full:  # Keep the number of ZIP files waiting on disk bounded
+                            extracted(extractor.completed(block=True, return_exceptions=True))
+                        extractor.submit((job, result.transfer), extract_timed, result.path, job.run.route(job.url), result.transfer['size'],
+                                         job.run.product.member_writer, done=result.reservation.release)  # Give the disk space back as soon as the files are written
+                    else:
+                        finished(job.run, job.url, result)
+                    if extractor is not None:
+                        extracted(extractor.completed(return_exceptions=True))  # Pick up extractions that finished meanwhile
+                    if self.gridder is not None:
+                        self.gridder.poll()  # Start the gridding jobs waiting for a worker
+                    sample_queues()
+                if extractor is not None:
+                    extracted(extractor.drain(return_exceptions=True))  # Wait for the last extractions, which may queue retries
+        finally:
+            progress_bar.close()  # Close the progress bar
+            sample_queues(force=True)  # Leave the final depths in the Prometheus file
+            self.metrics.event('run_end', downloaded=sum(r.downloaded_count for r in runs), failed=sum(len(r.failures) for r in runs),
+                               retried=sum(r.retried_count for r in runs), received=received, seconds=round(time.perf_counter() - started, 3),
+                               stages=self.metrics.stage_totals())
+            self.metrics.flush(force=True)
+        return runs
+
+    # Print the counts of a run, as the original scripts did at the end, on errors and on Ctrl+C
+    def summarize(self, runs, suffix=''):
+        for run in runs:
+            uncompressed = ', '.join(f"{count} {extension}" for extension, count in run.uncompressed_count.items())
+            self.echo(f"{run.label}: Downloaded {run.downloaded_count} ZIP files, uncompressed {uncompressed} files, and removed {run.removed_count} ZIP files{suffix}.")
+            for extension, count in run.totals().items():
+                self.echo(f"There are {count} {extension} files in the [...\\{run.product.directory(extension, run.root)}] folder")
+            if run.failures:
+                self.echo(f"{len(run.failures)} {run.label} tiles could not be downloaded and will be tried again on the next run:")
+                for url, message in run.failures.items():
+                    self.echo(f"  {url}: {message}")
+        stages = self.metrics.stage_totals()
+        if stages:  # Where the time went, summed over the worker threads and processes
+            self.echo("Time per stage: " + ', '.join(f"{stage} {totals['seconds']:.1f} s" for stage, totals in stages.items()))
+
+    # Close the manifests, the pooled connections, the extraction processes and the metrics files
+    def close(self):
+        if self.extractor is not None:
+            self.extractor.close()
+        self.metrics.close()
+        for manifest in self._manifests.values():
+            manifest.close()
+        self._manifests.clear()
+        self.engine.close()
+
+
+# Download the given years in one process and return their ProductRun records.
+# Other keyword options (retries, timeout, requests_per_second, bytes_per_second, laz, ...) are passed to Downloader.
+def fetch(years, output_dir='.', data_dir='.', jobs=DEFAULT_WORKERS, per_host=DEFAULT_PER_HOST, streaming=True, verify=False, area=None, progress=False, echo=None,
+          extract_jobs=DEFAULT_EXTRACT_WORKERS, products=None, update=False, **options):
+    with Downloader(output_dir=output_dir, data_dir=data_dir, jobs=jobs, per_host=per_host, streaming=streaming, echo=echo, extract_jobs=extract_jobs, **options) as downloader:
+        runs = downloader.prepare(years, verify=verify, area=area, products=products, update=update)  # Read the catalogues and find the missing tiles
+        return downloader.download(runs, progress=progress)  # Download them
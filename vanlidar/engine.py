@@ -0,0 +1,270 @@
+import os  # Import the os module for the number of CPUs
+import signal  # Import the signal module so extraction workers leave Ctrl+C to the main process
+import threading  # Import the threading module for locks and per-host semaphores
+import time  # Import the time module for the retry delays
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait  # Import the pools used for downloads and extraction
+from urllib.parse import urlsplit  # Import urlsplit to work out which host a URL points at
+
+import requests  # Import the requests module for making HTTP requests
+from requests.adapters import HTTPAdapter  # Import HTTPAdapter to size the shared connection pool
+from urllib3.connection import HTTPConnection, HTTPSConnection  # Import the connection classes that are timed
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool  # Import the pools that create them
+
+from .scheduler import RateLimiter  # Token bucket for the request and byte rate limits
+
+# Default number of tiles downloaded at the same time
+DEFAULT_WORKERS = 4
+
+# Default number of simultaneous connections opened to a single host
+DEFAULT_PER_HOST = 4
+
+# Default seconds allowed to open a connection and between two reads of a response, so a stalled
+# socket raises an error instead of hanging the run
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 60
+
+# Default number of processes extracting saved ZIP files at the same time
+DEFAULT_EXTRACT_WORKERS = min(os.cpu_count() or 1, DEFAULT_WORKERS)
+
+# Marker returned by next() once every item has been submitted
+_NO_MORE_ITEMS = object()
+
+# How long (in seconds) the main thread waits for a finished tile before checking again,
+# so Ctrl+C is picked up promptly on every platform
+POLL_INTERVAL = 0.5
+
+
+# Seconds each thread has spent opening connections (DNS lookup, TCP connect and TLS handshake) and waiting
+# for response headers since it last asked; see DownloadEngine.request_timings
+_request_times = threading.local()
+
+
+# Connection classes that add the time taken by connect() to the calling thread's total
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _request_times.connect = getattr(_request_times, 'connect', 0.0) + time.perf_counter() - started
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _request_times.connect = getattr(_request_times, 'connect', 0.0) + time.perf_counter() - started
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+# Adapter whose pools open timed connections, so the connect stage of a tile can be told apart from the
+# wait for the first byte. Pooled connections that are reused cost nothing and add no time.
+class _TimedAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _TimedHTTPConnectionPool, 'https': _TimedHTTPSConnectionPool}
+
+
+# Concurrent download engine shared by the VanLidar2013, VanLidar2018 and VanLidar2022 scripts.
+# Tiles are processed by a bounded pool of worker threads, while results are handed back to the
+# caller on the main thread so progress bars and counters never need to be shared between threads.
+# Every request has connect/read timeouts, and optional global limits on the number of requests and
+# bytes per second keep the load on the City's servers under control.
+class DownloadEngine:
+    def __init__(self, max_workers=DEFAULT_WORKERS, max_per_host=DEFAULT_PER_HOST, timeout=(DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT),
+                 requests_per_second=None, bytes_per_second=None):
+        self.max_workers = max(1, int(max_workers))  # Number of worker threads in the pool
+        self.max_per_host = max(1, min(int(max_per_host), self.max_workers))  # Connection cap for a single host
+        self.session = requests.Session()  # One session so connections are reused between tiles
+        adapter = _TimedAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers)  # Keep one pooled connection per worker
+        self.session.mount('http://', adapter)  # Use the sized pool for plain HTTP URLs
+        self.session.mount('https://', adapter)  # Use the sized pool for HTTPS URLs
+        self._host_slots = {}  # Semaphores limiting the connections per host, keyed by host name
+        self._lock = threading.Lock()  # Lock protecting the per-host semaphore dictionary
+        self._stop = threading.Event()  # Set when the run is aborted so queued tiles are not started
+        self.timeout = timeout  # (connect, read) timeouts in seconds
+        self._request_limiter = RateLimiter(requests_per_second) if requests_per_second else None  # Requests per second over all workers
+        self._byte_limiter = RateLimiter(bytes_per_second) if bytes_per_second else None  # Bytes per second over all workers
+        self.active = 0  # Items being processed by the workers right now
+
+    # Return the semaphore limiting the number of connections to the host of the given URL
+    def host_slot(self, url):
+        host = urlsplit(url).netloc.lower()  # Extract the host (and port) from the URL
+        with self._lock:  # Only one thread may create a host's semaphore
+            if host not in self._host_slots:  # If this host has not been seen before
+                self._host_slots[host] = threading.BoundedSemaphore(self.max_per_host)  # Create its connection cap
+            return self._host_slots[host]  # Return the semaphore, usable as a "with" block around the transfer
+
+    # Send a request through the shared session, waiting for the request rate limit
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)  # Never wait forever on a stalled connection
+        if self._request_limiter is not None:
+            self._request_limiter.acquire(1, self._stop)
+        started = time.perf_counter()
+        connect = getattr(_request_times, 'connect', 0.0)  # Connection time so far, to leave out of the wait for headers
+        try:
+            return self.session.request(method, url, **kwargs)  # Send the request through the pooled session
+        finally:
+            waited = time.perf_counter() - started - (getattr(_request_times, 'connect', 0.0) - connect)
+            _request_times.first_byte = getattr(_request_times, 'first_byte', 0.0) + waited
+
+    # Send a streaming GET request through the shared session
+    def get(self, url, **kwargs):
+        kwargs.setdefault('stream', True)  # Stream the body so large ZIP files are never held in memory
+        return self.request('GET', url, **kwargs)
+
+    # Send a HEAD request through the shared session, following redirects like GET does
+    def head(self, url, **kwargs):
+        kwargs.setdefault('allow_redirects', True)
+        return self.request('HEAD', url, **kwargs)
+
+    # Return the seconds the calling thread has spent opening connections and waiting for response headers
+    # since the last call, as {'connect': seconds, 'first_byte': seconds}, and start again from 0
+    def request_timings(self):
+        timings = {'connect': getattr(_request_times, 'connect', 0.0), 'first_byte': getattr(_request_times, 'first_byte', 0.0)}
+        _request_times.connect = _request_times.first_byte = 0.0
+        return timings
+
+    # Account for n bytes received, waiting if the run is over its bandwidth limit
+    def throttle(self, n):
+        if self._byte_limiter is not None:
+            self._byte_limiter.acquire(n, self._stop)
+
+    # Sleep until the time.monotonic() deadline, returning early (False) if the run is stopped
+    def wait_until(self, deadline):
+        return not self._stop.wait(max(0.0, deadline - time.monotonic()))
+
+    # Tell the engine to stop starting new tiles
+    def stop(self):
+        self._stop.set()  # Queued tiles will be skipped once this is set
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()  # True once the run has been stopped
+
+    # Run func(item) for every item on the worker pool and yield (item, result) pairs as tiles finish.
+    # Results are yielded on the calling thread, so counters and progress bars can be updated without locks.
+    # An exception raised by a worker stops the run and is re-raised here, just like the serial loop did.
+    # If items has a next_due() method (see scheduler.WorkQueue), items it holds back are waited for here,
+    # on the calling thread, and started as soon as they are due, while the workers get on with other tiles.
+    def run(self, func, items):
+        items = iter(items)  # Accept any iterable of work items
+        next_due = getattr(items, 'next_due', lambda: None)  # Seconds until a held-back item is due, or None
+        self._stop.clear()  # A new run starts with a clear stop flag
+
+        def guarded(item):
+            if self._stop.is_set():  # If the run was stopped while this tile was queued
+                return None  # Do not start it
+            with self._lock:
+                self.active += 1
+            try:
+                return func(item)  # Process the tile
+            finally:
+                with self._lock:
+                    self.active -= 1
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='vanlidar')  # Create the worker pool
+        pending = {}  # Futures that have been submitted but not yet handed back, mapped to their item
+
+        # Keep at most two tiles per worker queued so huge catalogues are not submitted all at once
+        def fill():
+            while len(pending) < self.max_workers * 2:
+                item = next(items, _NO_MORE_ITEMS)  # Take the next tile that is ready, if any
+                if item is _NO_MORE_ITEMS:
+                    return
+                pending[executor.submit(guarded, item)] = item  # Submit the tile to the pool
+
+        try:
+            fill()
+            while True:
+                due = next_due()  # Seconds until a held-back tile may start
+                if not pending:
+                    if due is None or self._stop.is_set():  # Nothing running and nothing to wait for
+                        break
+                    self._stop.wait(due)  # Only held-back tiles are left; sleep until the first is due
+                else:
+                    done, _ = wait(pending, timeout=POLL_INTERVAL if due is None else min(due, POLL_INTERVAL), return_when=FIRST_COMPLETED)  # Wait briefly for finished tiles
+                    for future in done:
+                        item = pending.pop(future)  # Forget the finished future
+                        yield item, future.result()  # Hand the result back (re-raises a worker's exception)
+                        fill()  # Top the queue up with the next tiles, if any
+                fill()  # Start the held-back tiles that are now due
+        finally:
+            self._stop.set()  # Make sure queued tiles are not started if we are leaving early
+            executor.shutdown(wait=False, cancel_futures=True)  # Cancel anything that has not started yet
+
+    # Close the pooled connections
+    def close(self):
+        self.session.close()  # Release every connection held by the session
+
+
+# Make an extraction worker ignore Ctrl+C; the main process handles it and the workers exit with it
+def _ignore_interrupts():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+# Process pool for the CPU-bound stage of the pipeline (extracting saved ZIP files), so decompression
+# runs alongside the downloads instead of on the download threads. At most max_queued archives are
+# waiting or being extracted at once; callers check .full and wait for completed() before handing over
+# another one, which holds back the download stage and keeps the number of ZIP files on disk bounded.
+# Like DownloadEngine.run, results are handed back on the calling thread.
+class ExtractionPool:
+    def __init__(self, max_workers=DEFAULT_EXTRACT_WORKERS, max_queued=None):
+        self.max_workers = max(1, int(max_workers))  # Number of worker processes
+        self.max_queued = max(1, int(max_queued or self.max_workers * 2))  # Archives allowed in the pool at once
+        self._executor = None  # Created on first use, so runs that never save a ZIP file start no processes
+        self._pending = {}  # Futures mapped to the key they were submitted with
+
+    def __len__(self):
+        return len(self._pending)
+
+    @property
+    def full(self):
+        return len(self._pending) >= self.max_queued  # True when the caller should wait before submitting more
+
+    # Run func(*args) on a worker process; key is handed back with the result. done, if given, is called
+    # with no arguments as soon as the job ends (on a pool thread, before completed() hands the result back).
+    def submit(self, key, func, *args, done=None):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_ignore_interrupts)
+        future = self._executor.submit(func, *args)
+        if done is not None:
+            future.add_done_callback(lambda _: done())
+        self._pending[future] = key
+
+    # Yield (key, result) for every finished job. With block=True, wait (polling, so Ctrl+C is
+    # picked up) until at least one job has finished. A worker's exception is re-raised here, or
+    # yielded in place of the result with return_exceptions=True.
+    def completed(self, block=False, return_exceptions=False):
+        done = ()  # Futures that have finished
+        while self._pending:
+            done, _ = wait(self._pending, timeout=POLL_INTERVAL if block else 0, return_when=FIRST_COMPLETED)
+            if done or not block:
+                break
+        for future in done:
+            key = self._pending.pop(future)  # Forget the finished future
+            if return_exceptions and future.exception() is not None:
+                yield key, future.exception()
+            else:
+                yield key, future.result()  # Hand the result back (re-raises a worker's exception)
+
+    # Yield (key, result) for every job still in the pool, as they finish
+    def drain(self, return_exceptions=False):
+        while self._pending:
+            yield from self.completed(block=True, return_exceptions=return_exceptions)
+
+    # Stop the worker processes, cancelling jobs that have not started
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        self._pending.clear()
@@ -0,0 +1,436 @@
+import math  # Import the math module for snapping extents to the grid
+import os  # Import the os module for file and directory operations
+from collections import deque  # Import deque for the jobs waiting for a free worker
+
+from .catalogue import load_catalogue  # Tile footprints of each year
+from .datasets import get_dataset  # Output folders of each year
+from .engine import DEFAULT_EXTRACT_WORKERS, ExtractionPool  # Process pool for the CPU-bound gridding
+from .inventory import build_inventory  # Point cloud tiles on disk
+from .lasheader import read_las_header  # Extent of the points of a tile
+from .lasreader import DEFAULT_CHUNK_POINTS  # Points read at a time
+from .overviews import DEFAULT_BLOCK_SIZE, DEFAULT_CRS, MOSAIC_NAME, build_cog, mosaic_skipped, write_mosaic  # Tiled GeoTIFFs and their mosaic
+from .query import read_chunks  # LAS and LAZ point readers
+from .spatial import lonlat_to_utm  # Projection of the catalogue footprints
+
+try:  # NumPy is only needed for gridding
+    import numpy
+except ImportError:
+    numpy = None
+
+try:  # rasterio is only needed for writing the rasters
+    import rasterio
+except ImportError:
+    rasterio = None
+
+# Sub-folder of a point cloud folder holding the rasters, one folder per resolution (e.g. grid/1m)
+GRID_DIRECTORY = 'grid'
+
+# Sub-folder of a resolution folder holding the per-tile cell statistics the rasters are blended from
+PARTIALS_DIRECTORY = 'partials'
+
+# Rasters built for every tile: highest point (DSM), ground elevation (DTM) and points per square metre
+GRID_PRODUCTS = ('dsm', 'dtm', 'density')
+
+# Default cell size in metres
+DEFAULT_RESOLUTION = 1.0
+
+# Default distance (in metres) over which empty DSM and DTM cells are filled from the cells around them.
+# It is also the margin of neighbouring tiles that is blended into each tile.
+DEFAULT_FILL_DISTANCE = 10.0
+
+# Ways of reducing the ground points of a cell to one DTM elevation
+DTM_STATISTICS = ('mean', 'min')
+
+# ASPRS classes: ground, and the low and high noise that is left out of every raster
+GROUND_CLASS = 2
+NOISE_CLASSES = (7, 18)
+
+# Value of the DSM and DTM cells that have no elevation
+NODATA = -9999.0
+
+
+# Return True if NumPy and rasterio are installed
+def grid_available():
+    return numpy is not None and rasterio is not None
+
+
+# Return the (min x, min y, max x, max y) UTM bounds of a (longitude, latitude) footprint
+def footprint_bounds(footprint):
+    points = [lonlat_to_utm(lon, lat) for lon, lat in footprint]
+    return (min(x for x, _ in points), min(y for _, y in points), max(x for x, _ in points), max(y for _, y in points))
+
+
+# Grow bounds outwards to whole cells of a grid whose lines are at multiples of resolution, so the
+# rasters of every tile line up with each other. Returns (left, top, width, height).
+def snap_bounds(bounds, resolution):
+    left, bottom = math.floor(bounds[0] / resolution), math.floor(bounds[1] / resolution)
+    right, top = math.ceil(bounds[2] / resolution), math.ceil(bounds[3] / resolution)
+    return left * resolution, top * resolution, max(1, right - left), max(1, top - bottom)
+
+
+# Bin the points of one LAS/LAZ file into cells of the given resolution and save the statistics of every
+# cell to target (a .npz file): the highest point, the lowest point, sum and count of the ground points,
+# and the number of points. Noise and withheld points are left out. Each chunk of points is binned with
+# one pass of NumPy ufuncs, so memory use depends on chunk_size and not on the size of the tile. The
+# statistics can be merged cell by cell, which is how blend_tile joins a tile with its neighbours.
+# Runs in the worker processes of GridBuilder.
+def grid_points(path, target, bounds, resolution=DEFAULT_RESOLUTION, chunk_size=DEFAULT_CHUNK_POINTS):
+    left, top, width, height = snap_bounds(bounds, resolution)
+    cells = width * height
+    highest = numpy.full(cells, -numpy.inf, dtype=numpy.float32)
+    ground_min = numpy.full(cells, numpy.inf, dtype=numpy.float32)
+    ground_sum = numpy.zeros(cells, dtype=numpy.float64)
+    ground_count = numpy.zeros(cells, dtype=numpy.int64)  # bincount's type, so adding needs no conversion
+    count = numpy.zeros(cells, dtype=numpy.int64)
+    for chunk in read_chunks(path, chunk_size):
+        classification = chunk.classification
+        kept = ~chunk.withheld
+        for noise in NOISE_CLASSES:  # Faster than numpy.isin for a couple of classes
+            kept &= classification != noise
+        column = numpy.floor((chunk.x - left) / resolution).astype(numpy.int64)
+        row = numpy.floor((top - chunk.y) / resolution).astype(numpy.int64)
+        kept &= (column >= 0) & (column < width) & (row >= 0) & (row < height)  # Points outside the bounds are dropped
+        index = (row * width + column)[kept]
+        z = chunk.z[kept].astype(numpy.float32)
+        numpy.maximum.at(highest, index, z)
+        count += numpy.bincount(index, minlength=cells)
+        ground = classification[kept] == GROUND_CLASS
+        numpy.minimum.at(ground_min, index[ground], z[ground])
+        ground_sum += numpy.bincount(index[ground], weights=z[ground], minlength=cells)
+        ground_count += numpy.bincount(index[ground], minlength=cells)
+    shape = (height, width)
+    temporary_path = target + '.part.npz'  # numpy.savez insists on the extension; not compressed, as zlib would double the time of a tile
+    numpy.savez(temporary_path, origin=numpy.array([left, top, resolution]), highest=highest.reshape(shape), ground_min=ground_min.reshape(shape),
+                ground_sum=ground_sum.reshape(shape), ground_count=ground_count.astype(numpy.uint32).reshape(shape), count=count.astype(numpy.uint32).reshape(shape))
+    os.replace(temporary_path, target)
+    return target
+
+
+# Fill empty cells (where valid is False) with the mean of their filled neighbours, one ring of cells per
+# step, for at most steps rings. Holes narrower than twice steps (e.g. under buildings in a DTM) close up.
+def fill_gaps(values, valid, steps):
+    values = numpy.where(valid, values, 0.0)
+    valid = valid.copy()
+    height, width = values.shape
+    for _ in range(steps):
+        missing = ~valid
+        if not missing.any():
+            break
+        padded_values = numpy.pad(values * valid, 1)
+        padded_valid = numpy.pad(valid, 1).astype(numpy.float32)
+        totals = numpy.zeros_like(values)
+        counts = numpy.zeros(values.shape, dtype=numpy.float32)
+        for dy in (0, 1, 2):
+            for dx in (0, 1, 2):
+                if dy == 1 and dx == 1:
+                    continue
+                totals += padded_values[dy:dy + height, dx:dx + width]
+                counts += padded_valid[dy:dy + height, dx:dx + width]
+        filled = missing & (counts > 0)
+        if not filled.any():
+            break
+        values[filled] = totals[filled] / counts[filled]
+        valid |= filled
+    return values, valid
+
+
+# Merge the cell statistics of several grid_points files over the window (left, top, width, height).
+# Cells covered by more than one tile (tiles overlap a little) get the combined statistics of all of them.
+def merge_partials(partials, window):
+    left, top, width, height = window
+    highest = numpy.full((height, width), -numpy.inf, dtype=numpy.float32)
+    ground_min = numpy.full((height, width), numpy.inf, dtype=numpy.float32)
+    ground_sum = numpy.zeros((height, width), dtype=numpy.float64)
+    ground_count = numpy.zeros((height, width), dtype=numpy.uint32)
+    count = numpy.zeros((height, width), dtype=numpy.uint32)
+    for path in partials:
+        with numpy.load(path) as partial:
+            partial_left, partial_top, resolution = partial['origin']
+            partial_height, partial_width = partial['count'].shape
+            column, row = round((partial_left - left) / resolution), round((top - partial_top) / resolution)  # Offset of the tile in the window, in cells
+            x0, y0 = max(column, 0), max(row, 0)
+            x1, y1 = min(column + partial_width, width), min(row + partial_height, height)
+            if x0 >= x1 or y0 >= y1:
+                continue
+            target = numpy.s_[y0:y1, x0:x1]
+            source = numpy.s_[y0 - row:y1 - row, x0 - column:x1 - column]
+            numpy.maximum(highest[target], partial['highest'][source], out=highest[target])
+            numpy.minimum(ground_min[target], partial['ground_min'][source], out=ground_min[target])
+            ground_sum[target] += partial['ground_sum'][source]
+            ground_count[target] += partial['ground_count'][source]
+            count[target] += partial['count'][source]
+    return highest, ground_min, ground_sum, ground_count, count
+
+
+# Write a single-band float32 raster as a tiled GeoTIFF with overviews (see overviews.build_cog)
+def write_raster(target, values, left, top, resolution, nodata=None, block_size=DEFAULT_BLOCK_SIZE, crs=DEFAULT_CRS):
+    source = target + '.raw.tif'  # Plain GeoTIFF the tiled copy is made from
+    height, width = values.shape
+    try:
+        with rasterio.open(source, 'w', driver='GTiff', width=width, height=height, count=1, dtype='float32', crs=crs,
+                           transform=rasterio.Affine(resolution, 0.0, left, 0.0, -resolution, top), nodata=nodata) as dataset:
+            dataset.write(values.astype(numpy.float32), 1)
+        build_cog(source, target, block_size, crs)
+    finally:
+        if os.path.exists(source):
+            os.remove(source)
+    return target
+
+
+# Build the DSM, DTM and density rasters of one tile from its cell statistics and those of its neighbours
+# (partials), over bounds, the tile's footprint. The statistics are merged over the footprint grown by
+# fill_distance, so the cells along the edges see the points of the tiles next door, and gaps are filled
+# from both sides: the rasters of neighbouring tiles agree where they meet. targets maps each of
+# GRID_PRODUCTS to its output path. Runs in the worker processes of GridBuilder.
+def blend_tile(partials, targets, bounds, resolution=DEFAULT_RESOLUTION, fill_distance=DEFAULT_FILL_DISTANCE, dtm_statistic='mean',
+               block_size=DEFAULT_BLOCK_SIZE, crs=DEFAULT_CRS):
+    left, top, width, height = snap_bounds(bounds, resolution)
+    margin = math.ceil(fill_distance / resolution)  # Cells blended in from the neighbours on every side
+    window = (left - margin * resolution, top + margin * resolution, width + 2 * margin, height + 2 * margin)
+    highest, ground_min, ground_sum, ground_count, count = merge_partials(partials, window)
+    inside = numpy.s_[margin:margin + height, margin:margin + width]  # The tile's own cells
+
+    dsm, valid = fill_gaps(highest, numpy.isfinite(highest), margin)
+    write_raster(targets['dsm'], numpy.where(valid, dsm, NODATA)[inside], left, top, resolution, NODATA, block_size, crs)
+    if dtm_statistic == 'min':
+        ground = ground_min
+    else:
+        ground = (ground_sum / numpy.maximum(ground_count, 1)).astype(numpy.float32)
+    dtm, valid = fill_gaps(ground, ground_count > 0, margin)
+    write_raster(targets['dtm'], numpy.where(valid, dtm, NODATA)[inside], left, top, resolution, NODATA, block_size, crs)
+    write_raster(targets['density'], (count / (resolution * resolution))[inside], left, top, resolution, None, block_size, crs)
+    return targets
+
+
+# Return True if target is missing or older than any of the inputs
+def _stale(target, inputs):
+    if not os.path.exists(target):
+        return True
+    mtime = os.path.getmtime(target)
+    return any(os.path.getmtime(path) > mtime for path in inputs if os.path.exists(path))
+
+
+# Footprints and output folders of one year's point cloud tiles
+class _YearGrid:
+    def __init__(self, year, output_dir, data_dir, resolution, dtm_statistic):
+        dataset = get_dataset(year)
+        product = next(product for product in dataset.products if '.las' in product.extensions)  # The point cloud product
+        catalogue = load_catalogue(os.path.join(data_dir, dataset.csv_file))
+        self.names = list(catalogue.names)  # Tile names, in catalogue order
+        self.positions = {name: position for position, name in enumerate(self.names)}
+        self.bounds = numpy.array([footprint_bounds(catalogue.footprint(position)) if catalogue.offsets[position + 1] > catalogue.offsets[position]
+                                   else (numpy.nan,) * 4 for position in range(len(catalogue))], dtype=numpy.float64).reshape(-1, 4)  # UTM bounds of every footprint
+        self.directory = os.path.join(product.directory(None, output_dir), GRID_DIRECTORY, f'{resolution:g}m')  # e.g. VanLidar2022/grid/1m
+        self.folders = {name: os.path.join(self.directory, name if name != 'dtm' or dtm_statistic == 'mean' else f'dtm_{dtm_statistic}') for name in GRID_PRODUCTS}
+        self.partials = os.path.join(self.directory, PARTIALS_DIRECTORY)
+
+    # Return the names of the tiles whose footprint comes within margin metres of the tile's footprint
+    def neighbours(self, name, margin):
+        bounds = self.bounds[self.positions[name]]
+        near = ((self.bounds[:, 0] <= bounds[2] + margin) & (self.bounds[:, 2] >= bounds[0] - margin) &
+                (self.bounds[:, 1] <= bounds[3] + margin) & (self.bounds[:, 3] >= bounds[1] - margin))
+        return [self.names[position] for position in numpy.flatnonzero(near) if self.names[position] != name]
+
+    def partial_path(self, name):
+        return os.path.join(self.partials, name + '.npz')
+
+    def targets(self, name):
+        return {product: os.path.join(folder, name + '.tif') for product, folder in self.folders.items()}
+
+
+# Builds DSM, DTM and point density rasters from the point cloud tiles, in a pool of worker processes.
+# Each tile goes through two jobs: grid_points bins its points into cell statistics, and blend_tile
+# merges those with the statistics of the neighbouring tiles (found from the catalogue footprints)
+# and writes the tile's tiled GeoTIFFs. A tile is blended as soon as its neighbours that are on disk or
+# still downloading have been gridded, so with Downloader(gridder=...) the rasters are built while the
+# download goes on. finish() builds what is left and writes a mosaic.vrt per raster folder. The build is
+# incremental: statistics older than their LAS file and rasters older than any statistics they were
+# blended from are rebuilt, the rest are kept. Typical use after a download:
+#     builder = GridBuilder(output_dir='data', resolution=1.0)
+#     for tile in vanlidar.build_inventory([2022], output_dir='data'):
+#         builder.add(tile.year, tile.name, tile.path)
+#     built, failures, mosaics = builder.finish()
+class GridBuilder:
+    def __init__(self, output_dir='.', data_dir='.', resolution=DEFAULT_RESOLUTION, workers=DEFAULT_EXTRACT_WORKERS, fill_distance=DEFAULT_FILL_DISTANCE,
+                 dtm_statistic='mean', block_size=DEFAULT_BLOCK_SIZE, crs=DEFAULT_CRS, chunk_size=DEFAULT_CHUNK_POINTS, echo=None):
+        if not grid_available():
+            raise RuntimeError("Building rasters needs NumPy and rasterio: pip install numpy rasterio")
+        if dtm_statistic not in DTM_STATISTICS:
+            raise ValueError(f"Unknown DTM statistic {dtm_statistic!r}; use one of {', '.join(DTM_STATISTICS)}")
+        self.output_dir = output_dir  # Folder the VanLidar20xx folders are in
+        self.data_dir = data_dir  # Folder holding the lidar-20xx.csv catalogues
+        self.resolution = float(resolution)  # Cell size in metres
+        self.fill_distance = float(fill_distance)  # Gap filling distance and blending margin in metres
+        self.dtm_statistic = dtm_statistic  # 'mean' or 'min' of the ground points of a cell
+        self.block_size = block_size  # Internal tile size of the GeoTIFFs
+        self.crs = crs  # CRS of the point clouds
+        self.chunk_size = chunk_size  # Points binned at a time
+        self.echo = echo or (lambda *args, **kwargs: None)
+        self.pool = ExtractionPool(workers)  # Worker processes
+        self.built = 0  # Tiles whose rasters were written
+        self.failures = {}  # Path -> error message of the tiles that could not be gridded or blended
+        self._years = {}  # Year -> _YearGrid
+        self._paths = {}  # (year, name) -> LAS/LAZ file
+        self._expected = set()  # (year, name) of the tiles still being downloaded
+        self._gridded = set()  # (year, name) of the tiles whose statistics are up to date
+        self._blended = set()  # (year, name) of the tiles whose rasters are done (or failed)
+        self._queued = set()  # (kind, year, name) of the jobs waiting or running
+        self._backlog = deque()  # (key, func, args) of the jobs waiting for a free worker
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _year(self, year):
+        if year not in self._years:
+            self._years[year] = _YearGrid(year, self.output_dir, self.data_dir, self.resolution, self.dtm_statistic)
+        return self._years[year]
+
+    # Note tiles that are going to be downloaded, so their neighbours wait for them before blending
+    def expect(self, year, names):
+        grid = self._year(year)
+        self._expected.update((year, name) for name in names if name in grid.positions)
+
+    # Hand over a point cloud tile that is on disk; its statistics are rebuilt if they are out of date
+    def add(self, year, name, path):
+        grid = self._year(year)
+        if name not in grid.positions:  # Not in the catalogue, so it has no footprint to grid
+            return
+        key = (year, name)
+        self._paths[key] = path
+        self._expected.discard(key)
+        self._gridded.discard(key)
+        self._blended.discard(key)
+        partial = grid.partial_path(name)
+        if _stale(partial, [path]):
+            header = read_las_header(path)
+            points = (header.min_x, header.min_y, header.max_x, header.max_y)  # Tiles overlap, so the points can reach past the footprint
+            footprint = grid.bounds[grid.positions[name]]
+            if numpy.isnan(footprint).any():  # No footprint in the catalogue: the points will do
+                grid.bounds[grid.positions[name]] = footprint = points
+            bounds = (min(footprint[0], points[0]), min(footprint[1], points[1]), max(footprint[2], points[2]), max(footprint[3], points[3]))
+            os.makedirs(grid.partials, exist_ok=True)
+            self._submit(('grid', year, name), grid_points, path, partial, bounds, self.resolution, self.chunk_size)
+        else:
+            self._gridded.add(key)
+            self._blend_ready(year, name)
+        self.poll()
+
+    # Note the tiles of Downloader runs: the point cloud tiles still to download are expected, and
+    # those already complete are added from the paths in the manifest
+    def watch(self, runs):
+        for run in runs:
+            if '.las' not in run.product.extensions and '.laz' not in run.product.extensions:
+                continue
+            pending = set(run.pending)
+            self.expect(run.dataset.year, [run.names.get(url) for url in run.urls])  # Until added, so no tile blends before its neighbours are in
+            for url in run.urls:
+                record = run.manifest.get(os.path.basename(url))
+                if url not in pending and record is not None and run.manifest.is_complete(os.path.basename(url)):
+                    self.tile_finished(run, url, record.get('members', []))
+
+    # Hand over a tile Downloader has just finished, given its extracted members
+    def tile_finished(self, run, url, members):
+        paths = [member['path'] if isinstance(member, dict) else member.path for member in members]
+        point_clouds = [path for path in paths if os.path.splitext(path)[1].lower() in ('.las', '.laz')]
+        name = run.names.get(url)
+        if point_clouds and name is not None:
+            self.add(run.dataset.year, name, point_clouds[0])
+
+    def _submit(self, key, func, *args):
+        if key not in self._queued:
+            self._queued.add(key)
+            self._backlog.append((key, func, args))
+
+    # Blend the tile and any neighbour whose neighbourhood is now complete
+    def _blend_ready(self, year, name, force=False):
+        grid = self._year(year)
+        margin = self.fill_distance + self.resolution
+        for candidate in [name] + grid.neighbours(name, margin):
+            key = (year, candidate)
+            if key in self._blended or key not in self._gridded:
+                continue
+            neighbours = [(year, other) for other in grid.neighbours(candidate, margin)]
+            if not force and any(other in self._expected or (other in self._paths and other not in self._gridded) for other in neighbours):
+                continue  # Wait for the neighbours that are still coming
+            partials = [grid.partial_path(candidate)] + [grid.partial_path(other) for _, other in neighbours if (year, other) in self._gridded]
+            targets = grid.targets(candidate)
+            self._blended.add(key)
+            if all(not _stale(target, partials) for target in targets.values()):
+                continue  # Up to date
+            for folder in grid.folders.values():
+                os.makedirs(folder, exist_ok=True)
+            self._submit(('blend', year, candidate), blend_tile, partials, targets, tuple(grid.bounds[grid.positions[candidate]]), self.resolution,
+                         self.fill_distance, self.dtm_statistic, self.block_size, self.crs)
+
+    # Pick up finished jobs, queue the blends they make possible and start waiting jobs on free workers.
+    # Called by Downloader after every tile without blocking; block=True waits until every job is done.
+    def poll(self, block=False):
+        while True:
+            while self._backlog and not self.pool.full:
+                key, func, args = self._backlog.popleft()
+                self.pool.submit(key, func, *args)
+            if not len(self.pool):
+                return
+            results = list(self.pool.completed(block=block, return_exceptions=True))
+            for key, result in results:
+                self._queued.discard(key)
+                kind, year, name = key
+                neighbours = self._year(year).neighbours(name, self.fill_distance + self.resolution)
+                if isinstance(result, Exception):
+                    self.failures[self._paths.get((year, name), name)] = f"{type(result).__name__}: {result}"
+                    self._blended.add((year, name))
+                    if kind == 'grid':
+                        self._paths.pop((year, name), None)  # Its neighbours blend without it
+                        for other in neighbours:
+                            self._blend_ready(year, other)
+                elif kind == 'grid':
+                    self._gridded.add((year, name))
+                    for other in neighbours:  # Neighbours blended without these statistics are blended again
+                        if ('blend', year, other) not in self._queued:
+                            self._blended.discard((year, other))
+                    self._blend_ready(year, name)
+                else:
+                    self.built += 1
+            if not block and not results:
+                return
+
+    # Wait for every job, blend the tiles still waiting for neighbours that never came, and write a
+    # mosaic.vrt in each raster folder that changed. Returns (built, failures, mosaic paths).
+    def finish(self):
+        self._expected.clear()  # Nothing more is coming
+        self.echo(f"Gridding {len(self._paths)} point cloud tiles at {self.resolution:g} m...")
+        self.poll(block=True)
+        for year, name in sorted(self._gridded):
+            self._blend_ready(year, name, force=True)
+        self.poll(block=True)
+        mosaics = []
+        for grid in self._years.values():
+            for folder in grid.folders.values():
+                rasters = sorted(os.path.join(folder, name) for name in os.listdir(folder) if name.endswith('.tif')) if os.path.isdir(folder) else []
+                mosaic_path = os.path.join(folder, MOSAIC_NAME)
+                if rasters:
+                    skipped = write_mosaic(mosaic_path, rasters) if _stale(mosaic_path, rasters) else mosaic_skipped(mosaic_path)
+                    for path, reason in skipped.items():
+                        self.failures[path] = f"Left out of the mosaic: {reason}"
+                if rasters:
+                    mosaics.append(mosaic_path)
+        self.echo(f"Built the rasters of {self.built} tiles; {len(self.failures)} could not be built. Mosaics: {', '.join(mosaics) or 'none'}")
+        return self.built, self.failures, mosaics
+
+    def close(self):
+        self.pool.close()
+
+
+# Build the DSM, DTM and density rasters of the point cloud tiles of the given years that are on disk.
+# Other keyword options (fill_distance, dtm_statistic, ...) go to GridBuilder. Returns (built, failures, mosaic paths).
+def build_grids(years, output_dir='.', data_dir='.', resolution=DEFAULT_RESOLUTION, workers=DEFAULT_EXTRACT_WORKERS, echo=None, **options):
+    with GridBuilder(output_dir=output_dir, data_dir=data_dir, resolution=resolution, workers=workers, echo=echo, **options) as builder:
+        tiles = list(build_inventory(years, output_dir=output_dir, data_dir=data_dir))
+        for year in set(tile.year for tile in tiles):
+            builder.expect(year, [tile.name for tile in tiles if tile.year == year])  # So no tile blends before its neighbours are gridded
+        for tile in tiles:
+            builder.add(tile.year, tile.name, tile.path)
+        return builder.finish()
@@ -0,0 +1,136 @@
+import json  # Import the json module for the GeoJSON export
+import os  # Import the os module for file and directory operations
+from collections import namedtuple  # Import namedtuple for the inventory records
+from concurrent.futures import ThreadPoolExecutor  # Import the thread pool used to read missing headers
+
+from .catalogue import load_catalogue  # Tile footprints from the lidar-20xx.csv files
+from .datasets import get_dataset  # Dataset descriptors
+from .lasheader import POINT_CLOUD_EXTENSIONS, LasHeaderInfo, file_header  # LAS header summaries
+from .manifest import DEFAULT_VERIFY_WORKERS, MANIFEST_NAME, STATUS_COMPLETE, Manifest  # Download manifests
+from .spatial import TileIndex  # Spatial queries over the footprints
+
+# One point cloud file on disk: its year, the ZIP file name it came from (the manifest key), the
+# catalogue NAME, the path of the LAS/LAZ file, the footprint from the Geom column (None if the tile
+# is no longer in the catalogue) and its LasHeaderInfo
+InventoryTile = namedtuple('InventoryTile', ['year', 'tile', 'name', 'path', 'footprint', 'header'])
+
+
+# Return the points per square unit (square metres for the City's projected data) of a header's XY extent
+def point_density(header):
+    area = (header.max_x - header.min_x) * (header.max_y - header.min_y)
+    return header.point_count / area if area > 0 else 0.0
+
+
+# Queryable index of the point cloud tiles on disk, joining the LAS header of every file with the tile
+# footprints of the catalogues. It is built from the download manifests, which store each header when
+# the file is extracted, so no point data is read; see build_inventory.
+class Inventory:
+    def __init__(self, tiles):
+        self.tiles = list(tiles)  # InventoryTile records
+        self._index = None  # Spatial index over the footprints, built on the first area query
+
+    def __len__(self):
+        return len(self.tiles)
+
+    def __iter__(self):
+        return iter(self.tiles)
+
+    # Return the tiles matching every given condition: area (a BoundingBox, PolygonArea or PointRadius)
+    # must touch the footprint, [min_z, max_z] must overlap the tile's Z range, and the point density
+    # and point format must be within the given values
+    def query(self, area=None, years=None, min_z=None, max_z=None, min_density=None, max_density=None, point_formats=None):
+        if area is not None:
+            if self._index is None:
+                self._index = TileIndex(self.tiles)
+            tiles = self._index.query(area)
+        else:
+            tiles = self.tiles
+        selected = []
+        for tile in tiles:
+            header = tile.header
+            if years is not None and tile.year not in years:
+                continue
+            if (min_z is not None and header.max_z < min_z) or (max_z is not None and header.min_z > max_z):
+                continue
+            if (min_density is not None and point_density(header) < min_density) or (max_density is not None and point_density(header) > max_density):
+                continue
+            if point_formats is not None and header.point_format not in point_formats:
+                continue
+            selected.append(tile)
+        return selected
+
+    # Return the tiles as a GeoJSON FeatureCollection whose properties hold the header fields
+    def to_geojson(self, tiles=None):
+        features = []
+        for tile in self.tiles if tiles is None else tiles:
+            properties = {'year': tile.year, 'tile': tile.tile, 'name': tile.name, 'path': tile.path, 'density': point_density(tile.header)}
+            properties.update(tile.header._asdict())
+            geometry = {'type': 'Polygon', 'coordinates': [[list(point) for point in tile.footprint]]} if tile.footprint else None
+            features.append({'type': 'Feature', 'geometry': geometry, 'properties': properties})
+        return {'type': 'FeatureCollection', 'features': features}
+
+    # Write the tiles to a GeoJSON file, replacing it atomically
+    def write_geojson(self, path, tiles=None):
+        temporary_path = path + '.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as file:
+            json.dump(self.to_geojson(tiles), file)
+        os.replace(temporary_path, path)
+
+
+# Return True if a path is a LAS or LAZ file
+def _is_point_cloud(path):
+    return os.path.splitext(path)[1].lower() in POINT_CLOUD_EXTENSIONS
+
+
+# Read the headers of the point cloud files a manifest has no header for, on a pool of threads, and
+# store them in the manifest. Files whose header cannot be read are left as they are.
+def fill_headers(manifest, workers=DEFAULT_VERIFY_WORKERS):
+    unread = [(record['tile'], number, member['path']) for record in manifest.records() if record.get('status') == STATUS_COMPLETE
+              for number, member in enumerate(record.get('members', [])) if _is_point_cloud(member['path']) and 'header' not in member]
+    if not unread:
+        return 0
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='vanlidar-headers') as executor:
+        headers = list(executor.map(lambda entry: file_header(entry[2]), unread))  # Only the first few hundred bytes of each file are read
+    updated = {}  # Tile -> its members with the headers filled in
+    for (tile, number, _), header in zip(unread, headers):
+        if header is not None:
+            members = updated.setdefault(tile, [dict(member) for member in manifest.get(tile)['members']])
+            members[number]['header'] = header._asdict()
+    for tile, members in updated.items():
+        manifest.update_members(tile, members)
+    return len(updated)
+
+
+# Build the Inventory of the point cloud tiles of the given years under output_dir.
+# Headers come from the manifests, which store them as files are extracted; files recorded before
+# headers were kept (or adopted from disk) are read once by fill_headers. Footprints come from the
+# cached catalogues, so building the index of the whole city reads no point data.
+def build_inventory(years, output_dir='.', data_dir='.', workers=DEFAULT_VERIFY_WORKERS):
+    tiles = []
+    for year in years:
+        dataset = get_dataset(year)
+        products = [product for product in dataset.products if '.las' in product.extensions]  # Products with point clouds
+        if not products:
+            continue
+        catalogue = load_catalogue(os.path.join(data_dir, dataset.csv_file))
+        for product in products:
+            manifest_path = os.path.join(product.directory(None, output_dir), MANIFEST_NAME)
+            if not os.path.exists(manifest_path):  # Nothing of this product has been downloaded
+                continue
+            manifest = Manifest(manifest_path)
+            try:
+                fill_headers(manifest, workers)
+                records = manifest.records()
+            finally:
+                manifest.close()
+            positions = {os.path.basename(url): position for position, url in enumerate(catalogue.urls[product.url_column])}  # Catalogue row of each ZIP file
+            for record in records:
+                if record.get('status') != STATUS_COMPLETE:
+                    continue
+                position = positions.get(record['tile'])
+                name = catalogue.names[position] if position is not None else os.path.splitext(record['tile'])[0]
+                footprint = catalogue.footprint(position) if position is not None else None
+                for member in record.get('members', []):
+                    if _is_point_cloud(member['path']) and 'header' in member:
+                        tiles.append(InventoryTile(dataset.year, record['tile'], name, member['path'], footprint, LasHeaderInfo(**member['header'])))
+    return Inventory(tiles)
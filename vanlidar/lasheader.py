@@ -0,0 +1,55 @@
+import os  # Import the os module for file extensions
+import struct  # Import the struct module for decoding the public header block
+from collections import namedtuple  # Import namedtuple for the header records
+
+# Bytes read from the start of a file: the whole public header block of LAS 1.4 (smaller versions fit too)
+HEADER_READ_SIZE = 375
+
+# Layout of the fields shared by every LAS version, from the version number to the Z minimum
+_VERSION = struct.Struct('<BB')  # Major and minor version at byte 24
+_LAYOUT = struct.Struct('<IIBHI20x3d3d6d')  # Offset to points, VLR count, point format, record length, legacy count, (returns), scales, offsets, bounds
+
+# Extensions of the point cloud files whose headers are read
+POINT_CLOUD_EXTENSIONS = ('.las', '.laz')
+
+# Summary of a LAS/LAZ public header block. The point format has the LAZ compression bits cleared, the
+# point count is the 64-bit count of LAS 1.4 when present, and the bounds are in the file's own CRS.
+LasHeaderInfo = namedtuple('LasHeaderInfo', [
+    'version', 'point_format', 'point_count', 'point_offset', 'record_length',
+    'scale_x', 'scale_y', 'scale_z', 'offset_x', 'offset_y', 'offset_z',
+    'min_x', 'min_y', 'min_z', 'max_x', 'max_y', 'max_z',
+])
+
+
+# Raised when a file does not start with a LAS public header block
+class LasHeaderError(ValueError):
+    pass
+
+
+# Decode the public header block at the start of data (at least 227 bytes, 375 for the LAS 1.4 fields)
+def parse_las_header(data):
+    if len(data) < 227 or data[:4] != b'LASF':
+        raise LasHeaderError("Not a LAS file")
+    major, minor = _VERSION.unpack_from(data, 24)
+    point_offset, _, point_format, record_length, count, sx, sy, sz, ox, oy, oz, max_x, min_x, max_y, min_y, max_z, min_z = _LAYOUT.unpack_from(data, 96)
+    if minor >= 4 and len(data) >= 255:
+        count = struct.unpack_from('<Q', data, 247)[0] or count  # 64-bit point count of LAS 1.4
+    return LasHeaderInfo(f'{major}.{minor}', point_format & 0x3F, count, point_offset, record_length,
+                         sx, sy, sz, ox, oy, oz, min_x, min_y, min_z, max_x, max_y, max_z)
+
+
+# Read the public header block of a LAS or LAZ file
+def read_las_header(path):
+    with open(path, 'rb') as file:
+        return parse_las_header(file.read(HEADER_READ_SIZE))
+
+
+# Return the header of a point cloud file that has just been written, or None for other files and
+# for files whose header cannot be read (a damaged header never stops a download)
+def file_header(path):
+    if os.path.splitext(path)[1].lower() not in POINT_CLOUD_EXTENSIONS:
+        return None
+    try:
+        return read_las_header(path)
+    except (OSError, LasHeaderError):
+        return None
@@ -0,0 +1,171 @@
+import mmap  # Import the mmap module to map the point records into memory
+import os  # Import the os module for file sizes
+
+from .lasheader import HEADER_READ_SIZE, LasHeaderError, parse_las_header  # LAS header decoding
+
+try:  # NumPy is only needed for reading points
+    import numpy
+except ImportError:
+    numpy = None
+
+# Default number of points in each chunk yielded by LasReader.chunks (about 30 MB of format 6 records)
+DEFAULT_CHUNK_POINTS = 1000000
+
+# Fields of the legacy point formats 0 to 5 (LAS 1.0 to 1.3)
+_LEGACY_FIELDS = [('X', '<i4'), ('Y', '<i4'), ('Z', '<i4'), ('intensity', '<u2'), ('return_bits', 'u1'),
+                  ('classification_byte', 'u1'), ('scan_angle_rank', 'i1'), ('user_data', 'u1'), ('point_source_id', '<u2')]
+
+# Fields of the point formats 6 to 10 added by LAS 1.4
+_EXTENDED_FIELDS = [('X', '<i4'), ('Y', '<i4'), ('Z', '<i4'), ('intensity', '<u2'), ('return_bits', 'u1'),
+                    ('flag_bits', 'u1'), ('classification', 'u1'), ('user_data', 'u1'), ('scan_angle', '<i2'),
+                    ('point_source_id', '<u2'), ('gps_time', '<f8')]
+
+# Optional groups of fields appended to the base records
+_GPS_TIME = [('gps_time', '<f8')]
+_RGB = [('red', '<u2'), ('green', '<u2'), ('blue', '<u2')]
+_NIR = [('nir', '<u2')]
+_WAVEPACKET = [('wavepacket_index', 'u1'), ('wavepacket_offset', '<u8'), ('wavepacket_size', '<u4'),
+               ('return_point_wave_location', '<f4'), ('x_t', '<f4'), ('y_t', '<f4'), ('z_t', '<f4')]
+
+# Fields of every point format of the LAS specification. The 2013 and 2018 tiles use the legacy formats
+# (1 and 3), and the 2022 tiles the LAS 1.4 formats (6 to 8), but all of them are listed.
+POINT_FORMAT_FIELDS = {
+    0: _LEGACY_FIELDS,
+    1: _LEGACY_FIELDS + _GPS_TIME,
+    2: _LEGACY_FIELDS + _RGB,
+    3: _LEGACY_FIELDS + _GPS_TIME + _RGB,
+    4: _LEGACY_FIELDS + _GPS_TIME + _WAVEPACKET,
+    5: _LEGACY_FIELDS + _GPS_TIME + _RGB + _WAVEPACKET,
+    6: _EXTENDED_FIELDS,
+    7: _EXTENDED_FIELDS + _RGB,
+    8: _EXTENDED_FIELDS + _RGB + _NIR,
+    9: _EXTENDED_FIELDS + _WAVEPACKET,
+    10: _EXTENDED_FIELDS + _RGB + _NIR + _WAVEPACKET,
+}
+
+
+# Return the NumPy structured dtype of a point format. Records longer than the format (extra bytes
+# described by a VLR) get an opaque 'extra_bytes' field, so the layout always matches record_length.
+def point_dtype(point_format, record_length=None):
+    if numpy is None:
+        raise RuntimeError("Reading LAS points needs NumPy: pip install numpy")
+    if point_format not in POINT_FORMAT_FIELDS:
+        raise LasHeaderError(f"Unsupported point format {point_format}")
+    fields = list(POINT_FORMAT_FIELDS[point_format])
+    size = numpy.dtype(fields).itemsize
+    if record_length is not None and record_length > size:
+        fields.append(('extra_bytes', f'V{record_length - size}'))
+    elif record_length is not None and record_length < size:
+        raise LasHeaderError(f"Point records of {record_length} bytes are too short for point format {point_format}")
+    return numpy.dtype(fields)
+
+
+# Point records of a LAS file (or a slice of them) as a structured array, with the scaled coordinates
+# and the bit fields decoded on demand. Each property is one vectorised NumPy expression over the
+# records; nothing is cached, so a large file never holds more than the arrays the caller keeps.
+class PointRecords:
+    def __init__(self, array, header):
+        self.array = array  # Structured array, usually a read-only view of the memory-mapped file
+        self.header = header  # LasHeaderInfo of the file
+
+    def __len__(self):
+        return len(self.array)
+
+    # Return a raw field (e.g. 'intensity') or a PointRecords view of a slice or boolean mask
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.array[key]
+        return PointRecords(self.array[key], self.header)
+
+    @property
+    def x(self):
+        return self.array['X'] * self.header.scale_x + self.header.offset_x
+
+    @property
+    def y(self):
+        return self.array['Y'] * self.header.scale_y + self.header.offset_y
+
+    @property
+    def z(self):
+        return self.array['Z'] * self.header.scale_z + self.header.offset_z
+
+    # Return the scaled coordinates as an (n, 3) float64 array
+    def xyz(self):
+        return numpy.column_stack((self.x, self.y, self.z))
+
+    @property
+    def extended(self):
+        return self.header.point_format >= 6  # True for the LAS 1.4 point formats
+
+    @property
+    def return_number(self):
+        return self.array['return_bits'] & (0x0F if self.extended else 0x07)
+
+    @property
+    def number_of_returns(self):
+        return self.array['return_bits'] >> 4 if self.extended else (self.array['return_bits'] >> 3) & 0x07
+
+    @property
+    def classification(self):
+        return self.array['classification'] if self.extended else self.array['classification_byte'] & 0x1F
+
+    @property
+    def withheld(self):
+        return (self.array['flag_bits'] & 0x04 if self.extended else self.array['classification_byte'] & 0x80) != 0
+
+
+# Memory-mapped reader of an uncompressed LAS file. points is a zero-copy, read-only structured array
+# over the point records, so opening a tile costs a header read and touching points costs page faults.
+# chunks() walks the records in fixed-size slices, which is how files larger than RAM are processed:
+# pages of finished chunks are left for the operating system to drop. Typical use:
+#     with LasReader('VanLidar2022/4850E_54570N.las') as reader:
+#         for chunk in reader.chunks():
+#             ground = chunk[chunk.classification == 2]
+#             process(ground.x, ground.y, ground.z)
+class LasReader:
+    def __init__(self, path):
+        if numpy is None:
+            raise RuntimeError("Reading LAS points needs NumPy: pip install numpy")
+        self.path = path  # LAS file being read
+        with open(path, 'rb') as file:
+            data = file.read(HEADER_READ_SIZE)
+            self.header = parse_las_header(data)  # LasHeaderInfo of the file
+            if data[104] & 0x80:  # LAZ sets the top bit of the point format
+                raise LasHeaderError(f"{path} is compressed (LAZ); read it with laspy instead")
+            self.dtype = point_dtype(self.header.point_format, self.header.record_length)  # Layout of one record
+            end = self.header.point_offset + self.header.point_count * self.header.record_length  # End of the point records
+            if os.fstat(file.fileno()).st_size < end:
+                raise LasHeaderError(f"{path} is shorter than its header says")
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if self.header.point_count else None  # The mapping outlives the file object
+        if self._mmap is not None:
+            array = numpy.frombuffer(self._mmap, dtype=self.dtype, count=self.header.point_count, offset=self.header.point_offset)
+        else:
+            array = numpy.empty(0, dtype=self.dtype)
+        self.points = PointRecords(array, self.header)  # Every point record of the file
+
+    def __len__(self):
+        return self.header.point_count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Yield PointRecords views of chunk_size consecutive points, telling the operating system the
+    # file is read in order so it can read ahead and drop the pages behind
+    def chunks(self, chunk_size=DEFAULT_CHUNK_POINTS):
+        if self._mmap is not None and hasattr(mmap, 'MADV_SEQUENTIAL'):
+            self._mmap.madvise(mmap.MADV_SEQUENTIAL)
+        for start in range(0, len(self), max(1, int(chunk_size))):
+            yield self.points[start:start + chunk_size]
+
+    # Release the mapping. Arrays handed out earlier keep it alive until they are freed.
+    def close(self):
+        self.points = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:  # Still exported to a caller's array; it is unmapped when that array goes
+                pass
+            self._mmap = None
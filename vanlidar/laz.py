@@ -0,0 +1,107 @@
+import hashlib  # Import the hashlib module for the digest of the compressed file
+import io  # Import the io module to hand the buffered header to laspy
+import os  # Import the os module for file operations
+import struct  # Import the struct module for reading the LAS header fields
+
+from .lasheader import file_header  # Summary of the finished LAZ file
+from .unzip import ExtractedMember  # Record describing one member written to disk
+
+try:  # laspy (with the lazrs backend) is only needed for --laz
+    import laspy
+    from laspy.vlrs.vlrlist import VLRList
+except ImportError:
+    laspy = None
+
+# Number of points handed to the compressor at a time
+POINTS_PER_WRITE = 1000000
+
+# Amount of data read at a time while hashing the compressed file
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+# Return True if laspy and a LAZ backend are installed
+def laz_available():
+    return laspy is not None and bool(laspy.LazBackend.detect_available())
+
+
+# Member writer that compresses a LAS file to LAZ while its bytes arrive, so the raw LAS never
+# touches the disk. It has the same interface as unzip.MemberFile (write, commit, discard), and is
+# returned by Product.member_writer for .las members when a product is downloaded with --laz.
+# The public header block and VLRs are buffered until the point data starts, then points are passed
+# to laspy in batches, and any extended VLRs after the points (LAS 1.4) are copied at the end.
+# The LAZ file is written to "<tile>.laz.part" and renamed by commit().
+class LazFile:
+    def __init__(self, path, size=None):
+        if not laz_available():
+            raise RuntimeError("Writing LAZ files needs laspy with the lazrs backend: pip install laspy[lazrs]")
+        self.path = os.path.splitext(path)[0] + '.laz'  # Final path of the compressed file
+        self.size = 0  # Bytes of LAS data received
+        self._pending = bytearray()  # Received bytes not yet handed on
+        self._header = None  # LasHeader of the source, once its VLRs have arrived
+        self._writer = None  # laspy writer of the LAZ file
+        self._record_length = 0  # Bytes per point record
+        self._points_left = 0  # Point records still to come
+
+    def write(self, data):
+        self.size += len(data)
+        self._pending += data
+        if self._header is None:
+            if len(self._pending) < 100:  # Wait for the offset to the point data
+                return
+            offset, = struct.unpack_from('<I', self._pending, 96)  # Offset to the point data
+            if len(self._pending) < offset:  # Wait for the header and every VLR
+                return
+            self._open(offset)
+        if self._points_left:
+            count = min(len(self._pending) // self._record_length, self._points_left)  # Whole records received
+            if count >= POINTS_PER_WRITE or count == self._points_left:
+                self._write_points(count)
+
+    # Read the header and VLRs and start the LAZ file
+    def _open(self, offset):
+        self._header = laspy.LasHeader.read_from(io.BytesIO(bytes(self._pending[:offset])))
+        del self._pending[:offset]
+        self._record_length = self._header.point_format.size
+        self._points_left = self._header.point_count
+        self._writer = laspy.open(self.path + '.part', mode='w', header=self._header, do_compress=True)
+
+    # Compress the next count point records
+    def _write_points(self, count):
+        size = count * self._record_length
+        points = laspy.PackedPointRecord.from_buffer(self._pending[:size], self._header.point_format, count)  # One copy of the records
+        del self._pending[:size]
+        self._writer.write_points(points)
+        self._points_left -= count
+
+    # Finish the LAZ file and move it to its final name; name and crc describe the LAS member it came from.
+    # Returns the ExtractedMember record of the LAZ file, with its own size and SHA-256.
+    def commit(self, name, crc):
+        if self._header is None:
+            raise ValueError(f"{name} is not a LAS file")
+        if self._points_left:
+            count = min(len(self._pending) // self._record_length, self._points_left)
+            if count:
+                self._write_points(count)
+        if self._points_left:
+            raise ValueError(f"{name} ended {self._points_left} points early")
+        if self._header.number_of_evlrs and self._pending:  # Extended VLRs follow the points in LAS 1.4
+            self._writer.write_evlrs(VLRList.read_from(io.BytesIO(bytes(self._pending)), self._header.number_of_evlrs, extended=True))
+        self._writer.close()
+        self._writer = None
+        os.replace(self.path + '.part', self.path)
+        digest = hashlib.sha256()
+        with open(self.path, 'rb') as file:  # The LAZ file is several times smaller than the LAS and still cached
+            for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+        return ExtractedMember(name, self.path, os.path.getsize(self.path), None, digest.hexdigest(), file_header(self.path))
+
+    # Drop the partial LAZ file
+    def discard(self):
+        if self._writer is not None:
+            try:
+                self._writer.close()
+            except Exception:  # The file is being thrown away anyway
+                pass
+            self._writer = None
+        if os.path.exists(self.path + '.part'):
+            os.remove(self.path + '.part')
@@ -0,0 +1,241 @@
+import hashlib  # Import the hashlib module for checking the SHA-256 digests of extracted files
+import json  # Import the json module for the journal records
+import os  # Import the os module for file and directory operations
+import threading  # Import the threading module so workers can record tiles safely
+import time  # Import the time module for record timestamps
+import zlib  # Import the zlib module for checking the CRC-32 of files recorded without a digest
+from collections import Counter  # Import Counter for the per-extension file counts
+from concurrent.futures import ThreadPoolExecutor  # Import the thread pool used to check files in parallel
+
+from .lasheader import LasHeaderError, read_las_header  # LAS header decoding
+
+# Default file name of the manifest inside an output directory
+MANIFEST_NAME = 'manifest.jsonl'
+
+# Status of a tile whose files are all on disk
+STATUS_COMPLETE = 'complete'
+
+# Status of a tile whose files were found missing or changed by a verify run
+STATUS_MISSING = 'missing'
+
+# Status of a tile that could not be downloaded in its last run
+STATUS_FAILED = 'failed'
+
+# Status of a tile whose file on the server has changed since it was downloaded (found by --update);
+# its old files stay on disk until the new ones replace them
+STATUS_CHANGED = 'changed'
+
+# Default number of files checked at the same time by a verify run. Hashing releases the GIL,
+# so threads keep both the disks and the CPUs busy.
+DEFAULT_VERIFY_WORKERS = min(32, (os.cpu_count() or 1) * 2)
+
+# Amount of data read at a time while hashing a file
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+# Return the extension of a file name, e.g. '.las'
+def _extension(name):
+    return os.path.splitext(name)[1].lower()
+
+
+# Return the SHA-256 hex digest and the CRC-32 of a file, reading it once
+def file_checksums(path):
+    digest = hashlib.sha256()
+    crc = 0
+    with open(path, 'rb') as file:
+        while True:
+            data = file.read(HASH_BLOCK_SIZE)
+            if not data:
+                break
+            digest.update(data)
+            crc = zlib.crc32(data, crc)
+    return digest.hexdigest(), crc
+
+
+# Return False if a LAS file is shorter than its header says (offset to the point data plus the point
+# records), which is how a truncated transfer shows up. Files that are not LAS files are not checked.
+def las_complete(path):
+    if _extension(path) != '.las':
+        return True
+    try:
+        header = read_las_header(path)
+        size = os.path.getsize(path)
+    except (OSError, LasHeaderError):  # Missing, or too short for a public header block
+        return False
+    return size >= header.point_offset + header.point_count * header.record_length
+
+
+# Return the manifest entry of an ExtractedMember; LAS/LAZ files also keep their header summary
+def _member_record(member):
+    record = {'name': member.name, 'path': member.path, 'size': member.size, 'crc32': member.crc, 'sha256': member.sha256}
+    if member.header is not None:
+        record['header'] = member.header._asdict()
+    return record
+
+
+# Check one recorded file against the disk: it must exist with the recorded size and, when checksums is
+# True, with the recorded SHA-256 (or CRC-32 for files recorded before digests were kept).
+# Returns (intact, sha256), where sha256 is the digest read from disk, or the recorded one if not hashed.
+def check_member(member, checksums=False):
+    path = member['path']
+    try:
+        if os.path.getsize(path) != member['size']:
+            return False, None
+    except OSError:  # The file is gone
+        return False, None
+    if not checksums:
+        return las_complete(path), member.get('sha256')
+    sha256, crc = file_checksums(path)
+    if member.get('sha256'):
+        return sha256 == member['sha256'], sha256
+    if member.get('crc32') is not None:
+        return crc == member['crc32'], sha256
+    return las_complete(path), sha256  # Adopted files have nothing to compare with but their header
+
+
+# Append-only JSON-lines journal recording every tile that has been downloaded.
+# Each line holds the latest state of one tile: its URL, size, ETag/Last-Modified, the files extracted
+# from it (path, size, CRC-32 and SHA-256) and its status. The journal is replayed into a dictionary on start-up,
+# so skip decisions and file counts never have to touch the output directories.
+class Manifest:
+    def __init__(self, path):
+        self.path = path  # Location of the journal file
+        self.existed = os.path.exists(path)  # False the first time a tree is used with a manifest
+        self._tiles = {}  # Latest record of every tile, keyed by the ZIP file name
+        self._counts = Counter()  # Number of extracted files of each extension in complete tiles
+        self._lock = threading.Lock()  # Lock protecting the records and the journal file
+        lines = self._load()  # Replay the journal
+        if lines > 2 * len(self._tiles) + 100:  # If most lines are superseded records
+            self.compact()  # Rewrite the journal with one line per tile
+        self._file = open(path, 'a', encoding='utf-8')  # Open the journal for appending
+
+    # Replay the journal into memory, returning the number of lines read
+    def _load(self):
+        lines = 0  # Number of lines in the journal
+        if not self.existed:
+            return lines
+        with open(self.path, 'r', encoding='utf-8') as file:  # Open the journal in read mode
+            for line in file:
+                lines += 1
+                try:
+                    record = json.loads(line)  # Decode the record
+                except ValueError:  # A line cut short by a crash is ignored
+                    continue
+                self._apply(record)  # Make it the tile's latest state
+        return lines
+
+    # Make record the latest state of its tile and keep the file counts in step
+    def _apply(self, record):
+        previous = self._tiles.get(record['tile'])  # Record being replaced, if any
+        if previous is not None and previous.get('status') == STATUS_COMPLETE:
+            self._counts.subtract(_extension(member['path']) for member in previous.get('members', []))  # Forget its files
+        self._tiles[record['tile']] = record  # Store the new state
+        if record.get('status') == STATUS_COMPLETE:
+            self._counts.update(_extension(member['path']) for member in record.get('members', []))  # Count its files
+
+    # Return the latest record of a tile, or None if it has never been recorded
+    def get(self, tile):
+        return self._tiles.get(tile)
+
+    # Return the latest record of every tile
+    def records(self):
+        return list(self._tiles.values())
+
+    # Return True if every file of the tile is on disk according to the manifest
+    def is_complete(self, tile):
+        record = self._tiles.get(tile)
+        return record is not None and record.get('status') == STATUS_COMPLETE
+
+    # Return True if a complete tile has an extracted file with the given extension
+    def has_extension(self, tile, extension):
+        return self.is_complete(tile) and any(_extension(member['path']) == extension for member in self._tiles[tile].get('members', []))
+
+    # Return the number of extracted files with the given extension over all complete tiles
+    def count(self, extension):
+        return self._counts[extension]
+
+    # Record the new state of a tile and append it to the journal
+    def record(self, tile, status, url=None, size=None, etag=None, last_modified=None, members=(), **fields):
+        record = {
+            'tile': tile,  # ZIP file name of the tile
+            'status': status,  # complete, missing or failed
+            'url': url,  # Download URL
+            'size': size,  # Size of the ZIP file in bytes
+            'etag': etag,  # ETag sent by the server
+            'last_modified': last_modified,  # Last-Modified sent by the server
+            'members': [_member_record(m) if not isinstance(m, dict) else m for m in members],  # Extracted files
+            'time': time.time(),  # When the record was written
+        }
+        record.update(fields)  # Keep any extra fields the caller wants stored
+        with self._lock:  # Only one thread may write to the journal at a time
+            self._apply(record)  # Update the in-memory state
+            self._file.write(json.dumps(record) + '\n')  # Append the record
+            self._file.flush()  # Hand it to the operating system, so Ctrl+C does not lose it
+        return record
+
+    # Record a new state of a tile that changes only the given fields (e.g. status or etag) of its latest record
+    def update(self, tile, **changes):
+        record = dict(self._tiles[tile])
+        record.update(changes)
+        fields = {key: value for key, value in record.items() if key not in ('tile', 'status', 'url', 'size', 'etag', 'last_modified', 'members', 'time')}
+        return self.record(tile, record['status'], url=record.get('url'), size=record.get('size'), etag=record.get('etag'),
+                           last_modified=record.get('last_modified'), members=record.get('members', []), **fields)
+
+    # Store new member entries (e.g. with digests or headers filled in) for a recorded tile, keeping the rest of its record
+    def update_members(self, tile, members):
+        return self.update(tile, members=members)
+
+    # Rewrite the journal with only the latest record of each tile
+    def compact(self):
+        temporary_path = self.path + '.tmp'  # Write to a temporary file first
+        with open(temporary_path, 'w', encoding='utf-8') as file:
+            for record in self._tiles.values():
+                file.write(json.dumps(record) + '\n')  # One line per tile
+        os.replace(temporary_path, self.path)  # Swap it in atomically
+
+    # Check the manifest against the files on disk.
+    # Complete tiles whose files are missing, have a different size or (with checksums=True) a different
+    # SHA-256 are marked missing, and tiles that are not recorded but whose expected files all exist
+    # (e.g. downloaded before the manifest existed) are adopted. LAS files must also be as long as their
+    # header says, so truncated files are neither kept nor adopted. Files are checked by a pool of
+    # worker threads; records are written on the calling thread. Digests computed on the way are
+    # stored, so files recorded without one get it on their first checksum run.
+    # expected_paths(url) returns the files a tile is expected to produce. Returns (adopted, missing) counts.
+    def verify(self, urls, expected_paths, checksums=False, workers=DEFAULT_VERIFY_WORKERS):
+        checks = []  # (url, record or None, members to check) of every tile
+        for url in urls:
+            tile = os.path.basename(url)  # Tiles are keyed by their ZIP file name
+            record = self._tiles.get(tile)
+            if record is not None and record.get('status') == STATUS_COMPLETE:
+                checks.append((url, record, record.get('members', [])))
+            else:
+                paths = expected_paths(url)  # Files the tile should have produced
+                if record is not None and record.get('status') == STATUS_CHANGED:  # The files on disk are known to be out of date
+                    continue
+                if paths and all(os.path.exists(path) for path in paths):  # If they are all on disk already
+                    members = [{'name': os.path.basename(path), 'path': path, 'size': os.path.getsize(path), 'crc32': None, 'sha256': None} for path in paths]
+                    checks.append((url, None, members))
+
+        adopted = 0  # Tiles found on disk and added to the manifest
+        missing = 0  # Complete tiles whose files are gone or changed
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='vanlidar-verify') as executor:
+            results = executor.map(lambda check: [check_member(member, checksums) for member in check[2]], checks)  # Check the tiles in parallel
+            for (url, record, members), checked in zip(checks, results):
+                tile = os.path.basename(url)
+                intact = all(ok for ok, _ in checked)
+                digests = [dict(member, sha256=sha256) for member, (_, sha256) in zip(members, checked)]  # Members with their digests filled in
+                if record is not None:
+                    if not intact:
+                        self.record(tile, STATUS_MISSING, url=url)  # The tile has to be downloaded again
+                        missing += 1
+                    elif checksums and any(not member.get('sha256') for member in members):  # Store the digests of files recorded without one
+                        self.update_members(tile, digests)
+                elif intact:
+                    self.record(tile, STATUS_COMPLETE, url=url, members=digests, source='disk')  # Adopt the tile
+                    adopted += 1
+        return adopted, missing
+
+    # Close the journal file
+    def close(self):
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,148 @@
+import json  # Import the json module for the event records
+import os  # Import the os module for replacing the Prometheus file
+import threading  # Import the threading module so workers can report safely
+import time  # Import the time module for timestamps and stage timings
+from collections import defaultdict  # Import defaultdict for the counters
+from contextlib import contextmanager  # Import contextmanager for the stage timer
+
+# Stages a tile goes through, in pipeline order: waiting for room on the disk, opening the connection (DNS,
+# TCP and TLS), waiting for the response headers, receiving the body, extracting the members, checking the
+# archive, removing the ZIP file, and recording the tile in the manifest. Streamed tiles extract while they
+# download and have no cleanup.
+STAGES = ('disk_wait', 'connect', 'first_byte', 'transfer', 'extract', 'verify', 'cleanup', 'record')
+
+# Seconds between two rewrites of the Prometheus file while a run is going
+PROMETHEUS_INTERVAL = 10.0
+
+# Help text of the Prometheus metrics
+_HELP = {
+    'vanlidar_stage_seconds': 'Time spent in each stage of the tiles',
+    'vanlidar_tiles_total': 'Tiles finished, by product and outcome',
+    'vanlidar_bytes_received_total': 'Bytes received from the server for finished tiles',
+    'vanlidar_bytes_written_total': 'Bytes of extracted files written to disk',
+    'vanlidar_retries_total': 'Tile attempts that failed and were queued again',
+    'vanlidar_queue_depth': 'Tiles waiting in each queue of the pipeline',
+    'vanlidar_workers': 'Size of the download and extraction pools',
+}
+
+
+# Add the time spent in the with block to timings[stage]
+@contextmanager
+def stage_timer(timings, stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - started
+
+
+# Return the label set of a metric in Prometheus form, e.g. {product="2013 LiDAR",status="complete"}
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = [(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for key, value in labels]
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+# Per-stage timings and counters of a run, with two optional exports: a JSON-lines file with one event per
+# line (tiles, retries, failures, queue depths, start and end of runs), and a Prometheus text file (for the
+# node exporter's textfile collector) rewritten every PROMETHEUS_INTERVAL seconds and when the run ends.
+# Workers report from their own threads, so every method takes the lock. With no paths it only keeps the
+# totals in memory, which is what Downloader uses when no metrics are asked for.
+class Metrics:
+    def __init__(self, events_path=None, prometheus_path=None, interval=PROMETHEUS_INTERVAL):
+        self.events_path = events_path  # JSON-lines event file, or None
+        self.prometheus_path = prometheus_path  # Prometheus text file, or None
+        self.interval = interval  # Seconds between two rewrites of the Prometheus file
+        self.counters = defaultdict(float)  # (name, labels) -> running total
+        self.gauges = {}  # (name, labels) -> latest value
+        self.stages = defaultdict(lambda: [0, 0.0, 0.0])  # Stage -> [count, total seconds, longest]
+        self._lock = threading.Lock()  # Lock protecting the totals and the event file
+        for path in (events_path, prometheus_path):
+            if path:
+                os.makedirs(os.path.dirname(path) or '.', exist_ok=True)  # The files may go in the output folder, which may not exist yet
+        self._file = open(events_path, 'a', encoding='utf-8') if events_path else None  # Event file, appended to across runs
+        self._written = 0.0  # time.monotonic() of the last Prometheus rewrite
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Append an event of the given kind to the event file
+    def event(self, kind, **fields):
+        if self._file is None:
+            return
+        record = {'time': round(time.time(), 3), 'event': kind}
+        record.update(fields)
+        line = json.dumps(record) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()  # Hand it to the operating system, so a tail -f sees it straight away
+
+    # Add amount to a counter
+    def increment(self, name, amount=1, **labels):
+        with self._lock:
+            self.counters[name, tuple(sorted(labels.items()))] += amount
+
+    # Set a gauge to its current value
+    def set(self, name, value, **labels):
+        with self._lock:
+            self.gauges[name, tuple(sorted(labels.items()))] = value
+
+    # Add the stage timings of one tile (stage -> seconds) to the totals
+    def observe(self, timings):
+        with self._lock:
+            for stage, seconds in timings.items():
+                totals = self.stages[stage]
+                totals[0] += 1
+                totals[1] += seconds
+                totals[2] = max(totals[2], seconds)
+
+    # Return the totals as {stage: {'count', 'seconds', 'max'}}, in pipeline order
+    def stage_totals(self):
+        with self._lock:
+            order = sorted(self.stages, key=lambda stage: STAGES.index(stage) if stage in STAGES else len(STAGES))
+            return {stage: {'count': self.stages[stage][0], 'seconds': round(self.stages[stage][1], 3), 'max': round(self.stages[stage][2], 3)} for stage in order}
+
+    # Return the totals in the Prometheus text exposition format
+    def prometheus_text(self):
+        lines = []
+        stages = self.stage_totals()
+        if stages:
+            lines += [f"# HELP vanlidar_stage_seconds {_HELP['vanlidar_stage_seconds']}", '# TYPE vanlidar_stage_seconds summary']
+            for stage, totals in stages.items():
+                lines.append(f'vanlidar_stage_seconds_sum{{stage="{stage}"}} {totals["seconds"]}')
+                lines.append(f'vanlidar_stage_seconds_count{{stage="{stage}"}} {totals["count"]}')
+        with self._lock:
+            series = [(name, labels, value, 'counter') for (name, labels), value in self.counters.items()]
+            series += [(name, labels, value, 'gauge') for (name, labels), value in self.gauges.items()]
+        described = set()
+        for name, labels, value, kind in sorted(series, key=lambda entry: (entry[0], entry[1])):
+            if name not in described:
+                lines += [f"# HELP {name} {_HELP.get(name, name)}", f'# TYPE {name} {kind}']
+                described.add(name)
+            lines.append(f'{name}{_labels(labels)} {int(value) if float(value).is_integer() else value}')
+        lines += ['# HELP vanlidar_last_update_timestamp_seconds When this file was written', '# TYPE vanlidar_last_update_timestamp_seconds gauge',
+                  f'vanlidar_last_update_timestamp_seconds {time.time():.3f}']
+        return '\n'.join(lines) + '\n'
+
+    # Rewrite the Prometheus file if it is due (or always with force=True), replacing it atomically
+    # so the collector never reads half a file
+    def flush(self, force=False):
+        if self.prometheus_path is None or (not force and time.monotonic() - self._written < self.interval):
+            return
+        self._written = time.monotonic()
+        temporary_path = self.prometheus_path + '.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as file:
+            file.write(self.prometheus_text())
+        os.replace(temporary_path, self.prometheus_path)
+
+    # Write the Prometheus file a last time and close the event file
+    def close(self):
+        self.flush(force=True)
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,235 @@
+import json  # Import the json module for the list of rasters left out of a mosaic
+import math  # Import the math module to compare pixel sizes
+import os  # Import the os module for file and directory operations
+import xml.etree.ElementTree as ElementTree  # Import ElementTree to write the virtual mosaic
+from concurrent.futures import ThreadPoolExecutor  # Import the thread pool used to read the raster headers
+
+from .engine import DEFAULT_EXTRACT_WORKERS, ExtractionPool  # Process pool for the CPU-bound builds
+
+try:  # rasterio (with the GDAL it bundles) is only needed for --overviews
+    import rasterio
+    from rasterio.enums import Resampling
+    from rasterio.shutil import copy as copy_raster
+except ImportError:
+    rasterio = None
+
+# Sub-folder of a GeoTIFF folder holding the tiled copies and the mosaic
+COG_DIRECTORY = 'cog'
+
+# File name of the virtual mosaic over the tiled copies
+MOSAIC_NAME = 'mosaic.vrt'
+
+# Suffix of the file next to a mosaic listing the rasters left out of it, and why
+SKIPPED_SUFFIX = '.skipped.json'
+
+# Width and height of the internal tiles, in pixels
+DEFAULT_BLOCK_SIZE = 512
+
+# CRS given to tiles whose GeoTIFF has no CRS of its own (the 2013 tiles are georeferenced by .tfw world files)
+DEFAULT_CRS = 'EPSG:26910'  # NAD83 / UTM zone 10N
+
+# Extensions of the rasters that are processed
+RASTER_EXTENSIONS = ('.tif', '.tiff')
+
+# Relative difference allowed between the pixel sizes of the rasters of a mosaic
+RESOLUTION_TOLERANCE = 1e-6
+
+# GDAL names of the NumPy data types, for the mosaic
+GDAL_TYPES = {'uint8': 'Byte', 'int8': 'Int8', 'uint16': 'UInt16', 'int16': 'Int16', 'uint32': 'UInt32', 'int32': 'Int32',
+              'float32': 'Float32', 'float64': 'Float64'}
+
+
+# Return True if rasterio is installed
+def overviews_available():
+    return rasterio is not None
+
+
+# Return the overview factors (2, 4, 8, ...) of a raster, down to the level that fits in one block
+def overview_factors(width, height, block_size=DEFAULT_BLOCK_SIZE):
+    factors = []
+    factor = 2
+    while max(width, height) > block_size * factor // 2:
+        factors.append(factor)
+        factor *= 2
+    return factors
+
+
+# Copy a GeoTIFF to target as a cloud-optimised GeoTIFF: internally tiled, compressed, with a pyramid
+# of averaged overviews stored ahead of the full-resolution data. The tiles are first written to a
+# temporary file and given their overviews, then copied with COPY_SRC_OVERVIEWS so the layout is
+# the one COG readers expect. Runs in the worker processes of build_overviews.
+def build_cog(source, target, block_size=DEFAULT_BLOCK_SIZE, crs=DEFAULT_CRS, compress='deflate'):
+    temporary_path = target + '.tmp'  # Tiled copy before the overviews are moved to the front
+    options = {'tiled': True, 'blockxsize': block_size, 'blockysize': block_size, 'compress': compress, 'BIGTIFF': 'IF_SAFER'}
+    try:
+        with rasterio.open(source) as src:
+            profile = src.profile
+            profile.update(driver='GTiff', crs=src.crs or crs, **options)
+            options['predictor'] = profile['predictor'] = 3 if src.dtypes[0].startswith('float') else 2  # Difference coding suits imagery and elevations
+            with rasterio.open(temporary_path, 'w', **profile) as dst:
+                for _, window in dst.block_windows(1):  # Copy one output block at a time
+                    dst.write(src.read(window=window), window=window)
+                dst.build_overviews(overview_factors(src.width, src.height, block_size), Resampling.average)
+                dst.update_tags(ns='rio_overview', resampling='average')
+        copy_raster(temporary_path, target + '.part', driver='GTiff', copy_src_overviews=True, **options)
+        os.replace(target + '.part', target)
+    finally:
+        for path in (temporary_path, target + '.part'):
+            if os.path.exists(path):
+                os.remove(path)
+    return target
+
+
+# Return True if target is missing or older than its source GeoTIFF (or the source's world file)
+def _stale(source, target):
+    if not os.path.exists(target):
+        return True
+    inputs = [source] + [os.path.splitext(source)[0] + extension for extension in ('.tfw', '.tifw')]
+    newest = max(os.path.getmtime(path) for path in inputs if os.path.exists(path))
+    return os.path.getmtime(target) < newest
+
+
+# Return the header details of a raster that the mosaic needs
+def _raster_info(path):
+    with rasterio.open(path) as dataset:
+        return {'path': path, 'width': dataset.width, 'height': dataset.height, 'transform': dataset.transform, 'crs': dataset.crs,
+                'count': dataset.count, 'dtypes': dataset.dtypes, 'nodata': dataset.nodata, 'block_shapes': dataset.block_shapes,
+                'colorinterp': [interpretation.name for interpretation in dataset.colorinterp]}
+
+
+# Return the reason info cannot share a mosaic with first (resolution, CRS, band count or type), or None
+def _mismatch(info, first):
+    if not (math.isclose(info['transform'].a, first['transform'].a, rel_tol=RESOLUTION_TOLERANCE)
+            and math.isclose(info['transform'].e, first['transform'].e, rel_tol=RESOLUTION_TOLERANCE)):
+        return f"resolution {info['transform'].a:g} x {-info['transform'].e:g} differs from {first['transform'].a:g} x {-first['transform'].e:g} of {first['path']}"
+    if info['crs'] != first['crs']:
+        return f"CRS differs from that of {first['path']}"
+    if info['count'] != first['count'] or info['dtypes'] != first['dtypes']:
+        return f"bands ({info['count']} x {info['dtypes'][0]}) differ from those of {first['path']}"
+    return None
+
+
+# Write a GDAL virtual mosaic (VRT) over rasters that share a CRS, resolution, band count and type.
+# The VRT only holds the placement of every raster and a list of virtual overview levels; readers fetch
+# the pixels from the rasters and, at small scales, from their overviews. The file is replaced atomically.
+# Pixel sizes only have to agree within RESOLUTION_TOLERANCE; rasters that do not match the first one
+# are left out of the mosaic. Returns a dict mapping the rasters left out to the reason, which is also
+# kept in "<path>.skipped.json" (see mosaic_skipped) so later runs can report them without rewriting it.
+def write_mosaic(path, rasters):
+    with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 2)) as executor:
+        infos = list(executor.map(_raster_info, rasters))
+    if not infos:
+        raise ValueError("No rasters to mosaic")
+    first = infos[0]
+    resolution = (first['transform'].a, first['transform'].e)
+    skipped = {}
+    for info in infos:
+        reason = _mismatch(info, first)
+        if reason is not None:
+            skipped[info['path']] = reason
+    infos = [info for info in infos if info['path'] not in skipped]
+    min_x = min(info['transform'].c for info in infos)
+    max_y = max(info['transform'].f for info in infos)
+    max_x = max(info['transform'].c + info['width'] * resolution[0] for info in infos)
+    min_y = min(info['transform'].f + info['height'] * resolution[1] for info in infos)
+    width, height = round((max_x - min_x) / resolution[0]), round((min_y - max_y) / resolution[1])
+
+    root = ElementTree.Element('VRTDataset', rasterXSize=str(width), rasterYSize=str(height))
+    if first['crs'] is not None:
+        ElementTree.SubElement(root, 'SRS', dataAxisToSRSAxisMapping='1,2').text = first['crs'].to_wkt()
+    ElementTree.SubElement(root, 'GeoTransform').text = ', '.join(repr(value) for value in (min_x, resolution[0], 0.0, max_y, 0.0, resolution[1]))
+    factors = overview_factors(width, height, first['block_shapes'][0][1])
+    if factors:  # Virtual overviews of the whole mosaic, read from the overviews of the rasters (GDAL 3.2 and later)
+        ElementTree.SubElement(root, 'OverviewList', resampling='average').text = ' '.join(map(str, factors))
+    directory = os.path.dirname(os.path.abspath(path))
+    for band in range(first['count']):
+        element = ElementTree.SubElement(root, 'VRTRasterBand', dataType=GDAL_TYPES.get(first['dtypes'][band], 'Float64'), band=str(band + 1))
+        if first['nodata'] is not None:
+            ElementTree.SubElement(element, 'NoDataValue').text = repr(first['nodata'])
+        ElementTree.SubElement(element, 'ColorInterp').text = first['colorinterp'][band].capitalize()
+        for info in infos:
+            source = ElementTree.SubElement(element, 'SimpleSource')
+            ElementTree.SubElement(source, 'SourceFilename', relativeToVRT='1').text = os.path.relpath(os.path.abspath(info['path']), directory)
+            ElementTree.SubElement(source, 'SourceBand').text = str(band + 1)
+            block_height, block_width = info['block_shapes'][band]
+            ElementTree.SubElement(source, 'SourceProperties', RasterXSize=str(info['width']), RasterYSize=str(info['height']),
+                                   DataType=GDAL_TYPES.get(info['dtypes'][band], 'Float64'), BlockXSize=str(block_width), BlockYSize=str(block_height))
+            ElementTree.SubElement(source, 'SrcRect', xOff='0', yOff='0', xSize=str(info['width']), ySize=str(info['height']))
+            ElementTree.SubElement(source, 'DstRect', xOff=str(round((info['transform'].c - min_x) / resolution[0])), yOff=str(round((info['transform'].f - max_y) / resolution[1])),
+                                   xSize=str(info['width']), ySize=str(info['height']))
+    ElementTree.indent(root)
+    ElementTree.ElementTree(root).write(path + '.tmp', encoding='utf-8')
+    os.replace(path + '.tmp', path)
+    if skipped:
+        with open(path + SKIPPED_SUFFIX + '.tmp', 'w', encoding='utf-8') as file:
+            json.dump({os.path.relpath(os.path.abspath(raster), directory): reason for raster, reason in skipped.items()}, file, indent=1)
+        os.replace(path + SKIPPED_SUFFIX + '.tmp', path + SKIPPED_SUFFIX)
+    elif os.path.exists(path + SKIPPED_SUFFIX):
+        os.remove(path + SKIPPED_SUFFIX)
+    return skipped
+
+
+# Return the rasters the last write_mosaic left out of the mosaic at path, as {raster path: reason}
+def mosaic_skipped(path):
+    try:
+        with open(path + SKIPPED_SUFFIX, 'r', encoding='utf-8') as file:
+            skipped = json.load(file)
+    except (OSError, ValueError):  # No file means nothing was left out
+        return {}
+    return {os.path.join(os.path.dirname(path), raster): reason for raster, reason in skipped.items()}
+
+
+# Build tiled, compressed copies with overview pyramids of the GeoTIFFs in directory, in a pool of
+# worker processes, and a virtual mosaic over them. The build is incremental: only GeoTIFFs without
+# a copy, or changed since their copy was made, are rebuilt, and the mosaic is only rewritten when
+# a copy changed. The copies and the mosaic go to output_directory (directory/cog by default).
+# GeoTIFFs in sub-folders (the sharded layout, see datasets.tile_shard) are included.
+# Returns (built, failures, mosaic path), where failures maps source paths to error messages.
+def build_overviews(directory, output_directory=None, workers=DEFAULT_EXTRACT_WORKERS, block_size=DEFAULT_BLOCK_SIZE, crs=DEFAULT_CRS, echo=None):
+    if rasterio is None:
+        raise RuntimeError("Building overviews needs rasterio: pip install rasterio")
+    echo = echo or (lambda *args, **kwargs: None)
+    output_directory = output_directory or os.path.join(directory, COG_DIRECTORY)
+    os.makedirs(output_directory, exist_ok=True)
+    sources = []
+    for root, folders, names in os.walk(directory):
+        folders[:] = [folder for folder in folders if os.path.abspath(os.path.join(root, folder)) != os.path.abspath(output_directory)]  # Not the copies
+        sources += [os.path.join(root, name) for name in names if os.path.splitext(name)[1].lower() in RASTER_EXTENSIONS]
+    sources.sort()
+    targets = {source: os.path.join(output_directory, os.path.splitext(os.path.basename(source))[0] + '.tif') for source in sources}
+    stale = [source for source in sources if _stale(source, targets[source])]
+    echo(f"Building tiled overviews of {len(stale)} of {len(sources)} GeoTIFF files in {directory}...")
+
+    built = 0
+    failures = {}
+    pool = ExtractionPool(workers)
+
+    def collect(results):
+        nonlocal built
+        for source, result in results:
+            if isinstance(result, Exception):
+                failures[source] = f"{type(result).__name__}: {result}"
+            else:
+                built += 1
+
+    try:
+        for source in stale:
+            while pool.full:  # Keep a bounded number of builds queued
+                collect(pool.completed(block=True, return_exceptions=True))
+            pool.submit(source, build_cog, source, targets[source], block_size, crs)
+        collect(pool.drain(return_exceptions=True))
+    finally:
+        pool.close()
+
+    mosaic_path = os.path.join(output_directory, MOSAIC_NAME)
+    ready = [targets[source] for source in sources if os.path.exists(targets[source])]
+    if ready and (built or not os.path.exists(mosaic_path)):
+        skipped = write_mosaic(mosaic_path, ready)
+    else:
+        skipped = mosaic_skipped(mosaic_path)  # Still report the rasters an earlier run left out
+    sources_of = {target: source for source, target in targets.items()}
+    for target, reason in skipped.items():
+        if target in sources_of:
+            failures[sources_of[target]] = f"Left out of the mosaic: {reason}"
+    echo(f"Built {built} tiled GeoTIFF files; {len(failures)} could not be built. Mosaic: {mosaic_path}")
+    return built, failures, mosaic_path
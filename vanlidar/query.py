@@ -0,0 +1,143 @@
+import os  # Import the os module for file extensions
+from collections import namedtuple  # Import namedtuple for the point batches
+
+from .datasets import DATASETS  # Years that can be queried
+from .downloader import fetch  # Downloads of the missing tiles
+from .inventory import build_inventory  # Point cloud tiles on disk with their headers and footprints
+from .lasheader import read_las_header  # Header of LAZ files, in the same form as for LAS files
+from .lasreader import DEFAULT_CHUNK_POINTS, LasReader, PointRecords, point_dtype  # Memory-mapped point reader
+from .spatial import BoundingBox, PointRadius, PolygonArea, bounds_intersect, lonlat_to_utm  # Query areas and their projection
+
+try:  # NumPy is only needed for reading points
+    import numpy
+except ImportError:
+    numpy = None
+
+try:  # laspy is only needed for tiles downloaded with --laz
+    import laspy
+except ImportError:
+    laspy = None
+
+# Points per edge when a longitude/latitude box is projected, since its edges curve slightly in UTM
+BOX_EDGE_POINTS = 16
+
+# Points kept from one tile at a time: the points of one chunk that fall inside the query area
+# year and name identify the tile, path is the LAS/LAZ file and points the matching PointRecords
+PointBatch = namedtuple('PointBatch', ['year', 'name', 'path', 'points'])
+
+
+# Raised when tiles touching the query area could not be downloaded
+class MissingTilesError(RuntimeError):
+    def __init__(self, failures):
+        super().__init__(f"{len(failures)} tiles touching the query area could not be downloaded")
+        self.failures = failures  # URL -> error message
+
+
+# A query area (BoundingBox, PolygonArea or PointRadius in longitude/latitude) projected to the UTM
+# coordinates of the point records, with a vectorised test of which points fall inside it
+class ProjectedArea:
+    def __init__(self, area):
+        self.rings = []  # Projected outer rings, as (x array, y array)
+        self.circle = None  # (x, y, radius) of a PointRadius
+        if isinstance(area, PointRadius):
+            x, y = lonlat_to_utm(area.lon, area.lat)
+            self.circle = (x, y, area.radius)
+            self.bounds = (x - area.radius, y - area.radius, x + area.radius, y + area.radius)
+            return
+        if isinstance(area, BoundingBox):
+            rings = [_box_ring(area.bounds)]
+        elif isinstance(area, PolygonArea):
+            rings = area.rings
+        else:
+            raise TypeError(f"Unsupported query area {area!r}")
+        for ring in rings:
+            points = [lonlat_to_utm(lon, lat) for lon, lat in ring]
+            self.rings.append((numpy.array([x for x, _ in points]), numpy.array([y for _, y in points])))
+        self.bounds = (min(xs.min() for xs, _ in self.rings), min(ys.min() for _, ys in self.rings),
+                       max(xs.max() for xs, _ in self.rings), max(ys.max() for _, ys in self.rings))
+
+    # Return a boolean array telling which of the points (x, y arrays) are inside the area
+    def contains(self, x, y):
+        if self.circle is not None:
+            cx, cy, radius = self.circle
+            return (x - cx) ** 2 + (y - cy) ** 2 <= radius * radius
+        inside = numpy.zeros(len(x), dtype=bool)
+        for xs, ys in self.rings:
+            inside |= _points_in_ring(x, y, xs, ys)
+        return inside
+
+
+# Return the ring of a (min lon, min lat, max lon, max lat) box with BOX_EDGE_POINTS points on each edge
+def _box_ring(bounds):
+    min_lon, min_lat, max_lon, max_lat = bounds
+    steps = [i / BOX_EDGE_POINTS for i in range(BOX_EDGE_POINTS)]
+    ring = [(min_lon + (max_lon - min_lon) * s, min_lat) for s in steps]
+    ring += [(max_lon, min_lat + (max_lat - min_lat) * s) for s in steps]
+    ring += [(max_lon - (max_lon - min_lon) * s, max_lat) for s in steps]
+    ring += [(min_lon, max_lat - (max_lat - min_lat) * s) for s in steps]
+    return ring + [ring[0]]
+
+
+# Even-odd test of many points against one ring: one vectorised pass over the points per ring edge.
+# Points outside the ring's bounds are rejected first, so the edge loop only sees nearby points.
+def _points_in_ring(x, y, xs, ys):
+    inside = numpy.zeros(len(x), dtype=bool)
+    candidates = numpy.flatnonzero((x >= xs.min()) & (x <= xs.max()) & (y >= ys.min()) & (y <= ys.max()))
+    if not len(candidates):
+        return inside
+    px, py = x[candidates], y[candidates]
+    crossings = numpy.zeros(len(candidates), dtype=bool)
+    for i in range(len(xs) - 1):
+        x0, y0, x1, y1 = xs[i], ys[i], xs[i + 1], ys[i + 1]
+        if y0 == y1:  # Horizontal edges never cross the ray
+            continue
+        straddles = (y0 > py) != (y1 > py)
+        crossings ^= straddles & (px < (x1 - x0) * (py - y0) / (y1 - y0) + x0)
+    inside[candidates] = crossings
+    return inside
+
+
+# Yield PointRecords chunks of a LAS file (memory-mapped) or a LAZ file (decompressed by laspy)
+def read_chunks(path, chunk_size=DEFAULT_CHUNK_POINTS):
+    if os.path.splitext(path)[1].lower() != '.laz':
+        with LasReader(path) as reader:
+            yield from reader.chunks(chunk_size)
+        return
+    if laspy is None:
+        raise RuntimeError("Reading LAZ files needs laspy with the lazrs backend: pip install laspy[lazrs]")
+    with laspy.open(path) as reader:
+        header = None
+        for chunk in reader.chunk_iterator(chunk_size):
+            if header is None:
+                header = read_las_header(path)
+                dtype = point_dtype(header.point_format, chunk.array.dtype.itemsize)
+            yield PointRecords(chunk.array.view(dtype), header)  # Same record bytes, under this module's field names
+
+
+# Stream the points inside area (a BoundingBox, PolygonArea or PointRadius in longitude/latitude) from
+# the tiles of the given years. The catalogue footprints pick the tiles; with fetch_missing=True the
+# tiles that are not on disk yet are downloaded first (other keyword options go to fetch, e.g. jobs or laz,
+# and are refused with a TypeError when nothing is fetched).
+# Each tile is read in chunks of chunk_size points, every chunk is filtered with NumPy, and one
+# PointBatch is yielded per chunk that has points inside the area, so memory use depends on chunk_size
+# and not on the size of the area. Coordinates are compared in UTM zone 10, the CRS of the City's tiles.
+def query_points(area, years=None, output_dir='.', data_dir='.', fetch_missing=True, chunk_size=DEFAULT_CHUNK_POINTS, echo=None, **options):
+    if numpy is None:
+        raise RuntimeError("Reading LAS points needs NumPy: pip install numpy")
+    if options and not fetch_missing:
+        raise TypeError(f"query_points() options {', '.join(sorted(options))} only apply with fetch_missing=True")
+    years = sorted(DATASETS) if years is None else list(years)
+    if fetch_missing:
+        runs = fetch(years, output_dir=output_dir, data_dir=data_dir, area=area, products=['LiDAR'], echo=echo, **options)  # Download the missing tiles of the area
+        failures = {url: message for run in runs for url, message in run.failures.items()}
+        if failures:
+            raise MissingTilesError(failures)
+    projected = ProjectedArea(area)
+    for tile in build_inventory(years, output_dir=output_dir, data_dir=data_dir).query(area=area):
+        header = tile.header
+        if not bounds_intersect((header.min_x, header.min_y, header.max_x, header.max_y), projected.bounds):  # The footprint touches but no point can
+            continue
+        for chunk in read_chunks(tile.path, chunk_size):
+            inside = projected.contains(chunk.x, chunk.y)
+            if inside.any():
+                yield PointBatch(tile.year, tile.name, tile.path, chunk[inside])  # Copies only the matching records
@@ -0,0 +1,228 @@
+import errno  # Import the errno module for the out-of-space error
+import heapq  # Import heapq for the work items held back until their time
+import itertools  # Import itertools for the order of the held-back items
+import os  # Import the os module for the device of a folder
+import random  # Import the random module for the backoff jitter
+import shutil  # Import the shutil module for the free space of a disk
+import threading  # Import the threading module for the limiter lock
+import time  # Import the time module for the limiter clock
+import zipfile  # Import the zipfile module for its damaged archive error
+import zlib  # Import the zlib module for its decompression error
+from collections import deque  # Import deque for the work queue
+from concurrent.futures.process import BrokenProcessPool  # Import the error raised when an extraction process dies
+from email.utils import parsedate_to_datetime  # Import parsedate_to_datetime for Retry-After dates
+
+import requests  # Import the requests module for its exception types
+
+from .transfer import IncompleteDownloadError  # Raised when a body ends before its declared length
+from .unzip import StreamZipError  # Raised when a download cannot be extracted as a stream
+
+# Default number of times a failed tile is tried again before it counts as a permanent failure
+DEFAULT_RETRIES = 5
+
+# Base and cap (in seconds) of the exponential backoff between attempts
+DEFAULT_BACKOFF = 2.0
+DEFAULT_BACKOFF_CAP = 300.0
+
+# Default free space (in bytes) kept on the output disk: tiles wait while starting them would leave less
+DEFAULT_MIN_FREE = 1024 ** 3
+
+# Seconds between two checks of the free space while tiles are waiting for it
+DISK_POLL_INTERVAL = 2.0
+
+# HTTP statuses worth retrying; other 4xx errors (e.g. 404) will not go away by asking again
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+# Errors that mean the transfer or the data was damaged and the tile may well succeed next time
+TRANSIENT_ERRORS = (requests.RequestException, IncompleteDownloadError, StreamZipError, zipfile.BadZipFile, zlib.error, EOFError)
+
+
+# Token bucket shared by every worker thread, used for both the request rate and the byte rate.
+# acquire() takes the tokens straight away and then sleeps off any debt, so one large chunk is allowed
+# through and the next caller waits for it to be paid back.
+class RateLimiter:
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)  # Tokens added per second
+        self.capacity = float(burst or rate)  # Most tokens that can be saved up
+        self._tokens = self.capacity  # Tokens available now
+        self._last = time.monotonic()  # When the bucket was last refilled
+        self._lock = threading.Lock()  # Lock protecting the bucket
+
+    # Take amount tokens, sleeping until the bucket is out of debt. stop (a threading.Event) cuts the wait short.
+    def acquire(self, amount=1, stop=None):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)  # Refill for the time that passed
+            self._last = now
+            self._tokens -= amount  # Take the tokens, possibly going into debt
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0  # Time until the debt is paid back
+        if wait > 0:
+            if stop is not None:
+                stop.wait(wait)
+            else:
+                time.sleep(wait)
+
+
+# When and how often failed tiles are tried again: capped exponential backoff with full jitter
+# (a random delay between 0 and min(cap, base * 2 ** attempt)), stretched to any Retry-After the server sent.
+class RetryPolicy:
+    def __init__(self, retries=DEFAULT_RETRIES, base=DEFAULT_BACKOFF, cap=DEFAULT_BACKOFF_CAP):
+        self.retries = max(0, int(retries))  # Attempts after the first one
+        self.base = float(base)  # Delay scale in seconds
+        self.cap = float(cap)  # Longest delay in seconds
+
+    # Return True if error is worth another attempt
+    @staticmethod
+    def retryable(error):
+        if isinstance(error, requests.HTTPError) and error.response is not None:
+            return error.response.status_code in RETRY_STATUSES
+        return isinstance(error, TRANSIENT_ERRORS)
+
+    # Return True if a tile that failed with error on the given attempt (0 for the first) should be tried again
+    def should_retry(self, error, attempt):
+        return attempt < self.retries and self.retryable(error)
+
+    # Return the number of seconds to wait before the next attempt
+    def delay(self, attempt, error=None):
+        backoff = random.uniform(0, min(self.cap, self.base * 2 ** attempt))  # Full jitter
+        return max(backoff, min(self.cap, retry_after(error)))
+
+
+# Return the delay a 429/503 response asked for in its Retry-After header, or 0
+def retry_after(error):
+    response = getattr(error, 'response', None)
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not value:
+        return 0.0
+    try:
+        return max(0.0, float(value))  # Delay in seconds
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())  # HTTP date
+    except (TypeError, ValueError):
+        return 0.0
+
+
+# Disk space promised to one tile by DiskBudget.reserve, given back with release() once its files are
+# written (or it failed). waited is how long the tile had to wait for the space, in seconds.
+class Reservation:
+    def __init__(self, budget, device, amount, waited=0.0):
+        self.budget = budget  # DiskBudget the space was reserved from, or None if space is not tracked
+        self.device = device  # Device of the output folder
+        self.amount = amount  # Bytes reserved
+        self.waited = waited  # Seconds spent waiting for the space
+
+    # Reserve amount more bytes for the same tile (e.g. a ZIP file that has to be saved after all), waiting
+    # like DiskBudget.reserve; the space already held does not count as space another tile could free
+    def grow(self, directory, amount, wait_until=None):
+        if self.budget is None or not amount:
+            return
+        extra = self.budget.reserve(directory, amount, wait_until, held=self.amount)
+        self.amount += extra.amount
+        self.waited += extra.waited
+
+    # Give the space back; calling it again does nothing
+    def release(self):
+        if self.budget is not None:
+            self.budget._release(self)
+            self.budget = None
+
+
+# Free disk space shared out between the tiles in flight. Before a tile starts, reserve() checks that the
+# disk holding its output folder has room for everything the tile will write on top of what the tiles
+# already running have reserved, while keeping min_free bytes spare. If not, the worker waits, polling
+# the disk, until running tiles finish (or other programs free space). When nothing else is running and
+# the tile still does not fit, waiting would never end, so an out-of-space OSError is raised, which stops
+# the run before a half-written file is left behind. A reservation stays counted while its files are
+# being written, so the free space is underestimated rather than overestimated.
+class DiskBudget:
+    def __init__(self, min_free=DEFAULT_MIN_FREE, poll_interval=DISK_POLL_INTERVAL):
+        self.min_free = max(0, int(min_free))  # Bytes always left free
+        self.poll_interval = poll_interval  # Seconds between two checks while waiting
+        self.waiting = 0  # Tiles waiting for space right now
+        self._reserved = {}  # Device -> bytes reserved by running tiles
+        self._lock = threading.Lock()  # Lock protecting the reservations
+
+    # Reserve amount bytes on the disk of directory, waiting until they fit. wait_until (e.g.
+    # DownloadEngine.wait_until) sleeps until a time.monotonic() deadline and returns False if the run is
+    # stopping, in which case the space is reserved anyway so the caller can wind down.
+    # held is the part of the reserved space that belongs to the caller itself (see Reservation.grow).
+    def reserve(self, directory, amount, wait_until=None, held=0):
+        device = os.stat(directory).st_dev  # Reservations are shared by every folder of a disk
+        started = time.monotonic()
+        waiting = False
+        stopping = False
+        try:
+            while True:
+                with self._lock:
+                    free = shutil.disk_usage(directory).free  # Space left on the disk now
+                    reserved = self._reserved.get(device, 0)  # Space promised to running tiles and not written yet
+                    if free - reserved - amount >= self.min_free or stopping:
+                        self._reserved[device] = reserved + amount
+                        return Reservation(self, device, amount, time.monotonic() - started)
+                    if reserved <= held:  # Nothing running will free any space
+                        raise OSError(errno.ENOSPC, f"{directory} has {free / 1024 ** 3:.1f} GB free; a tile needing {amount / 1024 ** 2:.0f} MB "
+                                                    f"would leave less than the {self.min_free / 1024 ** 3:.1f} GB to keep free")
+                    if not waiting:
+                        waiting = True
+                        self.waiting += 1
+                if wait_until is not None:
+                    stopping = not wait_until(time.monotonic() + self.poll_interval)
+                else:
+                    time.sleep(self.poll_interval)
+        finally:
+            if waiting:
+                with self._lock:
+                    self.waiting -= 1
+
+    def _release(self, reservation):
+        with self._lock:
+            self._reserved[reservation.device] -= reservation.amount
+
+
+# Return True for errors that are about this machine rather than one tile (a full disk, a missing
+# folder, a dead extraction process); these still stop the whole run
+def is_fatal(error):
+    if isinstance(error, BrokenProcessPool):
+        return True
+    return isinstance(error, OSError) and not isinstance(error, (requests.RequestException, IncompleteDownloadError))
+
+
+# FIFO of work items that can be added to while DownloadEngine.run is consuming it. Unlike a generator,
+# it can run dry and be refilled: the engine asks for the next item each time a tile finishes.
+# An item pushed with a not_before time (a retry waiting out its backoff) is held back until then: it
+# counts in len() but is only handed out once it is due, and next_due() tells the engine how long to
+# wait for it, so no worker thread sits idle through the delay.
+class WorkQueue:
+    def __init__(self, items=()):
+        self._items = deque(items)  # Items ready to start
+        self._delayed = []  # Heap of (not_before, sequence, item) waiting for their time
+        self._sequence = itertools.count()  # Keeps items due at the same time in the order they were pushed
+
+    def __len__(self):
+        return len(self._items) + len(self._delayed)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:  # Move the items whose time has come to the end of the queue
+            self._items.append(heapq.heappop(self._delayed)[2])
+        if not self._items:
+            raise StopIteration
+        return self._items.popleft()
+
+    # Add an item to the end of the queue, or hold it back until the time.monotonic() not_before
+    def push(self, item, not_before=None):
+        if not_before is not None and not_before > time.monotonic():
+            heapq.heappush(self._delayed, (not_before, next(self._sequence), item))
+        else:
+            self._items.append(item)
+
+    # Return the seconds until the next held-back item is due (0 if it is due now), or None if nothing is held back
+    def next_due(self):
+        if not self._delayed:
+            return None
+        return max(0.0, self._delayed[0][0] - time.monotonic())
@@ -0,0 +1,204 @@
+import json  # Import the json module for reading GeoJSON files
+import math  # Import the math module for distances on the sphere
+from collections import defaultdict  # Import defaultdict for the grid cells
+
+# Metres per degree of latitude (and of longitude at the equator)
+METRES_PER_DEGREE = 111320.0
+
+# UTM zone of the City's tiles (NAD83 / UTM zone 10N; tile names are their lower-left UTM corner)
+UTM_ZONE = 10
+
+# GRS80 ellipsoid and UTM scale factor, for lonlat_to_utm
+_SEMI_MAJOR_AXIS = 6378137.0
+_FLATTENING = 1 / 298.257222101
+_UTM_SCALE = 0.9996
+
+
+# Return the (min x, min y, max x, max y) bounds of a list of (x, y) points
+def ring_bounds(ring):
+    xs = [x for x, _ in ring]
+    ys = [y for _, y in ring]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+# Project a longitude/latitude point to UTM easting/northing (northern hemisphere), using the series
+# expansion of the transverse Mercator projection, which is accurate to well under a millimetre
+# within a zone. This is enough to compare the catalogue's coordinates with the tiles' own.
+def lonlat_to_utm(lon, lat, zone=UTM_ZONE):
+    n = _FLATTENING / (2 - _FLATTENING)  # Third flattening
+    radius = _SEMI_MAJOR_AXIS / (1 + n) * (1 + n * n / 4 + n ** 4 / 64)  # Rectifying radius
+    alpha = (n / 2 - 2 * n * n / 3 + 5 * n ** 3 / 16, 13 * n * n / 48 - 3 * n ** 3 / 5, 61 * n ** 3 / 240)
+    e = 2 * math.sqrt(n) / (1 + n)  # Eccentricity
+    phi = math.radians(lat)
+    dlon = math.radians(lon - (6 * zone - 183))  # Longitude from the zone's central meridian
+    t = math.sinh(math.atanh(math.sin(phi)) - e * math.atanh(e * math.sin(phi)))
+    xi = math.atan2(t, math.cos(dlon))
+    eta = math.atanh(math.sin(dlon) / math.sqrt(1 + t * t))
+    northing = xi + sum(a * math.sin(2 * j * xi) * math.cosh(2 * j * eta) for j, a in enumerate(alpha, 1))
+    easting = eta + sum(a * math.cos(2 * j * xi) * math.sinh(2 * j * eta) for j, a in enumerate(alpha, 1))
+    return 500000.0 + _UTM_SCALE * radius * easting, _UTM_SCALE * radius * northing
+
+
+# Return True if two (min x, min y, max x, max y) boxes overlap
+def bounds_intersect(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+# Return True if the point (x, y) lies inside the ring (even-odd rule)
+def point_in_ring(x, y, ring):
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        xi, yi = ring[i]
+        xj, yj = ring[j]
+        if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:  # If the edge crosses the ray to the right of the point
+            inside = not inside
+        j = i
+    return inside
+
+
+# Return True if segments p1-p2 and q1-q2 intersect
+def _segments_intersect(p1, p2, q1, q2):
+    def orientation(a, b, c):
+        value = (b[1] - a[1]) * (c[0] - b[0]) - (b[0] - a[0]) * (c[1] - b[1])
+        return (value > 0) - (value < 0)
+
+    def on_segment(a, b, c):
+        return min(a[0], c[0]) <= b[0] <= max(a[0], c[0]) and min(a[1], c[1]) <= b[1] <= max(a[1], c[1])
+
+    o1, o2 = orientation(p1, p2, q1), orientation(p1, p2, q2)
+    o3, o4 = orientation(q1, q2, p1), orientation(q1, q2, p2)
+    if o1 != o2 and o3 != o4:
+        return True
+    return (o1 == 0 and on_segment(p1, q1, p2)) or (o2 == 0 and on_segment(p1, q2, p2)) or \
+        (o3 == 0 and on_segment(q1, p1, q2)) or (o4 == 0 and on_segment(q1, p2, q2))
+
+
+# Return True if two rings overlap (share area or touch)
+def rings_intersect(a, b):
+    if not bounds_intersect(ring_bounds(a), ring_bounds(b)):  # Cheap rejection on the bounding boxes
+        return False
+    if point_in_ring(a[0][0], a[0][1], b) or point_in_ring(b[0][0], b[0][1], a):  # One ring inside the other
+        return True
+    for i in range(len(a) - 1):
+        for j in range(len(b) - 1):
+            if _segments_intersect(a[i], a[i + 1], b[j], b[j + 1]):  # Crossing edges
+                return True
+    return False
+
+
+# Rectangle in longitude/latitude, e.g. from --bbox
+class BoundingBox:
+    def __init__(self, min_lon, min_lat, max_lon, max_lat):
+        if min_lon > max_lon or min_lat > max_lat:
+            raise ValueError("Bounding box must be given as MIN_LON MIN_LAT MAX_LON MAX_LAT")
+        self.bounds = (min_lon, min_lat, max_lon, max_lat)
+
+    def intersects(self, footprint):
+        ring = [(self.bounds[0], self.bounds[1]), (self.bounds[2], self.bounds[1]), (self.bounds[2], self.bounds[3]), (self.bounds[0], self.bounds[3]), (self.bounds[0], self.bounds[1])]
+        return rings_intersect(ring, footprint)
+
+
+# One or more polygons in longitude/latitude, e.g. from --polygon file.geojson (holes are ignored)
+class PolygonArea:
+    def __init__(self, rings):
+        self.rings = [[(float(x), float(y)) for x, y, *_ in ring] for ring in rings]  # Outer rings, dropping any Z values
+        if not self.rings:
+            raise ValueError("No polygons found")
+        bounds = [ring_bounds(ring) for ring in self.rings]
+        self.bounds = (min(b[0] for b in bounds), min(b[1] for b in bounds), max(b[2] for b in bounds), max(b[3] for b in bounds))
+
+    def intersects(self, footprint):
+        return any(rings_intersect(ring, footprint) for ring in self.rings)
+
+    # Read the outer rings of every Polygon and MultiPolygon in a GeoJSON file
+    @classmethod
+    def from_geojson(cls, path):
+        with open(path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        rings = []
+
+        def collect(obj):
+            kind = obj.get('type')
+            if kind == 'FeatureCollection':
+                for feature in obj.get('features', []):
+                    collect(feature)
+            elif kind == 'Feature':
+                if obj.get('geometry'):
+                    collect(obj['geometry'])
+            elif kind == 'GeometryCollection':
+                for geometry in obj.get('geometries', []):
+                    collect(geometry)
+            elif kind == 'Polygon':
+                rings.append(obj['coordinates'][0])  # Outer ring of the polygon
+            elif kind == 'MultiPolygon':
+                rings.extend(polygon[0] for polygon in obj['coordinates'])  # Outer ring of every part
+
+        collect(data)
+        return cls(rings)
+
+
+# Circle of radius metres around a latitude/longitude point, e.g. from --point and --radius
+class PointRadius:
+    def __init__(self, lat, lon, radius=0.0):
+        self.lat, self.lon, self.radius = float(lat), float(lon), max(0.0, float(radius))
+        self._x_scale = METRES_PER_DEGREE * math.cos(math.radians(self.lat))  # Metres per degree of longitude at this latitude
+        dlat = self.radius / METRES_PER_DEGREE
+        dlon = self.radius / self._x_scale
+        self.bounds = (self.lon - dlon, self.lat - dlat, self.lon + dlon, self.lat + dlat)
+
+    # Distance in metres from the point to the segment a-b (local flat approximation, fine at tile scale)
+    def _distance_to_segment(self, a, b):
+        ax, ay = (a[0] - self.lon) * self._x_scale, (a[1] - self.lat) * METRES_PER_DEGREE
+        bx, by = (b[0] - self.lon) * self._x_scale, (b[1] - self.lat) * METRES_PER_DEGREE
+        dx, dy = bx - ax, by - ay
+        length = dx * dx + dy * dy
+        t = 0.0 if length == 0 else max(0.0, min(1.0, -(ax * dx + ay * dy) / length))
+        return math.hypot(ax + t * dx, ay + t * dy)
+
+    def intersects(self, footprint):
+        if point_in_ring(self.lon, self.lat, footprint):  # The point lies inside the tile
+            return True
+        return any(self._distance_to_segment(footprint[i], footprint[i + 1]) <= self.radius for i in range(len(footprint) - 1))
+
+
+# Parse "LAT,LON" from the command line
+def parse_point(text):
+    try:
+        lat, lon = (float(value) for value in text.split(','))
+    except ValueError:
+        raise ValueError(f"Point must be given as LAT,LON, not {text!r}")
+    return lat, lon
+
+
+# Uniform grid over the tile footprints. Each tile is registered in every cell its bounds touch, so a
+# query only has to test the tiles in the cells its own bounds touch.
+class TileIndex:
+    def __init__(self, tiles, cell_size=None, bounds=None):
+        if bounds is None:  # Work the bounds out unless the catalogue already has them
+            tiles = [tile for tile in tiles if tile.footprint]  # Tiles that have a footprint
+            bounds = [ring_bounds(tile.footprint) for tile in tiles]
+        self.tiles = list(tiles)
+        self._bounds = list(bounds)  # Bounds of every tile
+        if cell_size is None and self._bounds:
+            widths = sorted(b[2] - b[0] for b in self._bounds)
+            cell_size = widths[len(widths) // 2] or 1.0  # About one tile per cell
+        self.cell_size = cell_size or 1.0
+        self._cells = defaultdict(list)  # Grid cell -> positions of the tiles touching it
+        for position, bounds in enumerate(self._bounds):
+            for cell in self._cells_for(bounds):
+                self._cells[cell].append(position)
+
+    # Return every grid cell touched by the bounds
+    def _cells_for(self, bounds):
+        x0, y0 = math.floor(bounds[0] / self.cell_size), math.floor(bounds[1] / self.cell_size)
+        x1, y1 = math.floor(bounds[2] / self.cell_size), math.floor(bounds[3] / self.cell_size)
+        return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+    # Return the tiles whose footprint intersects the area (a BoundingBox, PolygonArea or PointRadius)
+    def query(self, area):
+        candidates = set()
+        for cell in self._cells_for(area.bounds):
+            candidates.update(self._cells.get(cell, ()))  # Tiles sharing a cell with the area
+        return [self.tiles[position] for position in sorted(candidates)
+                if bounds_intersect(self._bounds[position], area.bounds) and area.intersects(self.tiles[position].footprint)]
@@ -0,0 +1,213 @@
+import errno  # Import the errno module to recognise a full disk
+import json  # Import the json module for the resume sidecar files
+import os  # Import the os module for file and directory operations
+import re  # Import the re module for parsing Content-Range headers
+import time  # Import the time module for timing reads
+
+import requests  # Import the requests module for its exception types
+from urllib3.exceptions import DecodeError, ProtocolError, ReadTimeoutError, SSLError  # Errors raised while reading a response body
+
+# Suffixes of the partial download and of the sidecar holding its resume state
+PART_SUFFIX = '.part'
+STATE_SUFFIX = '.part.json'
+
+# Number of bytes written between two checkpoints of the sidecar file
+CHECKPOINT_BYTES = 8 * 1024 * 1024
+
+# Bounds and starting point of the adaptive read size, and how long one read should take
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 8 * 1024 * 1024
+INITIAL_CHUNK_SIZE = 256 * 1024
+TARGET_READ_SECONDS = 0.05
+
+# Pattern of a Content-Range header such as "bytes 1000-1999/2000"
+CONTENT_RANGE = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+|\*)')
+
+
+# Raised when a download ends before the number of bytes the server announced
+class IncompleteDownloadError(IOError):
+    pass
+
+
+# Response body reader whose read size follows the transfer rate: it doubles while reads finish well
+# under TARGET_READ_SECONDS and halves when they take much longer. Fast links are read in a few large
+# chunks (few Python-level iterations per megabyte), while slow ones keep small chunks so checkpoints,
+# progress and Ctrl+C stay responsive. Iterating yields bytes and counts them in bytes_read, and the
+# time spent waiting for them in read_seconds.
+# throttle(n), if given, is called with the size of every chunk (e.g. DownloadEngine.throttle).
+class ResponseStream:
+    def __init__(self, response, chunk_size=INITIAL_CHUNK_SIZE, throttle=None):
+        self.response = response  # Response opened with stream=True
+        self.chunk_size = chunk_size  # Size of the next read
+        self.throttle = throttle  # Bandwidth limiter
+        self.bytes_read = 0  # Bytes received so far
+        self.read_seconds = 0.0  # Time spent waiting for the socket so far
+
+    def __iter__(self):
+        read = self.response.raw.read  # Read the urllib3 response directly, without the fixed iter_content size
+        while True:
+            started = time.perf_counter()
+            try:
+                data = read(self.chunk_size, decode_content=True)
+            except ProtocolError as error:  # Translate urllib3 errors the way iter_content does
+                raise requests.exceptions.ChunkedEncodingError(error)
+            except DecodeError as error:
+                raise requests.exceptions.ContentDecodingError(error)
+            except ReadTimeoutError as error:
+                raise requests.exceptions.ConnectionError(error)
+            except SSLError as error:
+                raise requests.exceptions.SSLError(error)
+            if not data:  # End of the body
+                break
+            elapsed = time.perf_counter() - started
+            self.read_seconds += elapsed
+            if len(data) == self.chunk_size and elapsed < TARGET_READ_SECONDS / 2:
+                self.chunk_size = min(self.chunk_size * 2, MAX_CHUNK_SIZE)  # Reads are cheap, take bigger ones
+            elif elapsed > TARGET_READ_SECONDS * 2:
+                self.chunk_size = max(self.chunk_size // 2, MIN_CHUNK_SIZE)  # Reads are slow, take smaller ones
+            self.bytes_read += len(data)
+            if self.throttle is not None:
+                self.throttle(len(data))  # Wait if the run is over its bandwidth limit
+            yield data
+        self.response._content_consumed = True  # Let requests know the body has been read
+
+    # Read and discard the rest of the body (e.g. the central directory after the last ZIP member)
+    def drain(self):
+        for _ in self:
+            pass
+
+
+# Reserve size bytes of disk for an open file from its current position, where the platform supports it.
+# This keeps large files contiguous and fails early when the disk is full; elsewhere it does nothing.
+def preallocate(file, size):
+    if not size or not hasattr(os, 'posix_fallocate'):
+        return
+    try:
+        os.posix_fallocate(file.fileno(), file.tell(), size)
+    except OSError as error:
+        if error.errno == errno.ENOSPC:  # Out of disk space is a real error
+            raise
+        # Other errors mean the file system cannot preallocate, which is harmless
+
+
+# Read the resume state stored next to a partial download, or None if there is none
+def read_state(path):
+    try:
+        with open(path + STATE_SUFFIX, 'r') as file:  # Open the sidecar file in read mode
+            return json.load(file)  # Return the stored state
+    except (OSError, ValueError):  # If the sidecar is missing or unreadable
+        return None  # There is nothing to resume
+
+
+# Write the resume state next to a partial download, replacing the old sidecar atomically
+def write_state(path, state):
+    temporary_path = path + STATE_SUFFIX + '.tmp'  # Write to a temporary file first
+    with open(temporary_path, 'w') as file:  # Open the temporary file in write mode
+        json.dump(state, file)  # Store the state
+    os.replace(temporary_path, path + STATE_SUFFIX)  # Swap it in, so a crash never leaves a half-written sidecar
+
+
+# Remove a partial download and its sidecar
+def discard_partial(path):
+    for suffix in (PART_SUFFIX, STATE_SUFFIX):
+        if os.path.exists(path + suffix):  # If the file exists
+            os.remove(path + suffix)  # Remove it
+
+
+# Return True if a partial download of path is waiting to be resumed
+def has_partial(path):
+    return os.path.exists(path + PART_SUFFIX) and os.path.exists(path + STATE_SUFFIX)
+
+
+# Return the size and validators the server sent for a response, in the same form as the resume state
+def response_state(response):
+    content_length = response.headers.get('content-length')  # Size of the body, if the server sent it
+    return {
+        'etag': response.headers.get('ETag'),  # Validator of the file on the server
+        'last_modified': response.headers.get('Last-Modified'),  # Fallback validator
+        'size': int(content_length) if content_length is not None else None,  # Size of the file in bytes
+    }
+
+
+# Work out how many bytes of a partial download can be kept for the given URL
+def _resume_offset(path, url):
+    state = read_state(path)  # Load the stored state
+    if state is None or state.get('url') != url or not os.path.exists(path + PART_SUFFIX):  # If the partial file does not belong to this URL
+        return 0, None
+    offset = min(state.get('offset', 0), os.path.getsize(path + PART_SUFFIX))  # Only trust bytes that were checkpointed and are on disk
+    return offset, state
+
+
+# Download url to path, keeping the transfer in "<path>.part" with a "<path>.part.json" sidecar.
+# If a previous run left a partial file, the download continues with a Range request guarded by If-Range,
+# so a changed file on the server (different ETag/Last-Modified) or a server ignoring ranges starts
+# a full fetch instead. The rest of the file is preallocated from the announced size and the body is read
+# in adaptive chunks (see ResponseStream). On success the file is moved to path and the sidecar is removed;
+# the returned state also holds the number of bytes received in this call.
+def download_resumable(engine, url, path, chunk_size=INITIAL_CHUNK_SIZE):
+    offset, state = _resume_offset(path, url)  # Find out where the last run stopped
+    headers = {'Accept-Encoding': 'identity'}  # Ask for the raw bytes so byte offsets match the file on the server
+    if offset:
+        headers['Range'] = f'bytes={offset}-'  # Only ask for the missing bytes
+        validator = state.get('etag') or state.get('last_modified')  # Prefer the ETag, fall back to Last-Modified
+        if validator:
+            headers['If-Range'] = validator  # The server sends the whole file if the validator no longer matches
+
+    with engine.host_slot(url), engine.get(url, headers=headers) as response:  # Wait for a free connection slot and send the request
+        if offset and response.status_code == 416:  # If the range is past the end of the file on the server
+            response.close()  # Drop this response
+            discard_partial(path)  # Forget the partial file
+            return download_resumable(engine, url, path, chunk_size)  # And fetch the whole file
+        response.raise_for_status()  # Stop on HTTP errors
+
+        etag = response.headers.get('ETag')  # Validator of the file on the server
+        last_modified = response.headers.get('Last-Modified')  # Fallback validator
+        match = CONTENT_RANGE.match(response.headers.get('Content-Range', ''))  # Range actually sent by the server
+        resumed = bool(offset) and response.status_code == 206 and match is not None and int(match.group(1)) == offset  # Check the server honoured the range
+        if resumed and state.get('etag') and etag and etag != state['etag']:  # If the file changed even though the range was honoured
+            resumed = False
+        if not resumed:  # If the server ignored the range or the file changed
+            if response.status_code == 206:  # A partial body that cannot be appended is useless
+                response.close()  # Drop this response
+                discard_partial(path)  # Forget the partial file
+                return download_resumable(engine, url, path, chunk_size)  # And fetch the whole file
+            offset = 0  # Start again from the first byte
+
+        if match is not None and match.group(3) != '*':
+            total_size = int(match.group(3))  # Full size of the file from the Content-Range header
+        elif 'content-length' in response.headers:
+            total_size = offset + int(response.headers['content-length'])  # Size of the body plus what we already have
+        else:
+            total_size = None  # The server did not say how big the file is
+
+        state = {'url': url, 'etag': etag, 'last_modified': last_modified, 'size': total_size, 'offset': offset}  # Resume state of this transfer
+        write_state(path, state)  # Record it before writing any data
+        with open(path + PART_SUFFIX, 'r+b' if resumed else 'wb') as part_file:  # Append to the partial file, or start a new one
+            part_file.seek(offset)  # Continue right after the checkpointed bytes
+            part_file.truncate()  # Drop anything written after the last checkpoint
+            if total_size is not None:
+                preallocate(part_file, total_size - offset)  # Reserve the space for the rest of the file
+            stream = ResponseStream(response, chunk_size, engine.throttle)  # Adaptive reader over the body
+            unsaved = 0  # Bytes written since the last checkpoint
+            try:
+                for data in stream:  # Iterate over the response content in chunks
+                    part_file.write(data)  # Write each block of data to the partial file
+                    offset += len(data)  # Advance the offset
+                    unsaved += len(data)
+                    if unsaved >= CHECKPOINT_BYTES:  # Checkpoint every few megabytes
+                        part_file.flush()  # Hand the data to the operating system
+                        os.fsync(part_file.fileno())  # Make sure it reached the disk
+                        state['offset'] = offset  # Record the new offset
+                        write_state(path, state)  # Save the checkpoint
+                        unsaved = 0
+            finally:
+                part_file.flush()  # Hand everything received to the operating system
+                state['offset'] = offset  # Record the final offset, even if the connection dropped
+                write_state(path, state)  # So the transfer can be resumed next time
+
+    if total_size is not None and offset != total_size:  # If the body ended early
+        raise IncompleteDownloadError(f"Downloaded {offset} of {total_size} bytes of {url}")
+    os.replace(path + PART_SUFFIX, path)  # Give the complete file its final name
+    os.remove(path + STATE_SUFFIX)  # The sidecar is no longer needed
+    state['received'] = stream.bytes_read  # Bytes transferred by this call
+    return state
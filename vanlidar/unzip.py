@@ -0,0 +1,365 @@
+import bz2  # Import the bz2 module for members compressed with BZIP2
+import hashlib  # Import the hashlib module for the SHA-256 digests of extracted members
+import os  # Import the os module for file and directory operations
+import struct  # Import the struct module for decoding ZIP headers
+import zipfile  # Import the zipfile module for extracting ZIP files that are already on disk
+import zlib  # Import the zlib module for DEFLATE decompression and CRC-32 checks
+from collections import namedtuple  # Import namedtuple for the extracted member records
+
+from .lasheader import file_header  # Import file_header to summarise extracted point cloud files
+from .metrics import stage_timer  # Import stage_timer to time the stages of a saved ZIP file
+from .transfer import IncompleteDownloadError, preallocate  # Import the size check error and preallocate to reserve the space of each member
+
+# Signatures of the ZIP records that can appear in the stream
+LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'  # Local file header, one in front of every member
+DATA_DESCRIPTOR_SIGNATURE = b'PK\x07\x08'  # Optional signature in front of a data descriptor
+CENTRAL_DIRECTORY_SIGNATURES = (b'PK\x01\x02', b'PK\x05\x06', b'PK\x06\x06')  # Records that follow the last member
+
+# Layout of a local file header after its signature
+LOCAL_HEADER = struct.Struct('<HHHHHIIIHH')  # version, flags, method, time, date, crc, compressed size, size, name length, extra length
+
+# Layouts of the central directory records after their signatures
+CENTRAL_HEADER = struct.Struct('<HHHHHHIIIHHHHHII')  # versions, flags, method, time, date, crc, compressed size, size, name/extra/comment lengths, disk, attributes, offset
+END_RECORD = struct.Struct('<HHHHIIH')  # disks, entries on this disk, entries, directory size, directory offset, comment length
+ZIP64_LOCATOR = struct.Struct('<IQI')  # disk of the ZIP64 end record, its offset, number of disks
+ZIP64_END_RECORD = struct.Struct('<QHHIIQQQQ')  # record size, versions, disks, entries on this disk, entries, directory size, directory offset
+
+# Flag bits and compression methods the streaming extractor understands
+FLAG_ENCRYPTED = 0x0001  # Member is encrypted
+FLAG_DATA_DESCRIPTOR = 0x0008  # CRC and sizes follow the member data instead of being in the header
+FLAG_UTF8 = 0x0800  # Member name is UTF-8 encoded
+METHOD_STORED = 0  # No compression
+METHOD_DEFLATED = 8  # DEFLATE compression
+METHOD_BZIP2 = 12  # BZIP2 compression
+
+# Extra field holding the 64-bit sizes of members larger than 4 GB
+ZIP64_EXTRA_ID = 0x0001
+
+# Amount of data read from the stream at a time while copying a member of known size
+COPY_SIZE = 1024 * 1024
+
+# Record describing one member written to disk, with the SHA-256 hex digest of its contents and,
+# for LAS/LAZ files, the LasHeaderInfo read from the file once it is complete
+ExtractedMember = namedtuple('ExtractedMember', ['name', 'path', 'size', 'crc', 'sha256', 'header'], defaults=[None, None])
+
+
+# Raised when a download cannot be extracted as a stream (unsupported layout, bad CRC, truncated data)
+class StreamZipError(Exception):
+    pass
+
+
+# Raised when the stream ends in the middle of a ZIP record or member; the data read so far was fine,
+# so unlike the other StreamZipErrors this one is worth continuing from the last complete member
+class StreamTruncatedError(StreamZipError):
+    pass
+
+
+# Default member writer: writes a member to "<path>.part", preallocated when its size is known, and
+# computes its SHA-256 on the way, so the file never has to be read back. commit() renames it once
+# the member has passed its checks and returns its ExtractedMember record; discard() removes it.
+# Other writers (e.g. laz.LazFile) take the same arguments and have the same three methods.
+class MemberFile:
+    def __init__(self, path, size=None):
+        self.path = path  # Final path of the member
+        self.size = 0  # Bytes written so far
+        self._digest = hashlib.sha256()  # SHA-256 of the member
+        self._file = open(path + '.part', 'wb')  # Write to a temporary name until the member is checked
+        if size:
+            preallocate(self._file, size)  # Reserve the member's space up front
+
+    def write(self, data):
+        self._file.write(data)
+        self._digest.update(data)
+        self.size += len(data)
+
+    # Move the checked member to its final name and return its record
+    def commit(self, name, crc):
+        self._file.close()
+        os.replace(self.path + '.part', self.path)
+        return ExtractedMember(name, self.path, self.size, crc, self._digest.hexdigest(), file_header(self.path))
+
+    # Remove the partial member
+    def discard(self):
+        self._file.close()
+        if os.path.exists(self.path + '.part'):
+            os.remove(self.path + '.part')
+
+
+# Buffered reader over an iterator of byte chunks, such as response.iter_content()
+class _ChunkReader:
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)  # Source of the downloaded chunks
+        self._buffer = memoryview(b'')  # Unread part of the current chunk
+        self.position = 0  # Number of bytes consumed from the stream so far
+
+    # Return up to limit bytes without copying more than one chunk
+    def read_some(self, limit):
+        while not self._buffer:  # Fetch chunks until one has data
+            chunk = next(self._chunks, None)  # Take the next chunk from the download
+            if chunk is None:  # If the stream has ended
+                return b''  # Signal the end of the stream
+            self._buffer = memoryview(chunk)  # Wrap the chunk so slicing it does not copy
+        data = self._buffer[:limit]  # Take what is wanted from the current chunk
+        self._buffer = self._buffer[limit:]  # Keep the rest for the next read
+        self.position += len(data)  # Advance the stream position
+        return data
+
+    # Return exactly size bytes, failing if the stream ends first
+    def read_exact(self, size):
+        parts = []  # Pieces collected from consecutive chunks
+        remaining = size  # Bytes still to read
+        while remaining:
+            data = self.read_some(remaining)  # Read as much as the current chunk holds
+            if not len(data):  # If the stream ended early
+                raise StreamTruncatedError(f"Download ended {remaining} bytes before the end of a ZIP record")
+            parts.append(data)  # Keep the piece
+            remaining -= len(data)  # Count it
+        return b''.join(parts)
+
+    # Put bytes back in front of the stream (used for data read past the end of a member)
+    def unread(self, data):
+        if data:
+            self._buffer = memoryview(bytes(data) + bytes(self._buffer))  # Prepend the bytes to the unread data
+            self.position -= len(data)  # Move the stream position back
+
+
+# Work out where a member is written, dropping drive letters, absolute paths and ".." like ZipFile.extract does
+def member_path(directory, name):
+    name = name.replace('\\', '/')  # Treat backslashes in member names as separators
+    parts = [part for part in name.split('/') if part not in ('', '.', '..')]  # Drop empty, current and parent components
+    if parts:
+        parts[0] = os.path.splitdrive(parts[0])[1] or parts[0]  # Drop a Windows drive letter from the first component
+    return os.path.join(directory, *parts)
+
+
+# Read the 64-bit sizes from a ZIP64 extra field, if present
+def _zip64_sizes(extra, size, compressed_size):
+    offset = 0  # Position in the extra field
+    while offset + 4 <= len(extra):
+        header_id, length = struct.unpack_from('<HH', extra, offset)  # Read the extra block header
+        if header_id == ZIP64_EXTRA_ID:  # If this is the ZIP64 block
+            values = extra[offset + 4:offset + 4 + length]  # Take the block body
+            fields = [struct.unpack_from('<Q', values, i)[0] for i in range(0, len(values) - 7, 8)]  # Decode the 64-bit fields
+            if size == 0xFFFFFFFF and fields:  # The uncompressed size comes first when it overflowed
+                size = fields.pop(0)
+            if compressed_size == 0xFFFFFFFF and fields:  # Followed by the compressed size
+                compressed_size = fields.pop(0)
+            return size, compressed_size, True
+        offset += 4 + length  # Move to the next extra block
+    return size, compressed_size, False
+
+
+# Return [(name, size)] of every member listed in the central directory of a ZIP file, given tail, its last
+# len(tail) bytes, and total_size, the size of the whole file. Returns None if tail does not hold the
+# whole directory (or is not the end of a ZIP file). Used to size a tile from a small Range request.
+def central_directory_sizes(tail, total_size):
+    position = tail.rfind(CENTRAL_DIRECTORY_SIGNATURES[1])  # End of central directory record
+    if position < 0 or position + 4 + END_RECORD.size > len(tail):
+        return None
+    _, _, _, entries, _, directory_offset, _ = END_RECORD.unpack_from(tail, position + 4)
+    start = total_size - len(tail)  # Offset of tail in the file
+    if entries == 0xFFFF or directory_offset == 0xFFFFFFFF:  # The real values are in the ZIP64 end record
+        locator = position - 4 - ZIP64_LOCATOR.size
+        if locator < 0 or tail[locator:locator + 4] != b'PK\x06\x07':
+            return None
+        _, end_offset, _ = ZIP64_LOCATOR.unpack_from(tail, locator + 4)
+        end_position = end_offset - start
+        if end_position < 0 or tail[end_position:end_position + 4] != CENTRAL_DIRECTORY_SIGNATURES[2]:
+            return None
+        *_, entries, _, directory_offset = ZIP64_END_RECORD.unpack_from(tail, end_position + 4)
+    position = directory_offset - start  # First central directory header
+    if position < 0:
+        return None
+    members = []
+    for _ in range(entries):
+        if tail[position:position + 4] != CENTRAL_DIRECTORY_SIGNATURES[0] or position + 4 + CENTRAL_HEADER.size > len(tail):
+            return None
+        fields = CENTRAL_HEADER.unpack_from(tail, position + 4)
+        flags, compressed_size, size, name_length, extra_length, comment_length = fields[2], fields[7], fields[8], fields[9], fields[10], fields[11]
+        name_start = position + 4 + CENTRAL_HEADER.size
+        name = tail[name_start:name_start + name_length].decode('utf-8' if flags & FLAG_UTF8 else 'cp437')
+        size, _, _ = _zip64_sizes(tail[name_start + name_length:name_start + name_length + extra_length], size, compressed_size)
+        members.append((name, size))
+        position = name_start + name_length + extra_length + comment_length
+    return members
+
+
+# Copy one member's data from the stream into output, a member writer (or drop it when output is None)
+def _copy_member(reader, method, compressed_size, known_size, output):
+    crc = 0  # Running CRC-32 of the uncompressed data
+    size = 0  # Number of uncompressed bytes produced
+
+    def emit(data):
+        nonlocal crc, size
+        crc = zlib.crc32(data, crc)  # Update the CRC with the uncompressed data
+        size += len(data)  # Count the uncompressed bytes
+        if output is not None:  # If the member is being kept
+            output.write(data)  # Hand it to the member writer
+
+    if method == METHOD_STORED:  # Stored members are copied as they are
+        if not known_size:  # Without a size there is no way to find the end of a stored member
+            raise StreamZipError("Stored member without sizes in its local header cannot be streamed")
+        remaining = compressed_size  # Bytes left in the member
+        while remaining:
+            data = reader.read_some(min(remaining, COPY_SIZE))  # Read the next piece of the member
+            if not len(data):
+                raise StreamTruncatedError("Download ended in the middle of a ZIP member")
+            emit(data)  # Pass it on
+            remaining -= len(data)
+        return crc, size
+
+    if method == METHOD_DEFLATED:  # DEFLATE members use a raw zlib stream
+        decompressor = zlib.decompressobj(-15)
+    elif method == METHOD_BZIP2:  # BZIP2 members use the bz2 decompressor
+        decompressor = bz2.BZ2Decompressor()
+    else:
+        raise StreamZipError(f"Compression method {method} cannot be streamed")
+
+    remaining = compressed_size if known_size else None  # Compressed bytes left, if the header gave a size
+    while not decompressor.eof:  # Decompress until the compressed stream says it is finished
+        limit = COPY_SIZE if remaining is None else min(remaining, COPY_SIZE)  # Never read past a known member end
+        data = reader.read_some(limit) if limit else b''  # Read the next compressed piece
+        if not len(data):
+            raise StreamTruncatedError("Download ended in the middle of a ZIP member")
+        if remaining is not None:
+            remaining -= len(data)  # Count the compressed bytes consumed
+        emit(decompressor.decompress(data))  # Decompress and pass on the piece
+        if decompressor.eof:  # The decompressor keeps any input read past the end of the member
+            reader.unread(decompressor.unused_data)  # Hand the overrun back to the stream
+            if remaining is not None:
+                remaining += len(decompressor.unused_data)
+    if method == METHOD_DEFLATED:
+        emit(decompressor.flush())  # Write anything zlib still holds
+    if remaining:  # Skip padding left in a member of known size
+        reader.read_exact(remaining)
+    return crc, size
+
+
+# How far a streamed extraction has got: offset is the position in the ZIP file of the next record to read
+# (the local header of the first member not yet extracted), and members the ExtractedMember records written
+# so far. stream_extract updates it after every member, so when the download drops the caller can ask for
+# the rest of the file from offset and carry on with the same StreamProgress.
+class StreamProgress:
+    def __init__(self):
+        self.offset = 0  # Bytes of the ZIP file fully dealt with
+        self.members = []  # Members written so far
+
+
+# Extract the members of a ZIP archive while it is still downloading.
+# chunks is an iterator of bytes (e.g. response.iter_content()), and route(name) returns the directory
+# a member belongs in, or None to skip it. Each member is handed to writer(path, size) (MemberFile by
+# default, which writes "<path>.part") and only committed once its CRC has been checked, so an
+# interrupted download never leaves a half-written .las behind.
+# progress, if given, is a StreamProgress: chunks must then start at progress.offset of the ZIP file,
+# and the members written are added to progress.members.
+# Returns the list of ExtractedMember records for the members that were written.
+def stream_extract(chunks, route, writer=MemberFile, progress=None):
+    progress = StreamProgress() if progress is None else progress
+    reader = _ChunkReader(chunks)  # Buffered reader over the download
+    start = progress.offset  # Position of the first chunk in the ZIP file
+    extracted = progress.members  # Members written so far
+    while True:
+        signature = reader.read_exact(4)  # Read the signature of the next record
+        if signature in CENTRAL_DIRECTORY_SIGNATURES:  # The central directory follows the last member
+            break
+        if signature != LOCAL_HEADER_SIGNATURE:  # Anything else is not a ZIP member
+            raise StreamZipError(f"Unexpected record signature {signature!r} at byte {reader.position - 4}")
+
+        _, flags, method, _, _, crc, compressed_size, size, name_length, extra_length = LOCAL_HEADER.unpack(reader.read_exact(LOCAL_HEADER.size))  # Decode the local header
+        raw_name = reader.read_exact(name_length)  # Read the member name
+        name = raw_name.decode('utf-8' if flags & FLAG_UTF8 else 'cp437')  # Decode it the way zipfile does
+        extra = reader.read_exact(extra_length)  # Read the extra field
+        size, compressed_size, zip64 = _zip64_sizes(extra, size, compressed_size)  # Pick up 64-bit sizes if present
+        if flags & FLAG_ENCRYPTED:
+            raise StreamZipError(f"Encrypted member {name} cannot be streamed")
+        known_size = not flags & FLAG_DATA_DESCRIPTOR  # Sizes in the header are only valid without a data descriptor
+
+        directory = None if name.endswith('/') else route(name)  # Work out where the member goes
+        path = member_path(directory, name) if directory is not None else None  # Final path of the member
+        if path is not None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)  # Create the member's folder if needed
+            output = writer(path, size if known_size else None)  # Start writing the member
+        else:
+            output = None  # Skipped members are read and discarded
+        try:
+            actual_crc, actual_size = _copy_member(reader, method, compressed_size, known_size, output)  # Copy the member data
+
+            if not known_size:  # Read the CRC and sizes from the data descriptor
+                descriptor = reader.read_exact(4)  # Either the optional signature or the CRC
+                if descriptor == DATA_DESCRIPTOR_SIGNATURE:
+                    descriptor = reader.read_exact(4)  # The CRC follows the signature
+                crc = struct.unpack('<I', descriptor)[0]  # Decode the CRC
+                reader.read_exact(16 if zip64 else 8)  # Skip the sizes, which were measured while copying
+
+            if actual_crc != crc or (known_size and actual_size != size):  # If the data does not match its checksum or size
+                raise StreamZipError(f"CRC or size mismatch in member {name}")
+            if output is not None:
+                extracted.append(output.commit(name, actual_crc))  # Give the checked member its final name and record it
+        except BaseException:
+            if output is not None:
+                output.discard()  # Do not keep a corrupt or partial member
+            raise
+        progress.offset = start + reader.position  # The next member starts here
+    return extracted
+
+
+# Extract the members of a ZIP file that is already on disk, using the same routing rules as stream_extract.
+# The archive is tested in the same pass, the way ZipFile.testzip does: every member, including the skipped
+# ones, is read to the end so zipfile checks its CRC, and kept members must match the size in the central
+# directory. Like stream_extract, each member is handed to writer(path, size) and only committed once it
+# has passed these checks.
+def extract_archive(zip_file_path, route, writer=MemberFile):
+    extracted = []  # Members written so far
+    with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:  # Open the ZIP file for reading
+        for info in zip_ref.infolist():  # Iterate over the files in the ZIP archive
+            if info.is_dir():
+                continue
+            directory = route(info.filename)  # Work out where the member goes
+            if directory is None:  # Skipped members are still read, so a damaged archive is noticed
+                with zip_ref.open(info) as source:
+                    while source.read(COPY_SIZE):
+                        pass
+                continue
+            path = member_path(directory, info.filename)  # Final path of the member
+            os.makedirs(os.path.dirname(path), exist_ok=True)  # Create the member's folder if needed
+            target = writer(path, info.file_size)  # Start writing the member
+            try:
+                with zip_ref.open(info) as source:
+                    size = 0  # Bytes of the member read so far
+                    while True:
+                        data = source.read(COPY_SIZE)  # Read the next block (zipfile checks the CRC at the end)
+                        if not data:
+                            break
+                        target.write(data)
+                        size += len(data)
+                if size != info.file_size:  # The central directory disagrees with the data
+                    raise zipfile.BadZipFile(f"Member {info.filename} has {size} bytes instead of {info.file_size}")
+                extracted.append(target.commit(info.filename, info.CRC))  # Give the checked member its final name and record it
+            except BaseException:
+                target.discard()  # Do not keep a corrupt or partial member
+                raise
+    return extracted
+
+
+# Check the size of a saved ZIP file, extract it and remove it. The ZIP file is only removed once it has
+# passed every check, so a damaged download stays on disk for inspection until the tile is fetched again.
+# Runs in the extraction worker processes, so it only takes picklable arguments (route and writer must be
+# module-level functions or classes, or methods of a picklable object).
+# timings, if given, is a dict that gets the seconds spent in the verify, extract and cleanup stages.
+def extract_and_remove(zip_file_path, route, expected_size=None, writer=MemberFile, timings=None):
+    timings = {} if timings is None else timings
+    with stage_timer(timings, 'verify'):
+        if expected_size is not None and os.path.getsize(zip_file_path) != expected_size:  # Compare with the length the server declared
+            raise IncompleteDownloadError(f"{zip_file_path} has {os.path.getsize(zip_file_path)} bytes instead of {expected_size}")
+    with stage_timer(timings, 'extract'):
+        members = extract_archive(zip_file_path, route, writer)  # Extract and test the files of the ZIP archive
+    with stage_timer(timings, 'cleanup'):
+        os.remove(zip_file_path)  # Remove the ZIP file after extraction
+    return members
+
+
+# Run extract_and_remove and return (members, stage timings), so the timings of a ZIP file extracted
+# in a worker process come back to the main process with its result
+def extract_timed(zip_file_path, route, expected_size=None, writer=MemberFile):
+    timings = {}
+    return extract_and_remove(zip_file_path, route, expected_size, writer, timings), timings